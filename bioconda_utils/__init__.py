@@ -20,6 +20,7 @@ Bioconda Utilities Package
    cli
    cran_skeleton
    docker_utils
+   fast_render
    githandler
    githubhandler
    gitter
@@ -27,6 +28,9 @@ Bioconda Utilities Package
    hosters
    pkg_test
    recipe
+   recipe_cache
+   repodata_cache
+   repodata_parser
    autobump
    update_pinnings
    upload
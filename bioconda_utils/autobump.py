@@ -70,6 +70,7 @@ from . import __version__
 from . import utils
 from . import update_pinnings
 from . import graph
+from . import recipe_cache
 from .utils import ensure_list, RepoData
 from .recipe import Recipe
 from .recipe import load_parallel_iter as recipes_load_parallel_iter
@@ -141,7 +142,7 @@ class RecipeSource:
     ) -> None:
         n_items = 0
         for recipe_dir in self.recipe_dirs:
-            await send_q.put(Recipe(recipe_dir, self.recipe_base))
+            await send_q.put(Recipe(recipe_dir, self.recipe_base, read_only=True))
             n_items += 1
             while return_q.qsize():
                 try:
@@ -202,19 +203,37 @@ class RecipeGraphSource(RecipeSource):
         return len(self.dag)
 
     def load_graph(self) -> nx.DiGraph:
+        blacklist = Skiplist(self.config, self.recipe_base)
+        # The cached graph is used only if no recipe changed since
+        key = (
+            {
+                recipe_dir: graph.recipe_digest(recipe_dir)
+                for recipe_dir in utils.get_recipes(self.recipe_base, "*")
+            },
+            blacklist.global_list,
+        )
         if self.cache_fn and os.path.exists(self.cache_fn):
-            with open(self.cache_fn, "rb") as stream:
-                dag = pickle.load(stream)
-        else:
-            blacklist = Skiplist(self.config, self.recipe_base)
-            dag = graph.build_from_recipes(
+            try:
+                with open(self.cache_fn, "rb") as stream:
+                    cached_key, dag = pickle.load(stream)
+            except (*recipe_cache.CACHE_ERRORS, ValueError):
+                logger.warning("Ignoring unreadable graph cache %s", self.cache_fn)
+            else:
+                if cached_key == key:
+                    return dag
+                logger.warning("Recipes changed, rebuilding graph cache")
+        dag = graph.build_from_recipes(
+            (
                 recipe
-                for recipe in recipes_load_parallel_iter(self.recipe_base, "*")
+                for recipe in recipes_load_parallel_iter(
+                    self.recipe_base, "*", read_only=True
+                )
                 if not blacklist.is_skiplisted(recipe)
-            )
-            if self.cache_fn:
-                with open(self.cache_fn, "wb") as stream:
-                    pickle.dump(dag, stream)
+            ),
+            compact=True,
+        )
+        if self.cache_fn:
+            graph.dump_atomic((key, dag), self.cache_fn)
         return dag
 
 
@@ -324,7 +343,7 @@ class ExcludeOtherChannel(Filter):
         repo = utils.RepoData()
         if cache:
             repo.set_cache(cache)
-        self.other = set(repo.get_package_data("name", channels=channels))
+        self.other = set(repo.get_package_data("name", channels=channels, latest=True))
 
     def get_info(self) -> str:
         return super().get_info().replace("**channels**", ", ".join(self.channels))
@@ -445,6 +464,9 @@ class CheckPinning(Filter):
     def __init__(self, scanner: Scanner) -> None:
         self.scanner = scanner
         self.build_config = utils.load_conda_build_config()
+        # Load the repodata once here and let the worker processes map it
+        RepoData().load()
+        self.repodata = RepoData().share()
 
     @staticmethod
     def match_version(spec: str, version: str) -> bool:
@@ -465,7 +487,9 @@ class CheckPinning(Filter):
         )
 
     async def apply(self, recipe: Recipe) -> None:
-        reason = await self.scanner.run_sp(self._sp_apply, (self.build_config, recipe))
+        reason = await self.scanner.run_sp(
+            self._sp_apply, (self.build_config, recipe, self.repodata)
+        )
         if reason:
             recipe.data["pinning"] = reason
             new_buildno = recipe.build_number + 1
@@ -475,30 +499,27 @@ class CheckPinning(Filter):
                 new_buildno,
             )
             recipe.reset_buildnumber(new_buildno)
-            recipe.render()
 
     @classmethod
     def _sp_apply(cls, data) -> None:
-        config, recipe = data
-        status, recipe = update_pinnings.check(
-            recipe, build_config=config, keep_metas=True
-        )
+        config, recipe, repodata = data
+        RepoData.attach(repodata)
+        status, recipe = update_pinnings.check(recipe, build_config=config)
         if status.needs_bump():
-            metas = recipe.conda_render(config=config)
-            reason = cls.find_reason(recipe, metas)
+            # taken from the cache filled by check()
+            variants = update_pinnings.render_variants(recipe, config)
+            reason = cls.find_reason(recipe, variants)
         else:
             reason = None
-        recipe.conda_release()
         return reason
 
     @classmethod
-    def find_reason(cls, recipe, metas):
+    def find_reason(cls, recipe, variants):
         # Decypher variants:
         pinnings = {}
-        for variant in metas:
-            variant0 = variant[0]
-            for var in variant0.get_used_vars():
-                pinnings.setdefault(var, set()).add(variant0.config.variant[var])
+        for variant in variants:
+            for var, value in variant.variant.items():
+                pinnings.setdefault(var, set()).add(value)
         variants = {k: v for k, v in pinnings.items() if len(v) > 1}
         if variants:
             logger.error("%s has variants: %s", recipe, variants)
@@ -509,7 +530,7 @@ class CheckPinning(Filter):
         resolved_vers = {}
         for var, vers in pinnings.items():
             avail_vers = RepoData().get_package_data("version", name=var)
-            if avail_vers:
+            if len(avail_vers):
                 resolved_vers[var] = list(
                     {
                         avs
@@ -526,14 +547,13 @@ class CheckPinning(Filter):
         # It's one for noarch, two if osx and linux are built, more if we have
         # variant pins such as for python.
         package_data = RepoData().get_package_data(
-            ["build", "depends", "platform"],
+            ["build", "parsed_depends", "platform"],
             name=recipe.name,
             version=recipe.version,
             build_number=recipe.build_number,
         )
         for _build_id, package_deps, _platform in package_data:
-            for item in package_deps:
-                package, _, constraint = item.partition(" ")
+            for package, constraint in package_deps:
                 if not constraint or package not in pinnings:
                     continue
                 if any(
@@ -667,21 +687,24 @@ class UpdateVersion(Filter, AutoBumpConfigMixin):
         if VersionOrder(latest) == VersionOrder(recipe.version):
             return
 
-        # Update `url:`s without Jinja expressions (plain text)
-        for fname in versions[latest]:
-            recipe.replace(fname, versions[latest][fname]["link"], within=["source"])
+        # Edit the text only, rendering once at the end
+        with recipe.edit():
+            # Update `url:`s without Jinja expressions (plain text)
+            for fname in versions[latest]:
+                recipe.replace(
+                    fname, versions[latest][fname]["link"], within=["source"]
+                )
 
-        # Update the version number itself. This will also usually update
-        # `url:`s expressed with `{{version}}` tags.
-        if not recipe.replace(recipe.version, latest, within=["package"]):
-            # allow changes between dash/dot/underscore
-            if recipe.replace(
-                recipe.version, latest, within=["package"], with_fuzz=True
-            ):
-                logger.warning("Recipe %s: replaced version with fuzz", recipe)
+            # Update the version number itself. This will also usually update
+            # `url:`s expressed with `{{version}}` tags.
+            if not recipe.replace(recipe.version, latest, within=["package"]):
+                # allow changes between dash/dot/underscore
+                if recipe.replace(
+                    recipe.version, latest, within=["package"], with_fuzz=True
+                ):
+                    logger.warning("Recipe %s: replaced version with fuzz", recipe)
 
-        recipe.reset_buildnumber()
-        recipe.render()
+            recipe.reset_buildnumber()
 
         # Verify that the rendered recipe has the right version number
         if VersionOrder(recipe.version) != VersionOrder(latest):
@@ -887,9 +910,9 @@ class UpdateChecksums(Filter):
             logger.info("Updating checksum for %s %s", recipe, recipe.version)
             if isinstance(sources, Mapping):
                 sources = [sources]
-            for source_idx, source in enumerate(sources):
-                await self.update_source(recipe, source, source_idx)
-            recipe.render()
+            with recipe.edit():
+                for source_idx, source in enumerate(sources):
+                    await self.update_source(recipe, source, source_idx)
 
     async def update_source(
         self, recipe: Recipe, source: Mapping[Any, Any], source_idx: int
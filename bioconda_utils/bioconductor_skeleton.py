@@ -1464,7 +1464,7 @@ def write_recipe(
                 name="bioconductor-" + proj.package.lower(),
                 version=updated_version,
             )
-            if not existing_bldnos:
+            if not len(existing_bldnos):
                 proj.build_number = 0
             else:
                 proj.build_number = sorted([int(i) for i in existing_bldnos])[-1] + 1
@@ -364,7 +364,7 @@ def do_not_consider_for_additional_platform(
     Returns:
       Return True if current native platform are not included in recipe's additional platforms (no need to build).
     """
-    recipe_obj = _recipe.Recipe.from_file(recipe_folder, recipe)
+    recipe_obj = _recipe.Recipe.from_file(recipe_folder, recipe, read_only=True)
     # On linux-aarch64 or osx-arm64 env, only build recipe with matching extra_additional_platforms
     if platform == "linux-aarch64":
         if "linux-aarch64" not in recipe_obj.extra_additional_platforms:
@@ -446,6 +446,12 @@ def build_recipes(
             check_channels = [c for c in config["channels"] if c != "defaults"]
         else:
             check_channels = []
+    # download the repodata needed to skip existing packages while the
+    # recipe DAG is built
+    utils.RepoData().prefetch(
+        channels=check_channels,
+        platforms=["noarch", utils.RepoData.native_platform()],
+    )
 
     # setup linting
     if do_lint:
@@ -531,6 +537,8 @@ def build_recipes(
             #      applied during a real solve.
             #   2. linux-64 hosts — sysroot run_exports inject __glibc here
             #      regardless of the recipe's text form.
+            # The run_exports themselves are read from the channels'
+            # run_exports.json, so these renders do not download packages.
             finalize = docker_builder is None or not fast_resolve
             if not finalize and utils.RepoData.native_platform() == "linux":
                 finalize = True
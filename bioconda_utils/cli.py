@@ -43,6 +43,7 @@ from . import update_pinnings
 from . import graph
 from . import pkg_test
 from .githandler import BiocondaRepo, install_gpg_key
+from .recipe_cache import recipe_cache
 
 warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 
@@ -129,6 +130,8 @@ def recipe_folder_and_config(allow_missing_for=None):
     """Adds optional positional arguments recipe_folder and config
 
     Requires that func has synopsis ``def x(recipe_folder, config,...)``.
+    As these commands load recipes, the hits and misses of the
+    `recipe_cache` are counted and logged at the end.
     """
 
     def check_arg(args, idx, name, default, allow_missing):
@@ -169,7 +172,11 @@ def recipe_folder_and_config(allow_missing_for=None):
                 args, recipe_folder_idx, "recipe_folder", "recipes/", allow
             )
             args = check_arg(args, config_idx, "config", "config.yml", allow)
-            func(*args, **kwargs)
+            recipe_cache.start_stats()
+            try:
+                func(*args, **kwargs)
+            finally:
+                recipe_cache.log_stats()
 
         return wrapper
 
@@ -366,6 +373,34 @@ def duplicates(
                 print(*spec, ",".join(dup_channels), sep="\t")
 
 
+@arg("config", help="Path to yaml file specifying the configuration")
+@arg("path", help="File to write the snapshot to")
+@arg(
+    "--channels",
+    nargs="+",
+    help="Channels to include. Default is all channels in the config file.",
+)
+@arg("--platforms", nargs="+", help="Platforms to include. Default is all.")
+@arg(
+    "--cache",
+    help="""Use repodata cached locally in the provided filename. If the file
+     does not exist, it will be created.""",
+)
+@enable_logging()
+def export_repodata_snapshot(config, path, channels=None, platforms=None, cache=None):
+    """
+    Write the current repodata to a snapshot file
+
+    Builds given the snapshot with --repodata-snapshot use it instead of
+    downloading repodata. Prints the fingerprint of the snapshot.
+    """
+    utils.load_config(config)
+    repodata = utils.RepoData()
+    if cache is not None:
+        repodata.set_cache(cache)
+    print(repodata.save_snapshot(path, channels=channels, platforms=platforms))
+
+
 @recipe_folder_and_config(allow_missing_for=["list_checks"])
 @arg(
     "--packages",
@@ -425,6 +460,9 @@ def do_lint(
 
     if cache is not None:
         utils.RepoData().set_cache(cache)
+    if git_range:
+        # Linting a few recipes only needs a few lookups
+        utils.RepoData().set_engine("compact")
 
     recipes = get_recipes(
         config, recipe_folder, packages, git_range, include_blacklisted=True
@@ -601,6 +639,12 @@ from environment, even after successful build and test.""",
     "even when building with Docker. Useful for debugging build string mismatches.",
 )
 @arg("--exclude", nargs="+", help="Packages to exclude during this run")
+@arg(
+    "--repodata-snapshot",
+    help="""Use the repodata recorded in this snapshot file (see
+     export-repodata-snapshot) instead of downloading it. All workers of a
+     sharded build can so use the same repodata.""",
+)
 @arg(
     "--subdag-depth",
     type=int,
@@ -637,8 +681,11 @@ def build(
     no_fast_resolve=False,
     exclude=None,
     subdag_depth=None,
+    repodata_snapshot=None,
 ):
     cfg = utils.load_config(config)
+    if repodata_snapshot is not None:
+        utils.RepoData().load_snapshot(repodata_snapshot)
     setup = cfg.get("setup", None)
     if setup:
         logger.debug("Running setup: %s", setup)
@@ -813,7 +860,9 @@ def dag(recipe_folder, config, packages="*", format="gml", hide_singletons=False
     """
     Export the DAG of packages to a graph format file for visualization
     """
-    dag, name2recipes = graph.build(utils.get_recipes(recipe_folder, packages), config)
+    dag, name2recipes = graph.build(
+        utils.get_recipes(recipe_folder, packages), config, cache_file=graph.DAG_CACHE
+    )
     if hide_singletons:
         for node in nx.nodes(dag):
             if dag.degree(node) == 0:
@@ -901,7 +950,8 @@ def update_pinning(
 
     if cache:
         utils.RepoData().set_cache(cache)
-    utils.RepoData().df  # trigger load
+    # download the platforms update_pinnings looks at while building the DAG
+    utils.RepoData().prefetch(platforms=["linux", "noarch"])
 
     build_config = utils.load_conda_build_config()
     skiplist = Skiplist(config, recipe_folder)
@@ -910,7 +960,7 @@ def update_pinning(
 
     dag = graph.build_from_recipes(
         r
-        for r in recipe.load_parallel_iter(recipe_folder, "*")
+        for r in recipe.load_parallel_iter(recipe_folder, "*", read_only=True)
         if not skiplist.is_skiplisted(r)
     )
 
@@ -935,6 +985,9 @@ def update_pinning(
         skip_variant_keys=skip_variants,
     )
 
+    # wait for the data before forking the workers
+    utils.RepoData().load(platforms=["linux", "noarch"])
+
     num_recipes_needing_bump = 0
     for status, recip in utils.parallel_iter(needs_bump, dag, "Processing..."):
         logger.debug("Recipe %s status: %s", recip, status)
@@ -1022,7 +1075,12 @@ def dependent(
             "One of `--dependencies` or `--reverse-dependencies` is required."
         )
 
-    d, _ = graph.build(utils.get_recipes(recipe_folder, "*"), config, restrict=restrict)
+    d, _ = graph.build(
+        utils.get_recipes(recipe_folder, "*"),
+        config,
+        restrict=restrict,
+        cache_file=graph.DAG_CACHE,
+    )
 
     if reverse_dependencies is not None:
         func, packages = nx.algorithms.descendants, reverse_dependencies
@@ -1388,6 +1446,8 @@ def autobump(
     if exclude_channels != ["none"]:
         if not isinstance(exclude_channels, list):
             exclude_channels = [exclude_channels]
+        # Listing the packages of whole channels needs no DataFrame
+        utils.RepoData().set_engine("compact")
         scanner.add(
             autobump.ExcludeOtherChannel,
             exclude_channels,
@@ -1583,6 +1643,7 @@ def main():
             dependent,
             do_lint,
             duplicates,
+            export_repodata_snapshot,
             update_pinning,
             bioconductor_skeleton,
             clean_cran_skeleton,
@@ -0,0 +1,214 @@
+"""
+Render simple recipes without conda-build
+
+To find out whether a recipe needs building, `utils.check_recipe_skippable`
+only needs the name, version, build number and subdir of each package
+the recipe would build. Getting those from ``conda_build.api.render``
+means parsing the recipe once for every variant in the global
+``conda_build_config.yaml``, only to throw away all but one result for
+most recipes.
+
+`render` renders the Jinja2 template, evaluates the selectors on the
+result (in this order, like conda-build) and parses the YAML itself.
+It expands the variants only as far as needed to notice that the
+recipe does not use any of the keys that vary. Whenever the recipe
+is not that simple, it returns None and the caller hands the recipe
+to conda-build. That is the case if
+
+- the template calls any function (``compiler``, ``pin_subpackage``,
+  ``load_file_regex``, ...) or uses ``environ`` or ``os``,
+- a key varying across the variants (e.g. ``python``) is mentioned in
+  the recipe or its build scripts,
+- a selector looks at the Python or NumPy version,
+- a Jinja2 statement (``{% set %}``, ``{% if %}``, ...) carries a
+  selector,
+- the recipe has ``outputs`` or ``run_exports``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import NamedTuple
+
+import jinja2
+import yaml
+from conda_build.metadata import ns_cfg, select_lines
+from conda_build.variants import get_package_variants
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class PackageSummary(NamedTuple):
+    """What `utils.check_recipe_skippable` needs to know of a package"""
+
+    name: str
+    version: str
+    build_number: int
+    subdir: str
+    noarch: str | None = None
+
+    @classmethod
+    def from_meta(cls, meta) -> PackageSummary:
+        """Summarize a ``MetaData`` rendered by conda-build"""
+        noarch = meta.get_value("build/noarch")
+        return cls(
+            meta.name(),
+            meta.version(),
+            int(meta.build_number() or 0),
+            # logic extracted from conda_build.variants.bldpkg_path
+            "noarch" if meta.noarch or meta.noarch_python else meta.config.host_subdir,
+            str(noarch) if noarch else None,
+        )
+
+
+#: Template environment. Undefined variables render empty, but calling or
+#: accessing attributes of them (e.g. ``compiler('c')`` or
+#: ``environ.get('X')``) raises, handing the recipe to conda-build.
+_jinja = jinja2.Environment(undefined=jinja2.Undefined)
+
+_SELECTOR = re.compile(r"#\s*\[([^\]]*)\]")
+_STATEMENT_SELECTOR = re.compile(r"\{%.*#\s*\[[^\]]*\]\s*$", re.MULTILINE)
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_TRUE = re.compile(r"^(y|Y|yes|Yes|YES|true|True|TRUE|on|On|ON|[1-9][0-9]*)$")
+
+#: Variant keys not naming anything a recipe could depend on
+_SPECIAL_KEYS = {
+    "zip_keys",
+    "pin_run_as_build",
+    "extend_keys",
+    "ignore_version",
+    "ignore_build_only_deps",
+    "target_platform",
+}
+
+#: Variants of the global config files, by config files and subdir
+_variants_cache: dict[tuple, list[dict]] = {}
+
+
+def _get_variants(recipe_dir: str, config) -> list[dict]:
+    if os.path.exists(os.path.join(recipe_dir, "conda_build_config.yaml")):
+        return get_package_variants(recipe_dir, config=config)
+    key = (
+        tuple(config.exclusive_config_files or ()),
+        tuple(getattr(config, "variant_config_files", None) or ()),
+        config.host_subdir,
+    )
+    if key not in _variants_cache:
+        _variants_cache[key] = get_package_variants(recipe_dir, config=config)
+    return _variants_cache[key]
+
+
+def _varying_keys(variants: list[dict]) -> set[str]:
+    """Keys with more than one value across **variants**"""
+    values: dict[str, set] = {}
+    for variant in variants:
+        for key, value in variant.items():
+            if key not in _SPECIAL_KEYS and isinstance(value, str):
+                values.setdefault(key, set()).add(value)
+    return {key for key, vals in values.items() if len(vals) > 1}
+
+
+def _mentions(key: str) -> re.Pattern:
+    """Pattern matching the ways a recipe can refer to variant **key**"""
+    names = {key, key.replace("_", "-")}
+    if key == "python":
+        names.add(r"py\d*")
+    elif key == "numpy":
+        names.add(r"np\d*")
+    alternatives = "|".join(sorted(names))
+    return re.compile(rf"(?<![\w-])(?:{alternatives})(?![\w-])")
+
+
+def _read_build_scripts(recipe_dir: str) -> str:
+    texts = []
+    for fname in ("build.sh", "bld.bat"):
+        try:
+            with open(os.path.join(recipe_dir, fname), encoding="utf-8") as fdes:
+                texts.append(fdes.read())
+        except OSError:
+            pass
+    return "\n".join(texts)
+
+
+def render(recipe_dir: str, config) -> list[PackageSummary] | None:
+    """Summarize the packages built by a simple recipe
+
+    Args:
+      recipe_dir: Folder containing the ``meta.yaml``
+      config: conda-build ``Config`` (see `utils.load_conda_build_config`)
+
+    Returns:
+      The packages as conda-build would render them with
+      ``finalize=False`` (empty if the recipe is skipped and
+      ``config.trim_skip`` is set) or None if conda-build is needed.
+    """
+    try:
+        return _render(recipe_dir, config)
+    except Exception:  # pylint: disable=broad-except
+        # conda-build will tell what is wrong with the recipe
+        logger.debug("Handing %s to conda-build", recipe_dir, exc_info=True)
+        return None
+
+
+def _render(recipe_dir: str, config) -> list[PackageSummary] | None:
+    with open(os.path.join(recipe_dir, "meta.yaml"), encoding="utf-8") as fdes:
+        text = fdes.read()
+
+    variants = _get_variants(recipe_dir, config)
+    if not variants:
+        return None
+    variant = variants[0]
+
+    selectors = " ".join(_SELECTOR.findall(text))
+    for name in _IDENTIFIER.findall(selectors):
+        if name.startswith(("py", "np")):
+            return None
+    if _STATEMENT_SELECTOR.search(text):
+        return None
+
+    namespace = ns_cfg(config)
+    namespace.update(
+        (key, value) for key, value in variant.items() if isinstance(value, str)
+    )
+    rendered = select_lines(
+        _jinja.from_string(text).render(namespace), namespace, False
+    )
+    meta = yaml.load(rendered, Loader=getattr(yaml, "CBaseLoader", yaml.BaseLoader))
+    if not isinstance(meta, dict) or "outputs" in meta:
+        return None
+    package = meta.get("package") or {}
+    build = meta.get("build") or {}
+    if not isinstance(package, dict) or not isinstance(build, dict):
+        return None
+    if "run_exports" in build or "noarch_python" in build:
+        return None
+    name, version = package.get("name"), package.get("version")
+    if not name or not version:
+        return None
+    noarch = build.get("noarch") or None
+    if noarch not in (None, "python", "generic"):
+        return None
+
+    varying = _varying_keys(variants)
+    if noarch == "python":
+        varying.discard("python")
+    if varying:
+        scripts = _read_build_scripts(recipe_dir)
+        for key in varying:
+            pattern = _mentions(key)
+            if pattern.search(text) or pattern.search(scripts):
+                return None
+
+    if _TRUE.match(str(build.get("skip", ""))) and getattr(config, "trim_skip", True):
+        return []
+    return [
+        PackageSummary(
+            name,
+            version,
+            int(build.get("number") or 0),
+            "noarch" if noarch else config.host_subdir,
+            noarch,
+        )
+    ]
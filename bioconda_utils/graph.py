@@ -2,31 +2,281 @@
 Construction and Manipulation of Package/Recipe Graphs
 """
 
+import hashlib
+import json
 import logging
+import os
+import pickle
+import tempfile
 
 from collections import defaultdict
 from fnmatch import fnmatch
+from functools import partial
 from itertools import chain
 from typing import (
     Any,
+    NamedTuple,
 )
-from collections.abc import Iterable, Iterator, Sequence
+from collections.abc import Iterable, Mapping, Sequence
 
 import networkx as nx
+import platformdirs
 
 from bioconda_utils.recipe import Recipe
 from bioconda_utils.skiplist import Skiplist
 
-from . import utils
+from . import __version__, recipe_cache, utils
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+#: File caching the recipe summaries and the last DAG of `build`
+DAG_CACHE = os.path.join(platformdirs.user_cache_dir("bioconda-utils"), "dag.pkl")
+
+#: Load recipes in parallel only if more than this many changed
+PARALLEL_MIN = 64
+
+
+def recipe_digest(recipe: str) -> str | None:
+    """Hash of the ``meta.yaml`` in **recipe** (None if unreadable)"""
+    try:
+        with open(os.path.join(recipe, "meta.yaml"), "rb") as fdes:
+            return hashlib.blake2b(fdes.read(), digest_size=16).hexdigest()
+    except OSError:
+        return None
+
+
+def dump_atomic(obj: Any, path: str) -> None:
+    """Pickle **obj** to **path**, replacing it only once written"""
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fdes, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fdes, "wb") as out:
+            pickle.dump(obj, out, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class RecipeSummary(NamedTuple):
+    """What `build` needs to know of a recipe"""
+
+    #: Hash of the ``meta.yaml`` (see `recipe_digest`)
+    digest: str | None
+    #: Package name
+    name: str
+    #: Names of the build, host and run requirements
+    deps: tuple[str, ...]
+
+    @classmethod
+    def from_meta(cls, digest: str | None, meta: dict[str, Any]) -> "RecipeSummary":
+        reqs = meta.get("requirements") or {}
+        deps: dict[str, None] = {}
+        for sec in ("build", "host", "run"):
+            for dep in reqs.get(sec) or ():
+                if dep:
+                    deps[dep.split()[0]] = None
+        return cls(digest, meta["package"]["name"], tuple(deps))
+
+
+class DagCache:
+    """Recipe summaries and the DAG last built from them
+
+    `build` parses only the recipes whose ``meta.yaml`` changed since
+    they were summarized, and patches the DAG it built last time instead
+    of building it from scratch.
+
+    Args:
+      path: Pickle file holding the cache (nothing is cached if None)
+      config: Configuration the DAG is built with
+      env: Variables to expand in the recipes (see `utils.load_meta_fast`)
+    """
+
+    def __init__(
+        self,
+        path: str | None,
+        config: Any = None,
+        env: dict[str, Any] | None = None,
+    ) -> None:
+        self.path = path
+        self.env = env or {}
+        #: Hash of the inputs other than the ``meta.yaml`` files. A cache
+        #: file written with other inputs is not used.
+        self.key = hashlib.blake2b(
+            json.dumps([config, self.env], sort_keys=True, default=str).encode(),
+            digest_size=16,
+        ).hexdigest()
+        #: Summaries by absolute recipe path
+        self.summaries: dict[str, RecipeSummary] = {}
+        # (restrict, skipped, summaries by recipe, dag, name2recipe) of
+        # the last DAG built
+        self.last: tuple | None = None
+
+    def load(self) -> None:
+        """Read the cache file (an unusable file is ignored)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as fdes:
+                version, key, self.summaries, self.last = pickle.load(fdes)
+        except (*recipe_cache.CACHE_ERRORS, ValueError):
+            logger.debug("Ignoring unreadable DAG cache %s", self.path, exc_info=True)
+            version = key = None
+        if (version, key) != (__version__, self.key):
+            self.summaries, self.last = {}, None
+
+    def save(self) -> None:
+        """Write the cache file, dropping summaries of deleted recipes"""
+        if not self.path:
+            return
+        self.summaries = {
+            path: summary
+            for path, summary in self.summaries.items()
+            if os.path.exists(path)
+        }
+        try:
+            dump_atomic((__version__, self.key, self.summaries, self.last), self.path)
+        except OSError:
+            logger.debug("Could not write DAG cache %s", self.path, exc_info=True)
+
+    def summarize(self, recipes: Sequence[str]) -> dict[str, RecipeSummary]:
+        """Get the summaries of **recipes**, loading those that changed"""
+        digests = {recipe: recipe_digest(recipe) for recipe in recipes}
+        stale = [
+            recipe
+            for recipe in recipes
+            if digests[recipe] is None
+            or getattr(self.summaries.get(os.path.abspath(recipe)), "digest", None)
+            != digests[recipe]
+        ]
+        if stale:
+            logger.info("Loading %i of %i recipes", len(stale), len(recipes))
+            if len(stale) > PARALLEL_MIN:
+                metadata = utils.parallel_iter(
+                    utils.load_meta_fast, stale, "Loading Recipes", env=self.env
+                )
+            else:
+                metadata = map(partial(utils.load_meta_fast, env=self.env), stale)
+            for meta, recipe in metadata:
+                self.summaries[os.path.abspath(recipe)] = RecipeSummary.from_meta(
+                    digests[recipe], meta
+                )
+        return {recipe: self.summaries[os.path.abspath(recipe)] for recipe in recipes}
+
+    def get_dag(
+        self,
+        summaries: dict[str, RecipeSummary],
+        skipped: frozenset[str],
+        restrict: bool,
+    ) -> tuple[nx.DiGraph, defaultdict[str, set[str]]]:
+        """Get the DAG of **summaries**, patching the last one if possible"""
+        if self.last is not None and self.last[:2] == (restrict, skipped):
+            _, _, old, dag, name2recipe = self.last
+            patch_dag(dag, name2recipe, old, summaries, skipped, restrict)
+        else:
+            dag, name2recipe = build_dag(summaries, skipped, restrict)
+        self.last = (restrict, skipped, summaries, dag, name2recipe)
+        return dag, name2recipe
+
+
+def build_dag(
+    summaries: Mapping[str, RecipeSummary], skipped: frozenset[str], restrict: bool
+) -> tuple[nx.DiGraph, defaultdict[str, set[str]]]:
+    """Build the DAG of packages from recipe summaries (see `build`)"""
+    name2recipe: defaultdict[str, set[str]] = defaultdict(set)
+    for recipe, summary in summaries.items():
+        if recipe not in skipped:
+            name2recipe[summary.name].add(recipe)
+
+    dag = nx.DiGraph()
+    dag.add_nodes_from(summary.name for summary in summaries.values())
+    for summary in summaries.values():
+        dag.add_edges_from(
+            (dep, summary.name)
+            for dep in summary.deps
+            if dep in name2recipe or not restrict
+        )
+    return dag, name2recipe
+
+
+def patch_dag(
+    dag: nx.DiGraph,
+    name2recipe: defaultdict[str, set[str]],
+    old: Mapping[str, RecipeSummary],
+    new: Mapping[str, RecipeSummary],
+    skipped: frozenset[str],
+    restrict: bool,
+) -> None:
+    """Turn the DAG built by `build_dag` from **old** into that of **new**
+
+    Only the edges of packages whose recipes changed, were added or
+    removed are rebuilt.
+    """
+    changed = {
+        recipe for recipe in chain(old, new) if old.get(recipe) != new.get(recipe)
+    }
+    if not changed:
+        return
+    targets = set()
+    old_deps = set()
+    known = set(name2recipe)
+    for recipe in changed:
+        if recipe in old:
+            targets.add(old[recipe].name)
+            old_deps.update(old[recipe].deps)
+            recipes = name2recipe.get(old[recipe].name)
+            if recipes is not None:
+                recipes.discard(recipe)
+                if not recipes:
+                    del name2recipe[old[recipe].name]
+        if recipe in new:
+            targets.add(new[recipe].name)
+            if recipe not in skipped:
+                name2recipe[new[recipe].name].add(recipe)
+    added = set(name2recipe) - known
+    removed = known - set(name2recipe)
+
+    by_name: defaultdict[str, list[RecipeSummary]] = defaultdict(list)
+    for summary in new.values():
+        by_name[summary.name].append(summary)
+
+    # Edges point from a dependency to the package requiring it
+    for name in targets:
+        if name in dag:
+            dag.remove_edges_from(list(dag.in_edges(name)))
+        if name in by_name:
+            dag.add_node(name)
+            dag.add_edges_from(
+                (dep, name)
+                for summary in by_name[name]
+                for dep in summary.deps
+                if dep in name2recipe or not restrict
+            )
+    if restrict:
+        # Only packages built by the recipes take part
+        for name in removed:
+            if name in dag:
+                dag.remove_edges_from(list(dag.out_edges(name)))
+        if added:
+            dag.add_edges_from(
+                (dep, summary.name)
+                for summary in new.values()
+                for dep in summary.deps
+                if dep in added
+            )
+    for name in chain(targets, old_deps, removed):
+        if name in dag and name not in by_name and dag.degree(name) == 0:
+            dag.remove_node(name)
+
 
 def build(
     recipes: Iterable[str],
     config: dict[str, Any],
     blacklist: Skiplist | None = None,
     restrict: bool = True,
+    cache_file: str | None = None,
 ) -> tuple[nx.DiGraph, defaultdict[str, set[str]]]:
     """
     Returns the DAG of recipe paths and a dictionary that maps package names to
@@ -46,6 +296,11 @@ def build(
         themselves in `recipes`. Otherwise, include all dependencies of
         `recipes`.
 
+    cache_file : str
+        File keeping the summaries of the recipes and the DAG between
+        runs (see `DagCache`), e.g. `DAG_CACHE`. Only recipes changed
+        since are loaded. If None (the default), all recipes are loaded.
+
     Returns
     -------
     dag : nx.DiGraph
@@ -58,70 +313,51 @@ def build(
     """
     logger.info("Generating DAG")
     recipes = list(recipes)
-    metadata = list(
-        utils.parallel_iter(utils.load_meta_fast, recipes, "Loading Recipes")
-    )
+    cache = DagCache(cache_file, config)
+    cache.load()
+    summaries = cache.summarize(recipes)
 
     # name2recipe is meta.yaml's package:name mapped to the recipe path.
     #
     # A name should map to exactly one recipe. It is possible for multiple
     # names to map to the same recipe, if the package name somehow depends on
     # the environment.
-    name2recipe = defaultdict(set)
-    for meta, recipe in metadata:
-        name = meta["package"]["name"]
-        if blacklist is None or not blacklist.is_skiplisted(recipe):
-            name2recipe[name].update([recipe])
-
-    def get_deps(meta: dict[str, Any], sec: str) -> list[str]:
-        reqs = meta.get("requirements")
-        if not reqs:
-            return []
-        deps = reqs.get(sec)
-        if not deps:
-            return []
-        return [dep.split()[0] for dep in deps if dep]
-
-    def get_inner_deps(dependencies: Iterable[str]) -> Iterator[str]:
-        dependencies = list(dependencies)
-        for dep in dependencies:
-            if dep in name2recipe or not restrict:
-                yield dep
-
-    dag = nx.DiGraph()
-    dag.add_nodes_from(meta["package"]["name"] for meta, recipe in metadata)
-    for meta, recipe in metadata:
-        name = meta["package"]["name"]
-        dag.add_edges_from(
-            (dep, name)
-            for dep in set(
-                chain(
-                    get_inner_deps(get_deps(meta, "build")),
-                    get_inner_deps(get_deps(meta, "host")),
-                    get_inner_deps(get_deps(meta, "run")),
-                )
-            )
-        )
-
+    skipped = frozenset(
+        recipe
+        for recipe in recipes
+        if blacklist is not None and blacklist.is_skiplisted(recipe)
+    )
+    dag, name2recipe = cache.get_dag(summaries, skipped, restrict)
+    cache.save()
     return dag, name2recipe
 
 
-def build_from_recipes(recipes: Iterable[Recipe]) -> nx.DiGraph:
+def build_from_recipes(recipes: Iterable[Recipe], compact: bool = False) -> nx.DiGraph:
+    """Build the DAG of **recipes**
+
+    Args:
+      recipes: Recipes to add as nodes
+      compact: Compact each recipe (see `Recipe.compact`) once its
+               packages and dependencies are known, to keep the memory
+               needed for the whole tree low
+    """
     logger.info("Building Recipe DAG")
 
     package2recipes = {}
-    recipe_list = []
+    recipe_deps = {}
     for recipe in recipes:
         for package in recipe.package_names:
             package2recipes.setdefault(package, set()).add(recipe)
-        recipe_list.append(recipe)
+        recipe_deps[recipe] = recipe.get_deps()
+        if compact:
+            recipe.compact()
 
     dag = nx.DiGraph()
-    dag.add_nodes_from(recipe for recipe in recipe_list)
+    dag.add_nodes_from(recipe_deps)
     dag.add_edges_from(
         (recipe2, recipe)
-        for recipe in recipe_list
-        for dep in recipe.get_deps()
+        for recipe, deps in recipe_deps.items()
+        for dep in deps
         for recipe2 in package2recipes.get(dep, [])
     )
 
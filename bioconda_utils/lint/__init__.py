@@ -616,7 +616,9 @@ class Linter:
           List of collected messages
         """
         try:
-            recipe = _recipe.Recipe.from_file(self.recipe_folder, recipe_name)
+            recipe = _recipe.Recipe.from_file(
+                self.recipe_folder, recipe_name, read_only=True
+            )
         except _recipe.RecipeError as exc:
             recipe = _recipe.Recipe(recipe_name, self.recipe_folder)
             check_cls = recipe_error_to_lint_check.get(exc.__class__, linter_failure)
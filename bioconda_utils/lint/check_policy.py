@@ -133,10 +133,10 @@ class cran_packages_to_conda_forge(LintCheck):
         # must have R in run a run dep
         if "R" in deps and any("run" in dep for dep in deps["R"]):
             # and all deps satisfied in conda-forge
-            if all(
-                utils.RepoData().get_package_data(name=dep, channels="conda-forge")
-                for dep in deps
-            ):
+            found = utils.RepoData().get_package_data_many(
+                [(dep,) for dep in deps], on=("name",), channels="conda-forge"
+            )
+            if set(found["name"]).issuperset(deps):
                 self.message()
 
 
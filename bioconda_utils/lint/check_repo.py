@@ -27,7 +27,9 @@ class in_other_channels(LintCheck):
     """
 
     def check_recipe(self, recipe: _recipe.Recipe) -> None:
-        channels = utils.RepoData().get_package_data(key="channel", name=recipe.name)
+        channels = utils.RepoData().get_package_data(
+            key="channel", name=recipe.name, latest=True
+        )
         if set(channels) - {"bioconda"}:
             self.message(section="package/name")
 
@@ -51,7 +53,7 @@ class build_number_needs_bump(LintCheck):
         bldnos = utils.RepoData().get_package_data(
             key="build_number", name=recipe.name, version=recipe.version
         )
-        if bldnos and recipe.build_number <= max(bldnos):
+        if len(bldnos) and recipe.build_number <= max(bldnos):
             self.message("build/number", data=max(bldnos))
 
     def fix(self, _message: Any, data: int) -> bool:
@@ -77,7 +79,7 @@ class build_number_needs_reset(LintCheck):
         bldnos = utils.RepoData().get_package_data(
             key="build_number", name=recipe.name, version=recipe.version
         )
-        if not bldnos and recipe.build_number > 0:
+        if not len(bldnos) and recipe.build_number > 0:
             self.message("build/number", data=0)
 
     def fix(self, _message: Any, data: int) -> bool:
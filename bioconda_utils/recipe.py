@@ -11,16 +11,17 @@ edit the meta.yaml.
 from __future__ import annotations
 
 
+import hashlib
 import logging
 import os
 import re
 import sys
 import tempfile
+import threading
 import types
 
-from collections import defaultdict
-from contextlib import redirect_stdout, redirect_stderr
-from copy import deepcopy
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
 from pathlib import Path
 from typing import (
     Any,
@@ -28,20 +29,22 @@ from typing import (
     overload,
     Literal,
 )
-from collections.abc import Sequence
+from collections.abc import Iterator, Sequence
 from re import Pattern
 
 
 import conda_build.api
 
 import jinja2
+import yaml as pyyaml
 
 from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedMap
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
 from ruamel.yaml.constructor import DuplicateKeyError
 
 from . import utils
 from .aiopipe import EndProcessingItem
+from .recipe_cache import recipe_cache
 
 
 yaml = YAML(typ="rt")  # pylint: disable=invalid-name
@@ -52,6 +55,36 @@ for digit in "0123456789":
     if digit in yaml.resolver.versioned_resolver:
         del yaml.resolver.versioned_resolver[digit]
 
+
+class FastLoader(getattr(pyyaml, "CSafeLoader", pyyaml.SafeLoader)):  # type: ignore
+    """Read-only YAML loader (see ``read_only`` in `Recipe`)
+
+    Resolves scalars like `yaml` does (YAML 1.2 booleans, no numbers
+    starting with a digit), but builds plain `dict` and `list` without
+    positions and comments. Duplicate keys raise, leaving them for the
+    round-trip loader to handle.
+    """
+
+    def construct_mapping(self, node, deep=False):
+        mapping = super().construct_mapping(node, deep=deep)
+        if len(mapping) != len(node.value):
+            raise pyyaml.constructor.ConstructorError(
+                None, None, "found duplicate key", node.start_mark
+            )
+        return mapping
+
+
+FastLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if not tag.endswith(":bool")]
+    for first, resolvers in FastLoader.yaml_implicit_resolvers.items()
+    if not first.isdigit()
+}
+FastLoader.add_implicit_resolver(
+    "tag:yaml.org,2002:bool",
+    re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"),
+    list("tTfF"),
+)
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
@@ -132,6 +165,65 @@ class RenderFailure(RecipeError):
     template = "failed to render in Jinja2. Error was: %s"
 
 
+class TemplateCache:
+    """Cache of compiled Jinja2 templates, keyed by a hash of their text
+
+    Compiling the template is a large part of `Recipe.render`, and the
+    same recipe text is rendered many times (e.g. by autobump after each
+    edit that turns out not to change anything). The cache is shared by
+    all `Recipe` instances of the process (see `template_cache`) and
+    keeps the **maxsize** most recently used templates.
+
+    Args:
+      env: Jinja2 environment compiling the templates
+      maxsize: Number of templates to keep
+    """
+
+    def __init__(self, env: jinja2.Environment, maxsize: int = 1024) -> None:
+        self.env = env
+        self.maxsize = maxsize
+        #: Number of lookups answered from the cache
+        self.hits = 0
+        #: Number of lookups that had to compile the template
+        self.misses = 0
+        self._templates: OrderedDict[bytes, jinja2.Template] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> jinja2.Template:
+        """Get the compiled template for **text**
+
+        Raises:
+          jinja2.exceptions.TemplateError: if **text** does not compile
+        """
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+        template = self.env.from_string(text)
+        with self._lock:
+            self.misses += 1
+            self._templates[key] = template
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        """Drop all templates and reset the statistics"""
+        with self._lock:
+            self._templates.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+#: Compiled recipe templates of this process (used by `Recipe.get_template`)
+template_cache = TemplateCache(utils.jinja_silent_undef)
+
+
 class Recipe:
     """Represents a recipe (meta.yaml) in editable form
 
@@ -149,8 +241,34 @@ class Recipe:
     Arguments:
       recipe_folder: base recipes folder
       recipe_dir: path to specific recipe
+      read_only: Parse with the faster `FastLoader`. The recipe is
+                 parsed again with the round-trip loader the first time
+                 it is modified or positions are looked up (see
+                 `get_raw_range`).
     """
 
+    __slots__ = (
+        "_batch_dirty",
+        "_batch_lines",
+        "_batched",
+        "_build_scripts",
+        "_conda_build_config",
+        "_conda_meta",
+        "_conda_tempdir",
+        "_digest",
+        "_meta",
+        "_meta_yaml",
+        "_orig",
+        "_orig_snapshot",
+        "_positions",
+        "_read_only",
+        "basedir",
+        "data",
+        "on_branch",
+        "reldir",
+        "version_data",
+    )
+
     #: Variables to pass to Jinja when rendering recipe
     JINJA_VARS = {
         "cran_mirror": "https://cloud.r-project.org",
@@ -162,7 +280,7 @@ class Recipe:
         "cdt": lambda x: x,
     }
 
-    def __init__(self, recipe_dir, recipe_folder):
+    def __init__(self, recipe_dir, recipe_folder, read_only=False):
         if not recipe_dir.startswith(recipe_folder):
             raise RuntimeError(f"'{recipe_dir}' not inside '{recipe_folder}'")
 
@@ -172,19 +290,22 @@ class Recipe:
         self.reldir = recipe_dir[len(recipe_folder) :].strip("/")
 
         # Filled in by render()
-        #: Parsed recipe YAML
-        self.meta: CommentedMap = CommentedMap()
+        self._meta: CommentedMap | None = CommentedMap()
+        # Raw text ranges of the nodes in meta (see get_raw_range)
+        self._positions: tuple[CommentedMap, dict[str, tuple]] | None = None
 
-        self.conda_build_config: str = ""
-        self.build_scripts: dict[str, str] = {}
+        self._conda_build_config: str | None = ""
+        self._build_scripts: dict[str, str] | None = {}
 
         # These will be filled in by load_from_string()
-        #: Lines of the raw recipe file
-        self.meta_yaml: list[str] = []
+        self._meta_yaml: list[str] | None = []
+        # Hash of meta_yaml dropped by compact()
+        self._digest: bytes = b""
         # Filled in by update filter
         self.version_data: dict[str, Any] = {}
-        #: Original recipe before modifications (updated by load_from_string)
-        self.orig: Recipe = deepcopy(self)
+        # Original recipe before modifications (see set_original and orig)
+        self._orig_snapshot: tuple[Any, ...] = ((), "", {}, {}, False)
+        self._orig: Recipe | None = None
         #: Whether the recipe was loaded from a branch (update in progress)
         self.on_branch: bool = False
         #: For passing data around
@@ -194,6 +315,58 @@ class Recipe:
         self._conda_meta: Any = None
         self._conda_tempdir = None
 
+        # Edits not rendered yet (see edit())
+        self._batched: bool = False
+        self._batch_dirty: bool = False
+        self._batch_lines: int = 0
+
+        # Parse with FastLoader until modified (see _upgrade)
+        self._read_only: bool = read_only
+
+    @property
+    def meta(self) -> CommentedMap:
+        """Parsed recipe YAML"""
+        if self._meta is None:
+            self._load_cached(self.dump())
+        return cast(CommentedMap, self._meta)
+
+    @meta.setter
+    def meta(self, meta: CommentedMap) -> None:
+        self._meta = meta
+
+    @property
+    def meta_yaml(self) -> list[str]:
+        """Lines of the raw recipe file"""
+        if self._meta_yaml is None:
+            self._meta_yaml = self._read_lines()
+        return self._meta_yaml
+
+    @meta_yaml.setter
+    def meta_yaml(self, lines: list[str]) -> None:
+        self._meta_yaml = lines
+
+    @property
+    def conda_build_config(self) -> str:
+        """Contents of the recipe's ``conda_build_config.yaml``"""
+        if self._conda_build_config is None:
+            self.read_conda_build_config()
+        return cast(str, self._conda_build_config)
+
+    @conda_build_config.setter
+    def conda_build_config(self, text: str) -> None:
+        self._conda_build_config = text
+
+    @property
+    def build_scripts(self) -> dict[str, str]:
+        """Contents of the recipe's build scripts by file name"""
+        if self._build_scripts is None:
+            self.read_build_scripts()
+        return cast(dict[str, str], self._build_scripts)
+
+    @build_scripts.setter
+    def build_scripts(self, scripts: dict[str, str]) -> None:
+        self._build_scripts = scripts
+
     @property
     def path(self):
         """Full path to ``meta.yaml``"""
@@ -212,6 +385,16 @@ class Recipe:
     def __str__(self) -> str:
         return self.reldir
 
+    def __getstate__(self) -> dict[str, Any]:
+        # The position index is rebuilt when needed
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["_positions"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self) -> str:
         return f'{self.__class__.__name__} "{self.reldir}"'
 
@@ -223,6 +406,17 @@ class Recipe:
         self.render()
         return self
 
+    def _load_cached(self, data) -> None:
+        """Like `load_from_string`, but using the `recipe_cache`"""
+        kind = "recipe_fast" if self._read_only else "recipe"
+        meta = recipe_cache.get(kind, self.path, data, self.JINJA_VARS)
+        if meta is None:
+            self.load_from_string(data)
+            recipe_cache.set(kind, self.path, data, self.JINJA_VARS, self.meta)
+        else:
+            self.meta_yaml = data.splitlines()
+            self.meta = meta
+
     def read_conda_build_config(self):
         # Cache contents of conda_build_config.yaml for conda_render.
         path = Path(self.dir, "conda_build_config.yaml")
@@ -237,7 +431,7 @@ class Recipe:
         scripts = ["build.sh"] + [
             output.get("script") for output in self.meta.get("outputs") or ()
         ]
-        self.build_scripts.clear()
+        build_scripts = {}
         for script in scripts:
             if not script or os.path.sep in script:
                 # Only support flat folder structure.
@@ -247,36 +441,49 @@ class Recipe:
                 content = path.read_text()
             except Exception:
                 continue
-            self.build_scripts[script] = content
+            build_scripts[script] = content
+        self.build_scripts = build_scripts
 
     @classmethod
     @overload
     def from_file(
-        cls, recipe_dir, recipe_fname, return_exceptions: Literal[False] = False
+        cls,
+        recipe_dir,
+        recipe_fname,
+        return_exceptions: Literal[False] = False,
+        read_only: bool = False,
     ) -> Recipe: ...
 
     @classmethod
     @overload
     def from_file(
-        cls, recipe_dir, recipe_fname, return_exceptions: Literal[True]
+        cls,
+        recipe_dir,
+        recipe_fname,
+        return_exceptions: Literal[True],
+        read_only: bool = False,
     ) -> Recipe | Exception: ...
 
     @classmethod
     def from_file(
-        cls, recipe_dir, recipe_fname, return_exceptions=False
+        cls, recipe_dir, recipe_fname, return_exceptions=False, read_only=False
     ) -> Recipe | Exception:
         """Create new `Recipe` object from file
 
+        The parsed recipe is taken from the `recipe_cache` if the
+        ``meta.yaml`` was loaded before.
+
         Args:
            recipe_dir: Path to recipes folder
            recipe_fname: Relative path to recipe (folder or meta.yaml)
+           read_only: Parse with the `FastLoader` (see `Recipe`)
         """
         if recipe_fname.endswith("meta.yaml"):
             recipe_fname = os.path.dirname(recipe_fname)
-        recipe = cls(recipe_fname, recipe_dir)
+        recipe = cls(recipe_fname, recipe_dir, read_only)
         try:
             with open(os.path.join(recipe_fname, "meta.yaml")) as text:
-                recipe.load_from_string(text.read())
+                recipe._load_cached(text.read())
         except FileNotFoundError:
             exc = MissingMetaYaml(recipe_fname)
             if return_exceptions:
@@ -306,11 +513,99 @@ class Recipe:
             fdes.write(self.dump())
 
     def set_original(self) -> None:
-        """Store the current state of the recipe as "original" version"""
-        self.orig = deepcopy(self)
+        """Store the current state of the recipe as "original" version
+
+        Only the text and the data not derived from it are kept. The
+        `orig` recipe is rendered from them when it is first accessed.
+        """
+        self._orig_snapshot = (
+            tuple(self.meta_yaml),
+            self.conda_build_config,
+            dict(self.build_scripts),
+            dict(self.version_data),
+            self.on_branch,
+        )
+        self._orig = None
+
+    @property
+    def orig(self) -> Recipe:
+        """Original recipe before modifications (see `set_original`)"""
+        if self._orig is None:
+            lines, config, scripts, version_data, on_branch = self._original()
+            orig = self.__class__(self.dir, self.basedir, self._read_only)
+            orig.meta_yaml = list(lines)
+            if orig.meta_yaml:
+                orig.render()
+            orig.conda_build_config = config
+            orig.build_scripts = dict(scripts)
+            orig.version_data = dict(version_data)
+            orig.on_branch = on_branch
+            orig._orig_snapshot = self._orig_snapshot
+            self._orig = orig
+        return self._orig
 
     def is_modified(self) -> bool:
-        return self.meta_yaml != self.orig.meta_yaml
+        return tuple(self.meta_yaml) != self._original()[0]
+
+    def _original(self) -> tuple[Any, ...]:
+        """The snapshot taken by `set_original`, reloaded if dropped by `compact`"""
+        if self._orig_snapshot[0] is None:
+            self._orig_snapshot = (
+                tuple(self._read_lines()),
+                self.conda_build_config,
+                dict(self.build_scripts),
+                *self._orig_snapshot[3:],
+            )
+        return self._orig_snapshot
+
+    @staticmethod
+    def _hash_lines(lines: Sequence[str]) -> bytes:
+        return hashlib.blake2b("\n".join(lines).encode(), digest_size=16).digest()
+
+    def _read_lines(self) -> list[str]:
+        """Read the lines of the ``meta.yaml`` dropped by `compact`"""
+        with open(self.path, encoding="utf-8") as fdes:
+            lines = fdes.read().splitlines()
+        if self._hash_lines(lines) != self._digest:
+            logger.warning("Recipe %s changed on disk since it was compacted", self)
+        return lines
+
+    def compact(self) -> bool:
+        """Drop the parsed recipe and the texts read from disk
+
+        Whole-tree operations (e.g. `graph.build_from_recipes`) keep all
+        recipes in memory. Once they have taken what they need, the
+        recipes can be compacted to free most of the memory. The dropped
+        fields are read from disk (and parsed using the `recipe_cache`)
+        again when next accessed.
+
+        Only recipes matching their ``meta.yaml`` on disk that are not
+        modified, edited or rendered with conda-build are compacted.
+
+        Returns:
+          True if the recipe is compacted
+        """
+        if self._meta_yaml is None:
+            return True
+        if (
+            self._orig is not None
+            or self._batched
+            or self._conda_meta is not None
+            or self.is_modified()
+        ):
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as fdes:
+                if fdes.read().splitlines() != self._meta_yaml:
+                    return False
+        except OSError:
+            return False
+        self._digest = self._hash_lines(self._meta_yaml)
+        self._meta = self._meta_yaml = None
+        self._conda_build_config = self._build_scripts = None
+        self._positions = None
+        self._orig_snapshot = (None, None, None, *self._orig_snapshot[3:])
+        return True
 
     def dump(self):
         """Dump recipe content"""
@@ -368,12 +663,15 @@ class Recipe:
         return "\n".join(lines)
 
     def get_template(self):
-        """Create a Jinja2 template from the current raw recipe"""
+        """Create a Jinja2 template from the current raw recipe
+
+        Templates are compiled once per recipe text (see `template_cache`).
+        """
         # This function exists because the template cannot be pickled.
         # Storing it means the recipe cannot be pickled, which in turn
         # means we cannot pass it to ProcessExecutors.
         try:
-            return utils.jinja_silent_undef.from_string("\n".join(self.meta_yaml))
+            return template_cache.get("\n".join(self.meta_yaml))
         except jinja2.exceptions.TemplateSyntaxError as exc:
             raise RenderFailure(self, message=exc.message, line=exc.lineno)
         except jinja2.exceptions.TemplateError as exc:
@@ -405,6 +703,14 @@ class Recipe:
         - normalize
         """
         yaml_text = self.get_template().render(self.JINJA_VARS)
+        if self._read_only:
+            try:
+                meta = pyyaml.load(yaml_text, Loader=FastLoader)
+            except pyyaml.YAMLError:
+                pass  # errors are reported by the round-trip loader
+            else:
+                self._set_rendered(meta)
+                return
         try:
             meta = yaml.load(yaml_text)
         except DuplicateKeyError as err:
@@ -423,10 +729,14 @@ class Recipe:
             else:
                 raise DuplicateKey(self, line=line, column=column)
 
-        if not isinstance(meta, CommentedMap):
+        self._set_rendered(meta)
+
+    def _set_rendered(self, meta: Any) -> None:
+        if not isinstance(meta, dict):
             raise MissingKey(self)
         self.meta = meta
-
+        self._batch_dirty = False
+        self._batch_lines = len(self.meta_yaml)
         if (
             "package" not in self.meta
             or "version" not in self.meta["package"]
@@ -506,7 +816,60 @@ class Recipe:
         if not path:
             return 0, 0, len(self.meta_yaml), len(self.meta_yaml[-1])
 
+        self._upgrade()
+        if self._positions is None or self._positions[0] is not self.meta:
+            self._positions = (self.meta, self._index_positions())
+        positions = self._positions[1]
+        if path in positions:
+            return positions[path]
+
+        # Not in canonical form (e.g. ``source/0/url`` for a single source)
         nodes, keys = self._walk(path)
+        canonical = "/".join(str(key) for key in keys)
+        if canonical not in positions:
+            positions[canonical] = self._find_raw_range(nodes, keys)
+        positions[path] = positions[canonical]
+        return positions[path]
+
+    def _index_positions(self) -> dict[str, tuple]:
+        """Map the paths of all nodes in `meta` to their `get_raw_range`
+
+        The range of a node ends where its next sibling starts or, for
+        the last node of a collection, where the collection ends.
+        """
+        positions: dict[str, tuple] = {}
+        eof = (
+            (len(self.meta_yaml) - 1, len(self.meta_yaml[-1]))
+            if self.meta_yaml
+            else (0, 0)
+        )
+        stack: list[tuple[str, Any, tuple]] = [("", self.meta, eof)]
+        while stack:
+            prefix, node, end = stack.pop()
+            if isinstance(node, CommentedMap):
+                items = list(node.keys())
+                get_start = node.lc.value
+            elif isinstance(node, CommentedSeq):
+                items = list(range(len(node)))
+                get_start = node.lc.key
+            else:
+                continue
+            for num, key in enumerate(items):
+                try:
+                    start = get_start(key)
+                    child_end = (
+                        node.lc.key(items[num + 1]) if num + 1 < len(items) else end
+                    )
+                except (KeyError, IndexError, TypeError):
+                    # No position recorded; left to _find_raw_range
+                    continue
+                path = f"{prefix}{key}"
+                positions[path] = (*start, *child_end)
+                stack.append((path + "/", node[key], child_end))
+        return positions
+
+    def _find_raw_range(self, nodes, keys):
+        """Locate the node reached via **nodes** and **keys** (see `_walk`)"""
         nodes.pop()  # pop parsed value
 
         # get the start row/col for the value
@@ -670,11 +1033,66 @@ class Recipe:
                 return section
         return ""
 
+    @contextmanager
+    def edit(self) -> Iterator[Recipe]:
+        """Batch edits to the recipe, rendering it once at the end
+
+        >>> with recipe.edit():
+        ...     recipe.replace(recipe.version, "1.2")
+        ...     recipe.reset_buildnumber()
+
+        Within the block, `set`, `replace` and `reset_buildnumber` only
+        change the text. As they take line numbers from `meta`, it is
+        rendered early only if an edit added or removed lines. Other
+        values read from `meta` reflect the state before the block.
+
+        If the block raises (e.g. `HasSelector` from `replace`), the
+        recipe is restored to its state before the block. Nested blocks
+        join the outermost one.
+        """
+        if self._batched:
+            yield self
+            return
+        self._upgrade()
+        lines, meta = list(self.meta_yaml), self.meta
+        self._batched, self._batch_dirty = True, False
+        self._batch_lines = len(self.meta_yaml)
+        try:
+            yield self
+            if self._batch_dirty:
+                self.render()
+        except BaseException:
+            self.meta_yaml, self.meta = lines, meta
+            raise
+        finally:
+            self._batched = self._batch_dirty = False
+
+    def _edited(self) -> None:
+        """Render after an edit, unless edits are batched (see `edit`)"""
+        if self._batched:
+            self._batch_dirty = True
+        else:
+            self.render()
+
+    def _upgrade(self) -> None:
+        """Parse again with the round-trip loader if parsed ``read_only``"""
+        if self._read_only:
+            self._read_only = False
+            if not isinstance(self.meta, CommentedMap):
+                self.render()
+
+    def _sync_lines(self) -> None:
+        """Render batched edits if they moved lines (see `edit`)"""
+        self._upgrade()
+        if self._batch_dirty and len(self.meta_yaml) != self._batch_lines:
+            self.render()
+
     def set(self, path, value):
         """Set a value or section in the recipe
 
         See `get` for a description of how **path** works.
         """
+        self._sync_lines()
         # walk path into nodes/keys
         nodes, keys = self._walk(path, noraise=True)
 
@@ -695,7 +1113,7 @@ class Recipe:
         self.meta_yaml[row] = self.meta_yaml[row].replace(str(content), str(value))
         if str(value) not in self.meta_yaml[row]:
             self.meta_yaml[row] = self.meta_yaml[row][:col] + value
-        self.render()
+        self._edited()
 
     @property
     def package_names(self) -> list[str]:
@@ -724,6 +1142,7 @@ class Recipe:
           selectors.
         """
         logger.debug("Trying to replace %s with %s", before, after)
+        self._sync_lines()
 
         # get lines starting with "{%"
         lines = set()
@@ -768,6 +1187,8 @@ class Recipe:
             logger.debug("%i + %s", lineno, new)
             self.meta_yaml[lineno] = new
             replacements += 1
+        if replacements and self._batched:
+            self._batch_dirty = True
         return replacements
 
     def reset_buildnumber(self, n: int = 0):
@@ -775,6 +1196,7 @@ class Recipe:
 
         If the build number is missing, it is added after build.
         """
+        self._sync_lines()
         try:
             lineno: int = self.meta["build"].lc.key("number")[0]
         except (KeyError, AttributeError):  # no build number?
@@ -789,7 +1211,7 @@ class Recipe:
         line = self.meta_yaml[lineno]
         line = re.sub("number: [0-9]+", "number: " + str(n), line)
         self.meta_yaml[lineno] = line
-        self.render()
+        self._edited()
 
     def get_deps(self, sections=None, output=True):
         return list(self.get_deps_dict(sections, output).keys())
@@ -932,7 +1354,7 @@ class Recipe:
             self._conda_tempdir = None
 
 
-def load_parallel_iter(recipe_folder, packages):
+def load_parallel_iter(recipe_folder, packages, read_only=False):
     recipes = list(utils.get_recipes(recipe_folder, packages))
     for recipe in utils.parallel_iter(
         Recipe.from_file,
@@ -940,6 +1362,7 @@ def load_parallel_iter(recipe_folder, packages):
         "Loading Recipes...",
         recipe_folder,
         return_exceptions=True,
+        read_only=read_only,
     ):
         if isinstance(recipe, RecipeError):
             recipe.log()
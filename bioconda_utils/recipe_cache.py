@@ -0,0 +1,168 @@
+"""
+Persistent cache of parsed recipes
+
+Most commands start by loading all recipes, rendering each
+``meta.yaml`` with Jinja2 and parsing the result as YAML, although
+only a handful of them changed since the previous run. The
+`RecipeCache` keeps the parsed result on disk, keyed by the path of the
+recipe, a hash of its text, the version of bioconda-utils and the
+variables passed to Jinja2. A changed text simply misses the cache.
+
+The cache is shared by the processes loading recipes in parallel.
+Hits and misses are counted by the command that started counting
+(`RecipeCache.start_stats`) and the workers it handed the counters to
+(`RecipeCache.attach_stats`), so that `log_stats` can report their
+totals at the end of the command. Other processes using the cache at
+the same time are not counted.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import pickle
+import sqlite3
+from collections.abc import Mapping
+from typing import Any
+
+import diskcache
+import platformdirs
+
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+#: Errors of an unusable cache: unwritable or corrupt files, a database
+#: locked for too long and entries pickled by an incompatible version
+CACHE_ERRORS = (
+    OSError,
+    sqlite3.Error,
+    diskcache.Timeout,
+    pickle.PickleError,
+    AttributeError,
+    EOFError,
+    ImportError,
+)
+
+
+class RecipeCache:
+    """Parsed recipes stored in a `diskcache.Cache`
+
+    Args:
+      directory: Folder holding the cache (created when first used)
+      size_limit: Bytes on disk before least recently stored entries
+                  are dropped
+    """
+
+    def __init__(self, directory: str, size_limit: int = 2**30) -> None:
+        self.directory = directory
+        self.size_limit = size_limit
+        self._cache: diskcache.Cache | None = None
+        #: Shared array of the hits and misses counted (see `start_stats`)
+        self.counters: Any = None
+
+    @property
+    def cache(self) -> diskcache.Cache:
+        """The underlying `diskcache.Cache`"""
+        if self._cache is None:
+            self._cache = diskcache.Cache(self.directory, size_limit=self.size_limit)
+        return self._cache
+
+    @staticmethod
+    def make_key(
+        kind: str, path: str, text: str, variables: Mapping[str, Any] | None
+    ) -> tuple:
+        """Build the key for **text** loaded from **path**
+
+        Args:
+          kind: What was made of the text (e.g. ``recipe`` for `Recipe.meta`)
+          path: Path of the ``meta.yaml``
+          text: Contents of the ``meta.yaml``
+          variables: Variables passed to Jinja2. For functions, only
+                     the name is part of the key.
+        """
+        names = tuple(
+            (name, None if callable(value) else repr(value))
+            for name, value in sorted((variables or {}).items())
+        )
+        digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return (kind, os.path.abspath(path), digest, __version__, names)
+
+    def get(
+        self, kind: str, path: str, text: str, variables: Mapping[str, Any] | None
+    ) -> Any:
+        """Get the cached result for **text** or None"""
+        key = self.make_key(kind, path, text, variables)
+        try:
+            value = self.cache.get(key)
+        except CACHE_ERRORS:
+            logger.debug(
+                "Could not read recipe cache %s", self.directory, exc_info=True
+            )
+            value = None
+        if self.counters is not None:
+            with self.counters.get_lock():
+                self.counters[0 if value is not None else 1] += 1
+        return value
+
+    def set(
+        self,
+        kind: str,
+        path: str,
+        text: str,
+        variables: Mapping[str, Any] | None,
+        value: Any,
+    ) -> None:
+        """Store the result **value** made of **text**"""
+        key = self.make_key(kind, path, text, variables)
+        try:
+            self.cache.set(key, value)
+        except CACHE_ERRORS:
+            logger.debug(
+                "Could not write recipe cache %s", self.directory, exc_info=True
+            )
+
+    def start_stats(self) -> None:
+        """Count hits and misses from now on (see `stats`)
+
+        The `counters` are kept in shared memory. Pass them to worker
+        processes and call `attach_stats` there to include their hits
+        and misses.
+        """
+        self.counters = multiprocessing.Array("q", 2)
+
+    def attach_stats(self, counters: Any) -> None:
+        """Add to the `counters` of the process that called `start_stats`
+
+        Does nothing if **counters** is None.
+        """
+        if counters is not None:
+            self.counters = counters
+
+    def stats(self) -> tuple[int, int]:
+        """Number of hits and misses counted since `start_stats`"""
+        if self.counters is None:
+            return 0, 0
+        with self.counters.get_lock():
+            hits, misses = self.counters
+        return hits, misses
+
+    def log_stats(self) -> None:
+        """Log the hit and miss statistics (if the cache was used)"""
+        hits, misses = self.stats()
+        if hits or misses:
+            logger.info(
+                "Recipe cache: %i hits, %i misses (%.0f%% hit rate)",
+                hits,
+                misses,
+                100 * hits / (hits + misses),
+            )
+
+
+#: Cache used when loading recipes (see `Recipe.from_file` and
+#: `utils.load_meta_fast`)
+recipe_cache = RecipeCache(
+    os.path.join(platformdirs.user_cache_dir("bioconda-utils"), "recipes")
+)
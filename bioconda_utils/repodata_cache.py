@@ -0,0 +1,1308 @@
+"""
+Columnar On-Disk Cache for `RepoData`
+
+The package index held by `utils.RepoData` is stored on disk in a
+simple columnar format that can be memory-mapped:
+
+- Each column is written as one flat, 64-byte aligned array.
+- Categorical columns (``name``, ``version``, ...) are written as
+  integer codes plus a table of their string values.
+- The ``depends`` lists are flattened into one array of codes into a
+  table of specs plus an array of row offsets. The specs are stored
+  split into dependency name and constraint (see `DependsLists`).
+- String tables are written as one blob of UTF-8 bytes plus an array
+  of offsets into it (see `StringTable`).
+- Rows are sorted by package name and the row range of each name is
+  stored as well (see `NameIndex`).
+
+Files can be read and written with pandas (`read_frame`, `write_frame`)
+or without (`read_columns`, `write_columns`), and this module does not
+import pandas until needed. Opening a cache file only parses a small
+JSON header listing the arrays. The arrays (including the string
+tables) are mapped from the file without copying, so the operating
+system only pages in what a query actually touches, and processes
+opening the same file share those pages. Strings are only decoded
+when a query returns or looks them up.
+
+Files are always written to a temporary name and then renamed into
+place. Readers holding a mapping of the previous file are therefore
+never affected by a concurrent refresh.
+
+Refreshing the index keeps a `ShardCache` for each channel/subdir. It
+stores the HTTP validators of the last download so that unchanged
+repodata costs a single conditional request. Where a channel offers a
+``repodata.jlap`` patch feed (`JlapFeed`), only the new patches are
+downloaded and applied to the stored ``repodata.json``
+(`apply_json_patch`). In both cases, the parsed rows of unchanged
+subdirs are reused from the shard cache.
+
+Snapshots record the package files (`SNAPSHOT_COLUMNS`) present at one
+point in time along with a hash of each row (`row_hashes`) and a
+`fingerprint` of the whole set, so that later states can be compared
+against them cheaply (`diff_rows`).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+from collections.abc import Iterable, Iterator, Sequence
+from itertools import pairwise
+from typing import IO, TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+#: Identifies our cache files (and their layout version)
+MAGIC = b"BCUCOL02"
+
+#: Alignment of arrays within the file
+ALIGN = 64
+
+_HEADER_LEN = struct.Struct("<Q")
+
+
+class CacheFormatError(Exception):
+    """Raised if a file is not a (compatible) columnar cache file"""
+
+
+class StringTable(Sequence[str]):
+    """Table of strings held as one UTF-8 blob and offsets into it
+
+    This is how string tables are kept in cache files, so that opening
+    a file does not create a Python object for each string. Strings
+    are decoded as they are accessed.
+
+    Args:
+      offsets: Array of ``len(table) + 1`` byte offsets into **blob**
+      blob: Array of the concatenated UTF-8 encoded strings
+      is_sorted: Whether the strings are in ascending order (which
+                 allows `find` to use a binary search)
+    """
+
+    def __init__(
+        self, offsets: np.ndarray, blob: np.ndarray, is_sorted: bool = False
+    ) -> None:
+        self.offsets = offsets
+        self.blob = blob
+        self.is_sorted = is_sorted
+        self._view = memoryview(blob)
+        self._strings: list[str] | None = None
+        self._codes: dict[str, int] | None = None
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> StringTable:
+        """Create from an iterable of strings"""
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        # UTF-8 preserves the order of code points
+        is_sorted = all(a < b for a, b in pairwise(encoded))
+        return cls(offsets, np.frombuffer(b"".join(encoded), np.uint8), is_sorted)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, code: int) -> bytes:
+        return bytes(self._view[self.offsets[code] : self.offsets[code + 1]])
+
+    def __getitem__(self, code):
+        if isinstance(code, slice):
+            return self.tolist()[code]
+        if self._strings is not None:
+            return self._strings[code]
+        if code < 0:
+            code += len(self)
+        if not 0 <= code < len(self):
+            raise IndexError(code)
+        return str(self._view[self.offsets[code] : self.offsets[code + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tolist())
+
+    def __contains__(self, value: object) -> bool:
+        return isinstance(value, str) and self.find(value) is not None
+
+    def tolist(self) -> list[str]:
+        """Decode all strings (once)"""
+        if self._strings is None:
+            blob = self.blob.tobytes()
+            offsets = self.offsets.tolist()
+            self._strings = [
+                blob[start:stop].decode("utf-8") for start, stop in pairwise(offsets)
+            ]
+        return self._strings
+
+    def take(self, codes: np.ndarray) -> list[str]:
+        """Decode the strings at **codes** only"""
+        if self._strings is not None:
+            return [self._strings[code] for code in codes]
+        view = self._view
+        return [
+            str(view[start:stop], "utf-8")
+            for start, stop in zip(
+                self.offsets[codes].tolist(), self.offsets[codes + 1].tolist()
+            )
+        ]
+
+    def find(self, value: str) -> int | None:
+        """Returns the code of **value** (None if not in the table)"""
+        if self.is_sorted:
+            key = value.encode("utf-8")
+            low, high = 0, len(self)
+            while low < high:
+                mid = (low + high) // 2
+                if self._bytes(mid) < key:
+                    low = mid + 1
+                else:
+                    high = mid
+            if low < len(self) and self._bytes(low) == key:
+                return low
+            return None
+        if self._codes is None:
+            self._codes = {string: code for code, string in enumerate(self)}
+        return self._codes.get(value)
+
+
+class FlatStringLists:
+    """Column of string lists stored as flat arrays
+
+    Rather than keeping one Python list of strings per row, the values
+    are interned into **strings** and referenced by **codes**. The
+    values for row ``i`` are ``codes[offsets[i]:offsets[i+1]]``.
+
+    Args:
+      offsets: Array of ``len(rows) + 1`` offsets into **codes**
+      codes: Array of indices into **strings**
+      strings: The string table
+    """
+
+    def __init__(
+        self, offsets: np.ndarray, codes: np.ndarray, strings: Sequence[str]
+    ) -> None:
+        self.offsets = offsets
+        self.codes = codes
+        self.strings = strings
+
+    @classmethod
+    def from_lists(cls, lists: Iterable[Iterable[str] | None]) -> FlatStringLists:
+        """Create from an iterable of lists of strings"""
+        table: dict[str, int] = {}
+        offsets = [0]
+        codes: list[int] = []
+        for values in lists:
+            for value in values or ():
+                codes.append(table.setdefault(value, len(table)))
+            offsets.append(len(codes))
+        return cls(
+            np.array(offsets, dtype=np.int64),
+            np.array(codes, dtype=np.int32),
+            list(table),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> list[str]:
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        return [self.strings[code] for code in self.codes[start:stop]]
+
+    def take(self, rows: Iterable[int]) -> list[list[str]]:
+        """Get the lists for multiple rows"""
+        return [self[row] for row in rows]
+
+    def reorder(self, order: np.ndarray) -> FlatStringLists:
+        """Returns a copy with rows rearranged as given by **order**"""
+        lengths = np.diff(self.offsets)[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # position of each new value within the old codes array
+        source = np.repeat(self.offsets[:-1][order] - offsets[:-1], lengths)
+        source += np.arange(offsets[-1], dtype=np.int64)
+        return FlatStringLists(offsets, self.codes[source], self.strings)
+
+    @classmethod
+    def concat(cls, parts: Sequence[FlatStringLists]) -> FlatStringLists:
+        """Concatenates multiple list columns (merging their string tables)"""
+        table: dict[str, int] = {}
+        all_codes = []
+        all_offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for part in parts:
+            mapping = np.array(
+                [table.setdefault(string, len(table)) for string in part.strings],
+                dtype=np.int32,
+            )
+            all_codes.append(mapping[part.codes])
+            all_offsets.append(part.offsets[1:] + base)
+            base += part.offsets[-1]
+        return cls(
+            np.concatenate(all_offsets),
+            np.concatenate(all_codes) if all_codes else np.zeros(0, dtype=np.int32),
+            list(table),
+        )
+
+
+def parse_spec(spec: str) -> tuple[str, str]:
+    """Split a dependency spec into package name and constraint
+
+    >>> parse_spec("zlib >=1.2.13,<2.0a0")
+    ('zlib', '>=1.2.13,<2.0a0')
+    """
+    name, _, constraint = spec.partition(" ")
+    return name, constraint
+
+
+class DependsLists(FlatStringLists):
+    """`FlatStringLists` of dependency specs held in parsed form
+
+    Each distinct spec is split (see `parse_spec`) into a package name
+    and a constraint, which are interned into **names** and
+    **constraints**. The spec strings are only assembled on access.
+    Using `entry_names`, lookups by dependency name operate on integer
+    arrays.
+
+    Args:
+      offsets: Array of ``len(rows) + 1`` offsets into **codes**
+      codes: Array of indices into the specs
+      names: Table of dependency names
+      constraints: Table of constraints (``""`` for none)
+      spec_names: Index into **names** for each spec
+      spec_constraints: Index into **constraints** for each spec
+    """
+
+    def __init__(
+        self,
+        offsets: np.ndarray,
+        codes: np.ndarray,
+        names: Sequence[str],
+        constraints: Sequence[str],
+        spec_names: np.ndarray,
+        spec_constraints: np.ndarray,
+    ) -> None:
+        self.offsets = offsets
+        self.codes = codes
+        self.names = names
+        self.constraints = constraints
+        self.spec_names = spec_names
+        self.spec_constraints = spec_constraints
+        self._strings: list[str] | None = None
+        self._entry_names: np.ndarray | None = None
+        self._name_codes: dict[str, int] | None = None
+
+    @classmethod
+    def from_flat(cls, lists: FlatStringLists) -> DependsLists:
+        """Create from `FlatStringLists` holding the spec strings"""
+        if isinstance(lists, cls):
+            return lists
+        names: dict[str, int] = {}
+        constraints: dict[str, int] = {}
+        spec_names = np.empty(len(lists.strings), dtype=np.int32)
+        spec_constraints = np.empty(len(lists.strings), dtype=np.int32)
+        for num, spec in enumerate(lists.strings):
+            name, constraint = parse_spec(spec)
+            spec_names[num] = names.setdefault(name, len(names))
+            spec_constraints[num] = constraints.setdefault(constraint, len(constraints))
+        return cls(
+            lists.offsets,
+            lists.codes,
+            list(names),
+            list(constraints),
+            spec_names,
+            spec_constraints,
+        )
+
+    def _spec(self, code: int) -> str:
+        name = self.names[self.spec_names[code]]
+        constraint = self.constraints[self.spec_constraints[code]]
+        return f"{name} {constraint}" if constraint else name
+
+    @property
+    def strings(self) -> list[str]:
+        """The spec strings (assembled on first access)"""
+        if self._strings is None:
+            self._strings = [self._spec(code) for code in range(len(self.spec_names))]
+        return self._strings
+
+    def __getitem__(self, row: int) -> list[str]:
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        return [self._spec(code) for code in self.codes[start:stop]]
+
+    def parsed(self, row: int) -> list[tuple[str, str]]:
+        """Get the (name, constraint) tuples for **row**"""
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        return [
+            (
+                self.names[self.spec_names[code]],
+                self.constraints[self.spec_constraints[code]],
+            )
+            for code in self.codes[start:stop]
+        ]
+
+    def reorder(self, order: np.ndarray) -> DependsLists:
+        flat = super().reorder(order)
+        return DependsLists(
+            flat.offsets,
+            flat.codes,
+            self.names,
+            self.constraints,
+            self.spec_names,
+            self.spec_constraints,
+        )
+
+    @property
+    def entry_names(self) -> np.ndarray:
+        """Name code of each flattened entry (aligned with `codes`)"""
+        if self._entry_names is None:
+            self._entry_names = self.spec_names[self.codes]
+        return self._entry_names
+
+    def depending_on(self, name: str) -> tuple[np.ndarray, list[str]]:
+        """Find the rows depending on package **name**
+
+        Returns:
+          Array of rows and the list of matching constraints (one per
+          row and matching entry, so rows may repeat)
+        """
+        if isinstance(self.names, StringTable):
+            code = self.names.find(name)
+        else:
+            if self._name_codes is None:
+                self._name_codes = {name: num for num, name in enumerate(self.names)}
+            code = self._name_codes.get(name)
+        if code is None:
+            return np.zeros(0, dtype=np.int64), []
+        (positions,) = np.nonzero(self.entry_names == code)
+        rows = np.searchsorted(self.offsets, positions, side="right") - 1
+        constraints = self.spec_constraints[self.codes[positions]]
+        return rows, [self.constraints[num] for num in constraints]
+
+
+class NameIndex:
+    """Maps package names to the range of rows holding their packages
+
+    Requires the rows of the DataFrame to be sorted by the codes of its
+    categorical ``name`` column (see `sort_by_name`). Lookups are then
+    a dictionary access (or a binary search of a sorted `StringTable`)
+    plus a slice of the DataFrame.
+
+    Args:
+      names: The categories of the ``name`` column
+      offsets: Array of ``len(names) + 1`` row offsets
+    """
+
+    def __init__(self, names: Sequence[str], offsets: np.ndarray) -> None:
+        self.names = names
+        self.offsets = offsets
+        self._codes: dict[str, int] | None = None
+
+    def _code(self, name: str) -> int | None:
+        if isinstance(self.names, StringTable):
+            return self.names.find(name)
+        if self._codes is None:
+            self._codes = {name: code for code, name in enumerate(self.names)}
+        return self._codes.get(name)
+
+    @classmethod
+    def from_sorted_codes(cls, names: Sequence[str], codes: np.ndarray) -> NameIndex:
+        """Create index from sorted ``name`` codes"""
+        offsets = np.searchsorted(codes, np.arange(len(names) + 1), side="left")
+        return cls(names, offsets.astype(np.int64))
+
+    def get(self, name: str) -> slice:
+        """Returns the slice of rows for **name** (may be empty)"""
+        code = self._code(name)
+        if code is None:
+            return slice(0, 0)
+        return slice(int(self.offsets[code]), int(self.offsets[code + 1]))
+
+    def take(self, names: Iterable[str]) -> np.ndarray:
+        """Returns the row positions for all of **names**"""
+        slices = [self.get(name) for name in names]
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(
+            [np.arange(sl.start, sl.stop, dtype=np.int64) for sl in slices]
+        )
+
+
+def sort_by_name(
+    df: pd.DataFrame, lists: dict[str, FlatStringLists] | None = None
+) -> tuple[pd.DataFrame, dict[str, FlatStringLists], NameIndex]:
+    """Sorts **df** by package name and creates `NameIndex` for it
+
+    The ``name`` column is made categorical if necessary. The sorted
+    DataFrame has a fresh `pandas.RangeIndex`. The list columns in
+    **lists** are rearranged accordingly.
+    """
+    import pandas as pd
+
+    lists = lists or {}
+    if not isinstance(df["name"].dtype, pd.CategoricalDtype):
+        df = df.assign(name=df["name"].astype(str).astype("category"))
+    codes = df["name"].array.codes
+    if len(codes) and not np.all(codes[:-1] <= codes[1:]):
+        order = np.argsort(codes, kind="stable")
+        df = df.take(order)
+        codes = codes[order]
+        lists = {key: values.reorder(order) for key, values in lists.items()}
+    df = df.reset_index(drop=True)
+    return df, lists, NameIndex.from_sorted_codes(df["name"].cat.categories, codes)
+
+
+def concat_frames(
+    frames: Sequence[tuple[pd.DataFrame, dict[str, FlatStringLists]]],
+) -> tuple[pd.DataFrame, dict[str, FlatStringLists]]:
+    """Concatenates DataFrames with categorical columns and their list columns
+
+    Categorical columns are combined by merging their categories, so
+    that the values do not need to be converted to strings and back.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    if not frames:
+        return pd.DataFrame(), {}
+    # Empty frames have no rows to contribute, but their category
+    # dtypes may not match
+    frames = [frame for frame in frames if len(frame[0])] or frames[:1]
+    data = {}
+    for col in frames[0][0].columns:
+        parts = [df[col] for df, _ in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            data[col] = union_categoricals(
+                [part.array for part in parts], sort_categories=True
+            )
+        else:
+            data[col] = np.concatenate([part.to_numpy() for part in parts])
+    lists = {
+        key: FlatStringLists.concat([frame_lists[key] for _, frame_lists in frames])
+        for key in frames[0][1]
+    }
+    return pd.DataFrame(data, copy=False), lists
+
+
+#: Columns identifying a package file in snapshots
+SNAPSHOT_COLUMNS = ["channel", "subdir", "name", "version", "build"]
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Returns a 64 bit hash of the `SNAPSHOT_COLUMNS` of each row
+
+    Categorical columns are hashed by value, so the hashes do not
+    depend on the categories present in **df**.
+    """
+    import pandas as pd
+
+    return pd.util.hash_pandas_object(df[SNAPSHOT_COLUMNS], index=False).to_numpy()
+
+
+def fingerprint(hashes: np.ndarray) -> str:
+    """Fingerprint of a set of rows given their `row_hashes`"""
+    return hashlib.blake2b(
+        np.sort(hashes).astype("<u8").tobytes(), digest_size=16
+    ).hexdigest()
+
+
+def diff_rows(
+    old_hashes: np.ndarray, new_hashes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compare two sets of rows given their `row_hashes`
+
+    Returns:
+      Boolean masks selecting the added rows (of the new rows) and the
+      removed rows (of the old rows)
+    """
+    return ~np.isin(new_hashes, old_hashes), ~np.isin(old_hashes, new_hashes)
+
+
+class CategoryColumn:
+    """Column of strings stored as codes into a table of categories
+
+    The pandas-free counterpart of a `pandas.Categorical`.
+
+    Args:
+      codes: Array of indices into **categories**
+      categories: The table of distinct values
+    """
+
+    def __init__(self, codes: np.ndarray, categories: Sequence[str]) -> None:
+        self.codes = codes
+        self.categories = categories
+        self._lookup: dict[str, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def find(self, value: str) -> int | None:
+        """Returns the code of **value** (None if not in the categories)"""
+        if isinstance(self.categories, StringTable):
+            return self.categories.find(value)
+        if self._lookup is None:
+            self._lookup = {value: code for code, value in enumerate(self.categories)}
+        return self._lookup.get(value)
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the values of **rows** as object array
+
+        Only the strings referenced by **rows** are decoded.
+        """
+        used, codes = np.unique(self.codes[rows], return_inverse=True)
+        strings = np.empty(len(used), dtype=object)
+        if isinstance(self.categories, StringTable):
+            strings[:] = self.categories.take(used)
+        else:
+            strings[:] = [self.categories[code] for code in used]
+        return strings[codes]
+
+
+#: Scalar column as passed to `write_columns`
+Column = CategoryColumn | np.ndarray
+
+
+class ColumnFile:
+    """Contents of a columnar cache file as read by `read_columns`
+
+    Attributes:
+      rows: The number of rows
+      columns: Dictionary of `CategoryColumn` and (numeric) array columns
+      lists: Dictionary of `FlatStringLists` columns
+      arrays: Dictionary of additional arrays
+      meta: Free-form metadata stored alongside the data
+    """
+
+    def __init__(
+        self,
+        rows: int,
+        columns: dict[str, Column],
+        lists: dict[str, FlatStringLists],
+        arrays: dict[str, np.ndarray],
+        meta: dict[str, Any],
+    ) -> None:
+        self.rows = rows
+        self.columns = columns
+        self.lists = lists
+        self.arrays = arrays
+        self.meta = meta
+
+
+def _frame_columns(df: pd.DataFrame) -> dict[str, Column]:
+    """The columns of **df** as `CategoryColumn` or numeric arrays"""
+    import pandas as pd
+
+    columns: dict[str, Column] = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            columns[col] = CategoryColumn(series.array.codes, series.cat.categories)
+        else:
+            columns[col] = series.to_numpy()
+    return columns
+
+
+class CachedFrame:
+    """Contents of a columnar cache file
+
+    Read from a file, the scalar columns are kept as mapped arrays and
+    `StringTable` categories. The DataFrame holding all rows is only
+    built once `df` is accessed. Use `take` to get the rows a query
+    needs, decoding only the strings of those rows.
+
+    Attributes:
+      lists: Dictionary of `FlatStringLists` columns
+      arrays: Dictionary of additional arrays
+      meta: Free-form metadata stored alongside the data
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame | None,
+        lists: dict[str, FlatStringLists],
+        arrays: dict[str, np.ndarray],
+        meta: dict[str, Any],
+        columns: dict[str, Column] | None = None,
+        rows: int | None = None,
+    ) -> None:
+        self._df = df
+        self._columns = columns
+        self._rows = len(df) if df is not None else rows
+        self.lists = lists
+        self.arrays = arrays
+        self.meta = meta
+
+    @classmethod
+    def from_columns(cls, data: ColumnFile) -> CachedFrame:
+        """Wrap the contents of a file read with `read_columns`"""
+        return cls(None, data.lists, data.arrays, data.meta, data.columns, data.rows)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """DataFrame holding the scalar columns of all rows"""
+        if self._df is None:
+            import pandas as pd
+
+            data: dict[str, Any] = {}
+            for col, values in self._columns.items():
+                if isinstance(values, CategoryColumn):
+                    data[col] = pd.Categorical.from_codes(
+                        values.codes, categories=list(values.categories), validate=False
+                    )
+                else:
+                    data[col] = values
+            self._df = pd.DataFrame(data, index=pd.RangeIndex(self._rows), copy=False)
+        return self._df
+
+    @property
+    def columns(self) -> dict[str, Column]:
+        """The scalar columns as `CategoryColumn` or numeric arrays"""
+        if self._columns is None:
+            self._columns = _frame_columns(self._df)
+        return self._columns
+
+    def take(
+        self, rows: np.ndarray | slice, columns: Iterable[str] | None = None
+    ) -> pd.DataFrame:
+        """Returns a DataFrame of **rows** (labelled with their positions)
+
+        Unless `df` was built already, only the strings referenced by
+        **rows** are decoded, and returned as plain object columns.
+
+        Args:
+          rows: Positions or slice of the rows
+          columns: The columns needed (all if None)
+        """
+        import pandas as pd
+
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(self._rows), dtype=np.int64)
+        needed = self.columns if columns is None else set(columns)
+        columns = [col for col in self.columns if col in needed]
+        if self._df is not None:
+            return self._df.iloc[rows][columns]
+        data = {col: self.values(rows, col) for col in columns}
+        return pd.DataFrame(data, index=rows, copy=False)
+
+    def values(self, rows: np.ndarray, column: str) -> np.ndarray:
+        """Returns the values of **column** for **rows** (without pandas)
+
+        Category columns are returned as object arrays holding only the
+        decoded strings of **rows**.
+        """
+        values = self.columns[column]
+        if isinstance(values, CategoryColumn):
+            return values.decode(rows)
+        return values[rows]
+
+    def select(
+        self, rows: np.ndarray, column: str, values: Sequence[Any]
+    ) -> np.ndarray:
+        """Returns those of **rows** where **column** is one of **values**
+
+        Category columns are compared by code, so no strings are decoded.
+        """
+        data = self.columns[column]
+        if not isinstance(data, CategoryColumn):
+            return rows[np.isin(data[rows], values)]
+        codes = [data.find(value) for value in values if isinstance(value, str)]
+        codes = [code for code in codes if code is not None]
+        return rows[np.isin(data.codes[rows], codes)]
+
+    @property
+    def name_index(self) -> NameIndex | None:
+        """The `NameIndex` stored with the frame (if any)"""
+        if "name_offsets" not in self.arrays:
+            return None
+        return NameIndex(self.columns["name"].categories, self.arrays["name_offsets"])
+
+
+def _aligned(pos: int) -> int:
+    return (pos + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_frame(
+    path: str,
+    df: pd.DataFrame,
+    lists: dict[str, FlatStringLists] | None = None,
+    meta: dict[str, Any] | None = None,
+    arrays: dict[str, np.ndarray] | None = None,
+) -> None:
+    """Write **df** (and list columns) to a columnar cache file
+
+    Categorical columns are stored as codes and categories, all other
+    columns must be numeric. The file is written atomically.
+
+    Args:
+      path: Target file name
+      df: DataFrame with categorical or numeric columns only
+      lists: Columns of string lists, each with ``len(df)`` rows
+      meta: JSON serializable metadata to store in the header
+      arrays: Additional (numeric) arrays to store, e.g. ``name_offsets``
+    """
+    write_columns(path, len(df), _frame_columns(df), lists, meta, arrays)
+
+
+def write_columns(
+    path: str,
+    rows: int,
+    columns: dict[str, Column],
+    lists: dict[str, FlatStringLists] | None = None,
+    meta: dict[str, Any] | None = None,
+    arrays: dict[str, np.ndarray] | None = None,
+) -> None:
+    """Write columns to a columnar cache file
+
+    Like `write_frame`, but taking the columns as `CategoryColumn` or
+    numeric arrays, so that pandas is not needed.
+
+    Args:
+      path: Target file name
+      rows: The number of rows
+      columns: The scalar columns, each with **rows** values
+      lists: Columns of string lists, each with **rows** rows
+      meta: JSON serializable metadata to store in the header
+      arrays: Additional (numeric) arrays to store, e.g. ``name_offsets``
+    """
+    extra = arrays or {}
+    arrays: list[tuple[dict[str, Any], np.ndarray]] = []
+    specs: list[dict[str, Any]] = []
+
+    def add_array(arr: np.ndarray) -> dict[str, Any]:
+        arr = np.ascontiguousarray(arr)
+        if arr.dtype.hasobject:
+            raise ValueError("Only numeric arrays can be stored")
+        spec = {"dtype": arr.dtype.str, "count": len(arr)}
+        arrays.append((spec, arr))
+        return spec
+
+    def add_table(strings: Sequence[str]) -> dict[str, Any]:
+        if not isinstance(strings, StringTable):
+            strings = StringTable.from_strings(str(string) for string in strings)
+        return {
+            "offsets": add_array(strings.offsets),
+            "blob": add_array(strings.blob),
+            "sorted": strings.is_sorted,
+        }
+
+    for col, values in columns.items():
+        if len(values) != rows:
+            raise ValueError(f"Column {col} does not match row count")
+        if isinstance(values, CategoryColumn):
+            specs.append(
+                {
+                    "name": col,
+                    "kind": "category",
+                    "codes": add_array(values.codes),
+                    "categories": add_table(values.categories),
+                }
+            )
+        else:
+            specs.append({"name": col, "kind": "array", "data": add_array(values)})
+    for col, values in (lists or {}).items():
+        if len(values) != rows:
+            raise ValueError(f"List column {col} does not match row count")
+        if isinstance(values, DependsLists):
+            specs.append(
+                {
+                    "name": col,
+                    "kind": "depends",
+                    "offsets": add_array(values.offsets),
+                    "codes": add_array(values.codes),
+                    "spec_names": add_array(values.spec_names),
+                    "spec_constraints": add_array(values.spec_constraints),
+                    "names": add_table(values.names),
+                    "constraints": add_table(values.constraints),
+                }
+            )
+            continue
+        specs.append(
+            {
+                "name": col,
+                "kind": "lists",
+                "offsets": add_array(values.offsets),
+                "codes": add_array(values.codes),
+                "strings": add_table(values.strings),
+            }
+        )
+
+    extra_specs = {name: add_array(arr) for name, arr in extra.items()}
+
+    header = {
+        "rows": rows,
+        "columns": specs,
+        "arrays": extra_specs,
+        "meta": meta or {},
+    }
+    # Array positions depend on the header size and vice versa, so
+    # we write positions relative to the end of the padded header.
+    pos = 0
+    for spec, arr in arrays:
+        pos = _aligned(pos)
+        spec["offset"] = pos
+        pos += arr.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + _HEADER_LEN.size + len(header_bytes))
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fdes, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fdes, "wb") as out:
+            out.write(MAGIC)
+            out.write(_HEADER_LEN.pack(len(header_bytes)))
+            out.write(header_bytes)
+            for spec, arr in arrays:
+                out.seek(data_start + spec["offset"])
+                out.write(arr.tobytes())
+            out.truncate(data_start + pos)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_frame(path: str) -> CachedFrame:
+    """Open a columnar cache file for use with pandas
+
+    The DataFrame is only built as needed (see `CachedFrame`). The
+    arrays are read-only views into a memory mapping of the file.
+
+    Raises:
+      `CacheFormatError` if the file is not a compatible cache file.
+    """
+    return CachedFrame.from_columns(read_columns(path))
+
+
+def read_columns(path: str) -> ColumnFile:
+    """Open a columnar cache file without creating a DataFrame
+
+    The returned arrays are read-only views into a memory mapping of
+    the file. String tables are returned as `StringTable` and are
+    decoded on access.
+
+    Raises:
+      `CacheFormatError` if the file is not a compatible cache file.
+    """
+    with open(path, "rb") as fdes:
+        if fdes.read(len(MAGIC)) != MAGIC:
+            raise CacheFormatError(f"{path} is not a columnar repodata cache")
+        (header_len,) = _HEADER_LEN.unpack(fdes.read(_HEADER_LEN.size))
+        header = json.loads(fdes.read(header_len))
+        data_start = _aligned(len(MAGIC) + _HEADER_LEN.size + header_len)
+        # The mapping stays valid after the file is closed (and after
+        # the file is replaced by a writer).
+        mapped = mmap.mmap(fdes.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_array(spec: dict[str, Any]) -> np.ndarray:
+        return np.frombuffer(
+            mapped,
+            dtype=np.dtype(spec["dtype"]),
+            count=spec["count"],
+            offset=data_start + spec["offset"],
+        )
+
+    def get_table(spec: dict[str, Any]) -> StringTable:
+        return StringTable(
+            get_array(spec["offsets"]), get_array(spec["blob"]), spec["sorted"]
+        )
+
+    columns: dict[str, Column] = {}
+    lists: dict[str, FlatStringLists] = {}
+    for col in header["columns"]:
+        if col["kind"] == "category":
+            columns[col["name"]] = CategoryColumn(
+                get_array(col["codes"]), get_table(col["categories"])
+            )
+        elif col["kind"] == "array":
+            columns[col["name"]] = get_array(col["data"])
+        elif col["kind"] == "depends":
+            lists[col["name"]] = DependsLists(
+                get_array(col["offsets"]),
+                get_array(col["codes"]),
+                get_table(col["names"]),
+                get_table(col["constraints"]),
+                get_array(col["spec_names"]),
+                get_array(col["spec_constraints"]),
+            )
+        elif col["kind"] == "lists":
+            lists[col["name"]] = FlatStringLists(
+                get_array(col["offsets"]),
+                get_array(col["codes"]),
+                get_table(col["strings"]),
+            )
+        else:
+            raise CacheFormatError(f"Unknown column kind {col['kind']} in {path}")
+    arrays = {name: get_array(spec) for name, spec in header["arrays"].items()}
+    return ColumnFile(header["rows"], columns, lists, arrays, header["meta"])
+
+
+def hash_bytes(data: bytes) -> str:
+    """Hash of a ``repodata.json`` as used by jlap patch feeds"""
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
+class JlapFeed:
+    """Parsed ``repodata.jlap`` patch feed
+
+    A jlap file consists of lines, each chained to the previous one by
+    a keyed blake2b checksum. The first line holds the initial key.
+    The last line holds the checksum of all lines before it. The line
+    before it is a footer naming the hash of the current
+    ``repodata.json`` (``latest``). All other lines are patches of the
+    form ``{"from": hash, "to": hash, "patch": [RFC 6902 operations]}``.
+
+    To fetch only new lines next time, the feed can be requested from
+    `pos` onwards with `iv` as the initial key.
+
+    Attributes:
+      patches: List of patch objects, oldest first
+      latest: Hash of the current ``repodata.json``
+      pos: Offset of the footer line within the file
+      iv: Checksum of all lines before the footer (hex)
+    """
+
+    def __init__(
+        self, patches: list[dict[str, Any]], latest: str, pos: int, iv: str
+    ) -> None:
+        self.patches = patches
+        self.latest = latest
+        self.pos = pos
+        self.iv = iv
+
+    @classmethod
+    def parse(cls, data: bytes, offset: int = 0, iv: str | None = None) -> JlapFeed:
+        """Parse and verify (part of) a jlap file
+
+        Args:
+          data: File content starting at **offset**
+          offset: Offset of **data** within the file
+          iv: Checksum preceding **offset**. If None, **data** must
+              start at the beginning of the file.
+
+        Raises:
+          `CacheFormatError` if the file is truncated or fails verification
+        """
+        lines = data.split(b"\n")
+        if lines and lines[-1] == b"":
+            lines.pop()
+        pos = offset
+        if iv is None:
+            if not lines:
+                raise CacheFormatError("Empty jlap file")
+            pos += len(lines[0]) + 1
+            iv = lines.pop(0).decode("ascii")
+        if len(lines) < 2:
+            raise CacheFormatError("Truncated jlap file")
+        try:
+            key = bytes.fromhex(iv)
+            checksums = [key]
+            for line in lines[:-1]:
+                key = hashlib.blake2b(line, key=key, digest_size=32).digest()
+                checksums.append(key)
+            if bytes.fromhex(lines[-1].decode("ascii")) != key:
+                raise CacheFormatError("jlap checksum mismatch")
+            *patch_lines, footer_line = lines[:-1]
+            patches = [json.loads(line) for line in patch_lines]
+            latest = json.loads(footer_line)["latest"]
+        except (ValueError, KeyError) as exc:
+            raise CacheFormatError(f"Invalid jlap file: {exc}") from exc
+        pos += sum(len(line) + 1 for line in patch_lines)
+        return cls(patches, latest, pos, checksums[-2].hex())
+
+    def patch_chain(self, have: str) -> list[dict[str, Any]] | None:
+        """Find the patches leading from hash **have** to `latest`
+
+        Returns:
+          List of patches to apply (empty if **have** is current) or
+          None if the feed does not reach back to **have**.
+        """
+        if have == self.latest:
+            return []
+        chain = []
+        for patch in self.patches:
+            if chain or patch["from"] == have:
+                if patch["from"] != (chain[-1]["to"] if chain else have):
+                    return None
+                chain.append(patch)
+                if patch["to"] == self.latest:
+                    return chain
+        return None
+
+
+def _split_pointer(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer {pointer!r}")
+    return [
+        part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")
+    ]
+
+
+def _resolve(doc: Any, parts: list[str]) -> Any:
+    for part in parts:
+        doc = doc[int(part)] if isinstance(doc, list) else doc[part]
+    return doc
+
+
+def apply_json_patch(doc: Any, operations: list[dict[str, Any]]) -> Any:
+    """Apply RFC 6902 JSON patch **operations** to **doc**
+
+    The document is modified in place where possible. The patched
+    document is returned (which differs from **doc** only if the
+    root was replaced).
+
+    Raises:
+      `ValueError` if the patch does not apply.
+    """
+    for operation in operations:
+        op = operation["op"]
+        parts = _split_pointer(operation["path"])
+        try:
+            if op == "test":
+                if _resolve(doc, parts) != operation["value"]:
+                    raise ValueError(f"Test failed at {operation['path']}")
+                continue
+            if op in ("move", "copy"):
+                source = _split_pointer(operation["from"])
+                value = _resolve(doc, source)
+                if op == "move":
+                    parent = _resolve(doc, source[:-1])
+                    del parent[
+                        int(source[-1]) if isinstance(parent, list) else source[-1]
+                    ]
+                else:
+                    value = json.loads(json.dumps(value))
+                op = "add"
+            else:
+                value = operation.get("value")
+            if not parts:
+                if op == "remove":
+                    raise ValueError("Cannot remove document root")
+                doc = value
+                continue
+            parent = _resolve(doc, parts[:-1])
+            key = parts[-1]
+            if isinstance(parent, list):
+                if op == "add":
+                    parent.insert(len(parent) if key == "-" else int(key), value)
+                elif op == "remove":
+                    del parent[int(key)]
+                elif op == "replace":
+                    parent[int(key)] = value
+                else:
+                    raise ValueError(f"Unknown JSON patch operation {op}")
+            else:
+                if op == "add":
+                    parent[key] = value
+                elif op == "remove":
+                    del parent[key]
+                elif op == "replace":
+                    if key not in parent:
+                        raise KeyError(key)
+                    parent[key] = value
+                else:
+                    raise ValueError(f"Unknown JSON patch operation {op}")
+        except (KeyError, IndexError, TypeError) as exc:
+            raise ValueError(
+                f"Failed to apply {op} at {operation['path']}: {exc!r}"
+            ) from exc
+    return doc
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fdes, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fdes, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on the lock file **path** (created if missing)
+
+    Processes (and threads using their own lock) refreshing the same
+    cache are serialized this way. The lock is released if the holding
+    process dies.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as fdes:
+        try:
+            fcntl.flock(fdes, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Waiting for other process updating %s", path)
+            fcntl.flock(fdes, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fdes, fcntl.LOCK_UN)
+
+
+class ShardCache:
+    """Raw and parsed cache of the repodata for one channel/subdir
+
+    The directory holds the ``repodata.json`` as last received, the
+    parsed rows in columnar format (``repodata.col``) and a
+    ``state.json`` recording the HTTP validators (``etag``,
+    ``last_modified``), the ``hash`` of the repodata and the position
+    within the jlap patch feed (``jlap_pos``, ``jlap_iv``).
+
+    The parsed rows are only used if they were made from the repodata
+    with the hash recorded in the state.
+
+    All files are replaced atomically. Processes refreshing the shard
+    should hold its `lock`, so that only one of them downloads while
+    the others wait and then reuse the result.
+    """
+
+    RAW_NAME = "repodata.json"
+    FRAME_NAME = "repodata.col"
+    STATE_NAME = "state.json"
+    LOCK_NAME = "lock"
+
+    def __init__(self, root: str, channel: str, subdir: str) -> None:
+        self.path = os.path.join(root, re.sub(r"[^\w.-]", "_", channel), subdir)
+        self.state: dict[str, Any] = {}
+        self.load_state()
+
+    def load_state(self) -> None:
+        """(Re-)read the state written last"""
+        try:
+            with open(os.path.join(self.path, self.STATE_NAME)) as fdes:
+                self.state = json.load(fdes)
+        except (OSError, ValueError):
+            self.state = {}
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the lock of the shard
+
+        The state is re-read once the lock is acquired, as another
+        process may have refreshed the shard meanwhile.
+        """
+        with file_lock(os.path.join(self.path, self.LOCK_NAME)):
+            self.load_state()
+            yield
+
+    @property
+    def raw_path(self) -> str:
+        return os.path.join(self.path, self.RAW_NAME)
+
+    def load_frame(self) -> CachedFrame | None:
+        """Returns the parsed rows if they match the raw repodata"""
+        if "hash" not in self.state or not os.path.exists(self.raw_path):
+            return None
+        try:
+            cached = read_frame(os.path.join(self.path, self.FRAME_NAME))
+        except (OSError, CacheFormatError):
+            return None
+        if cached.meta.get("hash") != self.state["hash"]:
+            return None
+        return cached
+
+    def request_headers(self) -> dict[str, str]:
+        """Headers making a request for the repodata conditional"""
+        headers = {}
+        if "etag" in self.state:
+            headers["If-None-Match"] = self.state["etag"]
+        if "last_modified" in self.state:
+            headers["If-Modified-Since"] = self.state["last_modified"]
+        return headers
+
+    def read_raw(self) -> bytes:
+        with open(self.raw_path, "rb") as fdes:
+            return fdes.read()
+
+    def open_raw_tempfile(self) -> tuple[IO[bytes], str]:
+        """Open a temporary file to receive new repodata
+
+        Returns:
+          File object and path to pass to `replace_raw`
+        """
+        os.makedirs(self.path, exist_ok=True)
+        fdes, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        return os.fdopen(fdes, "wb"), tmp_path
+
+    def replace_raw(
+        self,
+        tmp_path: str,
+        repodata_hash: str,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        """Move new repodata written to **tmp_path** into place
+
+        Args:
+          tmp_path: Temporary file from `open_raw_tempfile`
+          repodata_hash: Hash identifying the content
+          headers: Response headers. If given, the validators are
+                   replaced with those found in the headers.
+        """
+        os.replace(tmp_path, self.raw_path)
+        if headers is not None:
+            for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+                if header in headers:
+                    self.state[key] = headers[header]
+                else:
+                    self.state.pop(key, None)
+        self.state["hash"] = repodata_hash
+
+    def store_raw(
+        self,
+        data: bytes,
+        headers: dict[str, str] | None = None,
+        repodata_hash: str | None = None,
+    ) -> None:
+        """Store downloaded or patched repodata
+
+        Args:
+          data: Content of ``repodata.json``
+          headers: Response headers (see `replace_raw`)
+          repodata_hash: Hash identifying the content (computed from
+                         **data** if not given)
+        """
+        out, tmp_path = self.open_raw_tempfile()
+        try:
+            with out:
+                out.write(data)
+            self.replace_raw(tmp_path, repodata_hash or hash_bytes(data), headers)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def store_frame(self, df: pd.DataFrame, lists: dict[str, FlatStringLists]) -> None:
+        """Store the parsed rows for the current raw repodata"""
+        write_frame(
+            os.path.join(self.path, self.FRAME_NAME),
+            df,
+            lists,
+            meta={"hash": self.state["hash"]},
+        )
+
+    def save_state(self) -> None:
+        _write_atomic(
+            os.path.join(self.path, self.STATE_NAME),
+            json.dumps(self.state).encode("utf-8"),
+        )
@@ -0,0 +1,390 @@
+"""
+Incremental Parser for ``repodata.json``
+
+`RepodataParser` consumes the bytes of a ``repodata.json`` as they are
+downloaded and appends the columns loaded by `utils.RepoData` to typed
+buffers. Only one package record is decoded at a time, so the
+complete JSON document is never held in memory as Python objects:
+
+- ``name``, ``version`` and ``build`` are stored as `array.array`
+  codes into a table of distinct strings (i.e. as categoricals),
+- ``build_number`` as an `array.array` of integers and
+- ``depends`` as offsets and codes (see `FlatStringLists`).
+
+Keys other than ``info``, ``packages`` and ``packages.conda`` at the
+top level of the document are skipped.
+
+`RunExportsIndex` holds the ``run_exports.json`` published next to the
+``repodata.json`` of a subdir (CEP 12). It provides the run_exports of
+packages without downloading them.
+"""
+
+from __future__ import annotations
+
+import codecs
+import hashlib
+import json
+from array import array
+from collections.abc import Sequence
+from typing import IO, TYPE_CHECKING, Any
+
+import numpy as np
+
+from .repodata_cache import CategoryColumn, Column, FlatStringLists
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+#: Keys of the top level object holding package records
+PACKAGE_KEYS = ("packages", "packages.conda")
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Interned:
+    """Column of strings stored as codes into a table of distinct values"""
+
+    def __init__(self) -> None:
+        self.table: dict[str, int] = {}
+        self.codes = array("i")
+
+    def append(self, value: str) -> None:
+        self.codes.append(self.table.setdefault(value, len(self.table)))
+
+    def to_column(self) -> CategoryColumn:
+        return CategoryColumn(
+            np.frombuffer(self.codes, dtype=np.int32)
+            if self.codes
+            else np.zeros(0, dtype=np.int32),
+            list(self.table),
+        )
+
+
+class RepodataParser:
+    """Incremental parser building repodata columns
+
+    Feed data using `write` (so that the parser can be passed where a
+    file object is expected) and call `finish` once all data has been
+    written. Call `reset` to start over (e.g. when a download is
+    retried).
+
+    Args:
+      raw: File object to which all data is copied as well
+    """
+
+    def __init__(self, raw: IO[bytes] | None = None) -> None:
+        self.raw = raw
+        self._start()
+
+    def reset(self) -> None:
+        """Discard all data written so far (truncating `raw` as well)"""
+        if self.raw is not None:
+            self.raw.seek(0)
+            self.raw.truncate()
+        self._start()
+
+    def _start(self) -> None:
+        self.info: dict[str, Any] = {}
+        self._hash = hashlib.blake2b(digest_size=32)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._wait = 0
+        self._done = False
+
+        self._names = _Interned()
+        self._versions = _Interned()
+        self._builds = _Interned()
+        self._build_numbers = array("q")
+        self._depends = _Interned()
+        self._depends_offsets = array("q", [0])
+
+    @property
+    def hash(self) -> str:
+        """Hash of the data written (see `repodata_cache.hash_bytes`)"""
+        return self._hash.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._build_numbers)
+
+    def write(self, data: bytes) -> int:
+        """Parse the next block of data"""
+        if self.raw is not None:
+            self.raw.write(data)
+        self._hash.update(data)
+        self._buf += self._decoder.decode(data)
+        if len(self._buf) - self._pos >= self._wait:
+            self._parse(final=False)
+        return len(data)
+
+    def finish(self) -> None:
+        """Parse the remaining data
+
+        Raises:
+          `ValueError` if the document was incomplete or malformed
+        """
+        self._buf += self._decoder.decode(b"", final=True)
+        self._parse(final=True)
+        if not self._done:
+            raise ValueError("Incomplete repodata document")
+
+    def add_repodata(self, repo: dict[str, Any]) -> None:
+        """Add package records from an already decoded repodata document"""
+        self.info = repo.get("info", {})
+        for key in PACKAGE_KEYS:
+            for record in repo.get(key, {}).values():
+                self._add_record(record)
+        self._done = True
+
+    def _add_record(self, record: dict[str, Any]) -> None:
+        self._names.append(record["name"])
+        self._versions.append(str(record.get("version", "")))
+        self._builds.append(record.get("build", ""))
+        self._build_numbers.append(record.get("build_number") or 0)
+        for dep in record.get("depends") or ():
+            self._depends.append(dep)
+        self._depends_offsets.append(len(self._depends.codes))
+
+    def _skip(self, chars: str) -> bool:
+        """Advance past whitespace and any of **chars**
+
+        Returns False if the end of the buffer was reached.
+        """
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] in chars):
+            pos += 1
+        self._pos = pos
+        return pos < len(buf)
+
+    def _decode(self, final: bool) -> tuple[Any, int] | None:
+        """Decode the JSON value at the current position
+
+        Returns None if more data is needed to be sure the value is complete.
+        """
+        try:
+            value, end = self._json.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        # A number could continue in the next block
+        if end == len(self._buf) and not final:
+            return None
+        return value, end
+
+    def _decode_member(self, final: bool) -> tuple[str, Any, int] | None:
+        """Decode ``"key": value`` at the current position"""
+        start = self._pos
+        key = self._decode(final)
+        if key is None:
+            return None
+        self._pos = key[1]
+        if not self._skip(""):
+            self._pos = start
+            return None
+        if self._buf[self._pos] != ":":
+            raise ValueError(f"Expected ':' in repodata at {self._pos}")
+        self._pos += 1
+        if not self._skip(""):
+            self._pos = start
+            return None
+        if key[0] in PACKAGE_KEYS:
+            return key[0], None, self._pos
+        value = self._decode(final)
+        if value is None:
+            self._pos = start
+            return None
+        return key[0], value[0], value[1]
+
+    def _parse(self, final: bool) -> None:
+        while not self._done and self._skip(","):
+            char = self._buf[self._pos]
+            if self._state == "start":
+                if char != "{":
+                    raise ValueError("Repodata is not a JSON object")
+                self._pos += 1
+                self._state = "top"
+            elif char == "}":
+                self._pos += 1
+                if self._state == "packages":
+                    self._state = "top"
+                else:
+                    self._done = True
+            elif self._state == "packages":
+                member = self._decode_member(final)
+                if member is None:
+                    break
+                self._add_record(member[1])
+                self._pos = member[2]
+            else:
+                member = self._decode_member(final)
+                if member is None:
+                    break
+                key, value, self._pos = member
+                if key in PACKAGE_KEYS:
+                    if self._buf[self._pos] != "{":
+                        raise ValueError(f"Expected object for {key} in repodata")
+                    self._pos += 1
+                    self._state = "packages"
+                elif key == "info":
+                    self.info = value
+        # Wait for (at least) twice the data before trying the
+        # incomplete value again
+        self._wait = 2 * (len(self._buf) - self._pos)
+        self._buf = self._buf[self._pos :]
+        self._pos = 0
+
+    def to_columns(self) -> tuple[dict[str, Column], dict[str, FlatStringLists]]:
+        """Returns the scalar and list columns parsed (without pandas)"""
+        columns: dict[str, Column] = {
+            "build": self._builds.to_column(),
+            "build_number": np.array(self._build_numbers, dtype=np.int64),
+            "name": self._names.to_column(),
+            "version": self._versions.to_column(),
+        }
+        depends = FlatStringLists(
+            np.frombuffer(self._depends_offsets, dtype=np.int64),
+            np.array(self._depends.codes, dtype=np.int32),
+            list(self._depends.table),
+        )
+        return columns, {"depends": depends}
+
+    def to_frame(self) -> tuple[pd.DataFrame, dict[str, FlatStringLists]]:
+        """Returns the DataFrame and list columns parsed"""
+        import pandas as pd
+
+        columns, lists = self.to_columns()
+        df = pd.DataFrame(
+            {
+                col: pd.Categorical.from_codes(
+                    values.codes, categories=values.categories, validate=False
+                )
+                if isinstance(values, CategoryColumn)
+                else values
+                for col, values in columns.items()
+            },
+            copy=False,
+        )
+        return df, lists
+
+
+def split_filename(filename: str) -> tuple[str, str, str]:
+    """Split a package file name into name, version and build"""
+    for ext in (".tar.bz2", ".conda"):
+        if filename.endswith(ext):
+            filename = filename[: -len(ext)]
+            break
+    name, version, build = filename.rsplit("-", 2)
+    return name, version, build
+
+
+class RunExportsIndex:
+    """Index of the run_exports published by channels
+
+    Packages are indexed by shard (a (channel, subdir) tuple), name,
+    version and build. Packages without run_exports are indexed as well
+    (with an empty dict), so that a missing entry means the package is
+    unknown.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[tuple[str, str], dict[str, dict[str, dict[str, dict]]]] = {}
+
+    def __len__(self) -> int:
+        return sum(
+            len(builds)
+            for names in self._data.values()
+            for versions in names.values()
+            for builds in versions.values()
+        )
+
+    def add(self, shard: tuple[str, str], run_exports: dict[str, Any]) -> None:
+        """Add the contents of the ``run_exports.json`` of **shard**"""
+        names = self._data.setdefault(shard, {})
+        for key in PACKAGE_KEYS:
+            for filename, record in run_exports.get(key, {}).items():
+                name, version, build = split_filename(filename)
+                builds = names.setdefault(name, {}).setdefault(version, {})
+                builds[build] = record.get("run_exports") or {}
+
+    def get(
+        self,
+        shards: Sequence[tuple[str, str]],
+        name: str,
+        version: str,
+        build: str | None = None,
+    ) -> dict[str, list[str]] | None:
+        """Returns the run_exports of a package
+
+        Args:
+          shards: The shards to look at (in order of precedence)
+          name: Package name
+          version: Package version
+          build: Build string. If None, the run_exports of any build
+                 are returned.
+
+        Returns:
+          Dictionary mapping the kind of export (``weak``, ``strong``,
+          ...) to a list of specs or None if the package is unknown
+        """
+        for shard in shards:
+            builds = self._data.get(shard, {}).get(name, {}).get(version)
+            if not builds:
+                continue
+            if build is None:
+                return next(iter(builds.values()))
+            if build in builds:
+                return builds[build]
+        return None
+
+    def channeldata(self, shards: Sequence[tuple[str, str]]) -> dict[str, Any]:
+        """Returns the run_exports of **shards** as ``channeldata.json``
+
+        The ``channeldata.json`` format only has one entry per package
+        version, which conda-build uses for all builds of the version.
+        Versions whose builds differ in their run_exports, as well as
+        unknown packages and versions, map to None (see
+        `ChanneldataPackages`), so that conda-build downloads the
+        package to look.
+        """
+        packages = ChanneldataPackages()
+        for shard in shards:
+            for name, versions in self._data.get(shard, {}).items():
+                exports = packages.setdefault(
+                    name, {"run_exports": RunExportsByVersion()}
+                )
+                exports = exports["run_exports"]
+                for version, builds in versions.items():
+                    for run_exports in builds.values():
+                        if version not in exports:
+                            exports[version] = run_exports
+                        elif exports[version] != run_exports:
+                            exports[version] = None
+        return {"packages": packages}
+
+
+class RunExportsByVersion(dict):
+    """The ``run_exports`` of a package in a ``channeldata.json``
+
+    conda-build takes a version missing from ``channeldata.json`` to
+    have no run_exports. Here, ``get`` returns None for it instead, which
+    makes conda-build download the package.
+    """
+
+    def get(self, version, default=None):
+        return super().get(version)
+
+
+class ChanneldataPackages(dict):
+    """The ``packages`` of a ``channeldata.json`` made by `RunExportsIndex`
+
+    Like `RunExportsByVersion`, ``get`` makes conda-build download
+    packages missing from the index.
+    """
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return {"run_exports": RunExportsByVersion()}
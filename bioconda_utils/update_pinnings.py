@@ -2,11 +2,18 @@
 Determine which packages need updates after pinning change
 """
 
+from __future__ import annotations
+
 import enum
+import hashlib
 import logging
 import re
 import string
+from typing import NamedTuple
+
+import conda_build
 
+from .recipe_cache import recipe_cache
 from .utils import RepoData
 
 # FIXME: trim_build_only_deps is not exported via conda_build.api!
@@ -29,45 +36,160 @@ def _get_build_variants(meta: MetaData) -> set[str]:
     return dependencies
 
 
-def skip_for_variants(meta: MetaData, variant_keys: AbstractSet[str]) -> bool:
+class Variant(NamedTuple):
+    """What `check` needs to know of a rendered variant
+
+    Unlike the ``MetaData`` it is made from, it can be stored in the
+    `recipe_cache` (see `render_variants`).
+    """
+
+    #: Package name
+    name: str
+    #: Package version
+    version: str
+    #: Build number
+    build_number: int
+    #: Build string
+    build_id: str
+    #: Whether the variant is skipped on the platform rendered for
+    skip: bool
+    #: Value of ``build/noarch`` (None if not noarch)
+    noarch: str | None
+    #: Variant keys affecting the build string (build-only deps trimmed)
+    build_variants: frozenset[str]
+    #: Values of all variant keys used by the recipe
+    variant: dict[str, str]
+
+    @classmethod
+    def from_meta(cls, meta: MetaData) -> Variant:
+        used = meta.get_used_vars()
+        return cls(
+            name=meta.name(),
+            version=meta.version(),
+            build_number=int(meta.build_number()),
+            build_id=meta.build_id(),
+            skip=bool(meta.skip()),
+            noarch=meta.get_value("build/noarch") or None,
+            build_variants=frozenset(_get_build_variants(meta)),
+            variant={
+                var: meta.config.variant[var]
+                for var in used
+                if var in meta.config.variant
+            },
+        )
+
+
+def render_variants(recipe: Recipe, build_config: object) -> list[Variant] | None:
+    """Render **recipe** with conda-build, summarizing each variant
+
+    The result is kept in the `recipe_cache`. It is reused as long as
+    the recipe text, its build scripts and conda_build_config.yaml, the
+    global conda_build_config files, the conda-build version and the
+    repodata of the recipe's dependencies stay the same (see
+    `_render_cache_key` for what is not covered).
+
+    Returns:
+      List of variants or None if conda-build returned nothing
+
+    Raises:
+      `RecipeError` and others if conda-build fails (not cached)
+    """
+    text, variables = _render_cache_key(recipe, build_config)
+    variants = recipe_cache.get("variants", recipe.path, text, variables)
+    if variants is not None:
+        return variants
+    try:
+        metas = recipe.conda_render(config=build_config)
+        if metas is None:
+            return None
+        variants = [Variant.from_meta(meta) for meta, _, _ in metas]
+    finally:
+        recipe.conda_release()
+    recipe_cache.set("variants", recipe.path, text, variables, variants)
+    return variants
+
+
+def _render_cache_key(recipe: Recipe, build_config: object) -> tuple[str, dict]:
+    """Returns the text and variables keying `render_variants` results
+
+    The repodata part covers the packages the recipe names as
+    dependencies, which are the packages whose run_exports conda-build
+    applies. It does not cover the packages these pull in. A new build
+    of such an indirect dependency can make the solver pick another
+    build or version of a direct dependency. The cached result is then
+    used until another part of the key (e.g. the repodata of the direct
+    dependency) changes.
+    """
+    files = [
+        getattr(build_config, attr, None) or []
+        for attr in ("exclusive_config_files", "variant_config_files")
+    ]
+    config_hash = hashlib.blake2b(digest_size=16)
+    for path in sorted({path for paths in files for path in paths}):
+        config_hash.update(path.encode() + b"\0")
+        try:
+            with open(path, "rb") as fdes:
+                config_hash.update(fdes.read())
+        except OSError:
+            pass
+    parts = [recipe.dump(), recipe.conda_build_config]
+    for script, content in sorted(recipe.build_scripts.items()):
+        parts += [script, content]
+    subdir = getattr(build_config, "subdir", None)
+    repodata = RepoData()
+    # Only the repodata the render looks at (conda-build resolves the
+    # dependencies for the target subdir and noarch)
+    platforms = [
+        platform
+        for platform in repodata.platforms
+        if repodata.platform2subdir(platform) in (subdir, "noarch")
+    ]
+    variables = {
+        "conda_build": conda_build.__version__,
+        "config_files": config_hash.hexdigest(),
+        "subdir": subdir,
+        "repodata": repodata.fingerprint(platforms=platforms, names=recipe.get_deps()),
+    }
+    return "\0".join(parts), variables
+
+
+def skip_for_variants(variant: Variant, variant_keys: AbstractSet[str]) -> bool:
     """Check if the recipe uses any given variant keys
 
     Args:
-      meta: Variant MetaData object
+      variant: Rendered variant
 
     Returns:
       True if any variant key from variant_keys is used
     """
-    dependencies = _get_build_variants(meta)
+    return not variant.build_variants.isdisjoint(variant_keys)
 
-    return not dependencies.isdisjoint(variant_keys)
 
-
-def will_build_variant(meta: MetaData) -> bool:
+def will_build_variant(variant: Variant) -> bool:
     """Check if the recipe variant will be built as currently rendered
 
     Args:
-      meta: Variant MetaData object
+      variant: Rendered variant
 
     Returns:
       True if all extant build numbers are smaller than the one indicated
-      by the variant MetaData.
+      by the variant.
     """
     build_numbers = RepoData().get_package_data(
         "build_number",
-        name=meta.name(),
-        version=meta.version(),
+        name=variant.name,
+        version=variant.version,
         platform=["linux", "noarch"],
     )
-    current_num = int(meta.build_number())
+    current_num = variant.build_number
     res = all(num < current_num for num in build_numbers)
     if res:
         logger.debug(
             "Package %s=%s will be built already because %s < %s)",
-            meta.name(),
-            meta.version(),
-            max(build_numbers) if build_numbers else "N/A",
-            meta.build_number(),
+            variant.name,
+            variant.version,
+            max(build_numbers) if len(build_numbers) else "N/A",
+            variant.build_number,
         )
     return res
 
@@ -89,17 +211,17 @@ _legacy_build_string_prefixes = re.compile(
 
 
 # TODO: clean this mess up
-def _have_partially_matching_build_id(meta: MetaData) -> bool:
+def _have_partially_matching_build_id(variant: Variant) -> bool:
     # Stupid legacy special handling:
     res = RepoData().get_package_data(
         "build",
-        name=meta.name(),
-        version=meta.version(),
-        build_number=meta.build_number(),
+        name=variant.name,
+        version=variant.version,
+        build_number=variant.build_number,
         platform=["linux", "noarch"],
     )
-    is_noarch = bool(meta.noarch)
-    current_build_id = meta.build_id()
+    is_noarch = bool(variant.noarch)
+    current_build_id = variant.build_id
     current_matches = _legacy_build_string_prefixes.match(current_build_id)
     if current_matches is None:
         return False
@@ -190,90 +312,82 @@ def _have_partially_matching_build_id(meta: MetaData) -> bool:
     for build_id in res:
         if is_matching_trimmed_build_id(build_id, current_build_id):
             logger.debug(
-                "Package %s=%s=%s exists", meta.name(), meta.version(), build_id
+                "Package %s=%s=%s exists", variant.name, variant.version, build_id
             )
             return True
     return False
 
 
-def have_variant(meta: MetaData) -> bool:
+def have_variant(variant: Variant) -> bool:
     """Checks if we have an exact match to name/version/buildstring
 
     Args:
-      meta: Variant MetaData object
+      variant: Rendered variant
 
     Returns:
       True if the variant's build string exists already in the repodata
     """
     res = RepoData().get_package_data(
-        name=meta.name(),
-        version=meta.version(),
-        build=meta.build_id(),
+        name=variant.name,
+        version=variant.version,
+        build=variant.build_id,
         platform=["linux", "noarch"],
     )
     if res:
         logger.debug(
             "Package %s=%s=%s exists",
-            meta.name(),
-            meta.version(),
-            meta.build_id(),
+            variant.name,
+            variant.version,
+            variant.build_id,
         )
         return True
-    return _have_partially_matching_build_id(meta)
+    return _have_partially_matching_build_id(variant)
 
 
-def have_noarch_python_build_number(meta: MetaData) -> bool:
+def have_noarch_python_build_number(variant: Variant) -> bool:
     """Checks if we have a noarch:python build with same version+build_number
 
     Args:
-      meta: Variant MetaData object
+      variant: Rendered variant
 
     Returns:
       True if noarch:python and version+build_number exists already in repodata
     """
-    if meta.get_value("build/noarch") != "python":
+    if variant.noarch != "python":
         return False
     res = RepoData().get_package_data(
-        name=meta.name(),
-        version=meta.version(),
-        build_number=meta.build_number(),
+        name=variant.name,
+        version=variant.version,
+        build_number=variant.build_number,
         platform=["noarch"],
     )
     if res:
         logger.debug(
             "Package %s=%s[build_number=%s, subdir=noarch] exists",
-            meta.name(),
-            meta.version(),
-            meta.build_number(),
+            variant.name,
+            variant.version,
+            variant.build_number,
         )
     return res
 
 
-def will_build_only_missing(metas: list[MetaData]) -> bool:
+def will_build_only_missing(variants: list[Variant]) -> bool:
     """Checks if only new builds will be added (no divergent build ids exist)
 
     Args:
-      metas: List of Variant MetaData objects
+      variants: List of rendered variants
 
     Returns:
       True if no divergent build strings exist in repodata
     """
-    builds = {(meta.name(), meta.version(), meta.build_number()) for meta in metas}
-    existing_builds = set()
-    for name, version, build_number in builds:
-        existing_builds.update(
-            map(
-                tuple,
-                RepoData().get_package_data(
-                    ["name", "version", "build"],
-                    name=name,
-                    version=version,
-                    build_number=build_number,
-                    platform=["linux", "noarch"],
-                ),
-            ),
-        )
-    new_builds = {(meta.name(), meta.version(), meta.build_id()) for meta in metas}
+    builds = {(var.name, var.version, var.build_number) for var in variants}
+    existing = RepoData().get_package_data_many(
+        builds, "build", platform=["linux", "noarch"]
+    )
+    existing_builds = set(
+        existing[["name", "version", "build"]].itertuples(index=False, name=None)
+    )
+    new_builds = {(var.name, var.version, var.build_id) for var in variants}
     return new_builds.issuperset(existing_builds)
 
 
@@ -307,8 +421,8 @@ allowed_build_string_characters = frozenset(
 )
 
 
-def has_invalid_build_string(meta: MetaData) -> bool:
-    build_string = meta.build_id()
+def has_invalid_build_string(variant: Variant) -> bool:
+    build_string = variant.build_id
     return not (
         build_string and set(build_string).issubset(allowed_build_string_characters)
     )
@@ -317,16 +431,18 @@ def has_invalid_build_string(meta: MetaData) -> bool:
 def check(
     recipe: Recipe,
     build_config: object,
-    keep_metas: bool = False,
     skip_variant_keys: AbstractSet[str] = frozenset(),
 ) -> tuple[State, Recipe]:
     """Determine if a given recipe should have its build number increments
     (bumped) due to a recent change in pinnings.
 
+    The recipe is rendered with `render_variants`, so conda-build is
+    only called if the recipe or the pinnings changed since the last
+    check.
+
     Args:
       recipe: The recipe to check
       build_config: conda build config object
-      keep_metas: If true, `Recipe.conda_release` is not called
       skip_variant_keys: Variant keys to skip a recipe for if they are used
 
     Returns:
@@ -334,7 +450,7 @@ def check(
     """
     try:
         logger.debug("Calling Conda to render %s", recipe)
-        maybe_metas = recipe.conda_render(config=build_config)
+        variants = render_variants(recipe, build_config)
         logger.debug("Finished rendering %s", recipe)
     except RecipeError as exc:
         logger.error(exc)
@@ -346,14 +462,13 @@ def check(
         )
         return State.FAIL, recipe
 
-    if maybe_metas is None:
+    if variants is None:
         logger.error(
             "Failed to render %s. Got 'None' from recipe.conda_render()", recipe
         )
         return State.FAIL, recipe
 
-    metas = [meta for meta, _, _ in maybe_metas]
-    if any(has_invalid_build_string(meta) for meta in metas):
+    if any(has_invalid_build_string(variant) for variant in variants):
         logger.error(
             "Failed to get build strings for %s with bypass_env_check. "
             "Probably needs build/skip instead of dep constraint.",
@@ -363,29 +478,27 @@ def check(
 
     flags = State(0)
     maybe_bump = False
-    for meta in metas:
-        if meta.skip() or skip_for_variants(meta, skip_variant_keys):
+    for variant in variants:
+        if variant.skip or skip_for_variants(variant, skip_variant_keys):
             flags |= State.SKIP
-        elif have_noarch_python_build_number(meta):
+        elif have_noarch_python_build_number(variant):
             flags |= State.HAVE_NOARCH_PYTHON
-        elif have_variant(meta):
+        elif have_variant(variant):
             flags |= State.HAVE
-        elif will_build_variant(meta):
+        elif will_build_variant(variant):
             flags |= State.BUMPED
         else:
             logger.info(
                 "Package %s=%s=%s missing!",
-                meta.name(),
-                meta.version(),
-                meta.build_id(),
+                variant.name,
+                variant.version,
+                variant.build_id,
             )
             maybe_bump = True
     if maybe_bump:
         # Skip bump if we only add to the build matrix.
-        if will_build_only_missing(metas):
+        if will_build_only_missing(variants):
             flags |= State.BUMPED
         else:
             flags |= State.BUMP
-    if not keep_metas:
-        recipe.conda_release()
     return flags, recipe
@@ -6,6 +6,7 @@ This module collects small pieces of code used throughout :py:mod:`bioconda_util
 
 import asyncio
 import aiofiles
+import atexit
 import contextlib
 import datetime
 import fnmatch
@@ -17,12 +18,13 @@ import re
 import subprocess as sp
 import sys
 import shutil
+import tempfile
 import json
 import queue
 import warnings
 import psutil
 
-from threading import Event, Thread
+from threading import Event, RLock, Thread
 from pathlib import PurePath
 from collections import Counter, defaultdict, namedtuple, deque
 from collections.abc import Iterable
@@ -32,6 +34,7 @@ from typing import Any, cast
 from collections.abc import Sequence, Collection
 from multiprocessing import Pool
 from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from yaspin import yaspin, Spinner
@@ -43,6 +46,7 @@ import diskcache
 from github import Github
 
 from importlib.resources import files, as_file
+import numpy as np
 import pandas as pd
 import tqdm as _tqdm
 import aiohttp
@@ -51,12 +55,19 @@ import yaml
 import jinja2
 from jinja2 import Environment, PackageLoader
 
+from . import fast_render, repodata_cache
+from .fast_render import PackageSummary
+from .recipe_cache import recipe_cache
+from .repodata_cache import DependsLists, FlatStringLists, NameIndex
+from .repodata_parser import RepodataParser, RunExportsIndex
+
 # FIXME(upstream): For conda>=4.7.0 initialize_logging is (erroneously) called
 #                  by conda.core.index.get_index which messes up our logging.
 # => Prevent custom conda logging init before importing anything conda-related.
 import conda.gateways.logging
 
 from conda_build import api
+from conda_build import utils as conda_build_utils
 from conda.exports import subdir as conda_subdir
 
 from jsonschema import validate
@@ -463,6 +474,47 @@ def sandboxed_env(env):
         os_environ.update(orig)
 
 
+@contextlib.contextmanager
+def run_exports_from_repodata(config):
+    """
+    Context manager making conda-build take run_exports from `RepoData`
+
+    To apply the run_exports of build/host dependencies, a finalized
+    render normally downloads those packages. Within this context,
+    conda-build reads them from the ``run_exports.json`` published by
+    the configured channels instead (see `RepoData.get_channeldata`).
+    Channels not publishing run_exports for the subdirs of **config**
+    fall back to the download.
+    """
+    platforms = [
+        platform
+        for platform in RepoData.platforms
+        if RepoData.platform2subdir(platform)
+        in (config.host_subdir, config.build_subdir, "noarch")
+    ]
+    orig_download_channeldata = conda_build_utils.download_channeldata
+
+    def download_channeldata(channel_url):
+        channel = getattr(channel_url, "canonical_name", str(channel_url))
+        try:
+            channeldata = RepoData().get_channeldata(channel, platforms)
+        except Exception:
+            logger.exception("Failed to load run_exports for %s", channel)
+            channeldata = None
+        if channeldata is None:
+            return {}
+        return channeldata
+
+    orig_use_channeldata = config.use_channeldata
+    config.use_channeldata = True
+    conda_build_utils.download_channeldata = download_channeldata
+    try:
+        yield
+    finally:
+        conda_build_utils.download_channeldata = orig_download_channeldata
+        config.use_channeldata = orig_use_channeldata
+
+
 def load_all_meta(recipe, config=None, finalize=True):
     """
     For each environment, yield the rendered meta.yaml.
@@ -472,8 +524,10 @@ def load_all_meta(recipe, config=None, finalize=True):
     finalize : bool
         If True, do a full conda-build render. Determines exact package builds
         of build/host dependencies. It involves costly dependency resolution
-        via conda and also download of those packages (to inspect possible
-        run_exports). For fast-running tasks like linting, set to False.
+        via conda. The run_exports of those packages are read from the
+        channels' run_exports.json (see `run_exports_from_repodata`) or,
+        where not published, by downloading them. For fast-running tasks
+        like linting, set to False.
     """
     if config is None:
         config = load_conda_build_config()
@@ -496,18 +550,22 @@ def load_all_meta(recipe, config=None, finalize=True):
     # py==27 the env check fails when evaluating `pin_compatible('numpy')` for
     # recipes that use a pinned `numpy` and also require `numpy>=1.17` but
     # actually skip py==27. Filtering out that variant beforehand avoids this.
+    # The run_exports of build/host dependencies are taken from the
+    # channels' run_exports.json where available (instead of downloading
+    # the packages).
     if finalize:
-        metas = [
-            meta
-            for non_finalized_meta in metas
-            for (meta, _, _) in api.render(
-                recipe,
-                config=config,
-                variants=non_finalized_meta.config.variant,
-                finalize=True,
-                bypass_env_check=False,
-            )
-        ]
+        with run_exports_from_repodata(config):
+            metas = [
+                meta
+                for non_finalized_meta in metas
+                for (meta, _, _) in api.render(
+                    recipe,
+                    config=config,
+                    variants=non_finalized_meta.config.variant,
+                    finalize=True,
+                    bypass_env_check=False,
+                )
+            ]
     return metas
 
 
@@ -528,8 +586,12 @@ def load_meta_fast(recipe: str, env=None):
 
     try:
         pth = os.path.join(recipe, "meta.yaml")
-        template = jinja_silent_undef.from_string(open(pth, encoding="utf-8").read())
-        meta = yaml.safe_load(template.render(env))
+        with open(pth, encoding="utf-8") as fdes:
+            text = fdes.read()
+        meta = recipe_cache.get("meta_fast", pth, text, env)
+        if meta is None:
+            meta = yaml.safe_load(jinja_silent_undef.from_string(text).render(env))
+            recipe_cache.set("meta_fast", pth, text, env, meta)
         return (meta, recipe)
     except Exception:
         raise ValueError(f"Problem inspecting {recipe}")
@@ -597,8 +659,10 @@ def load_first_metadata(recipe, config=None, finalize=True):
     finalize : bool
         If True, do a full conda-build render. Determines exact package builds
         of build/host dependencies. It involves costly dependency resolution
-        via conda and also download of those packages (to inspect possible
-        run_exports). For fast-running tasks like linting, set to False.
+        via conda. The run_exports of those packages are read from the
+        channels' run_exports.json (see `run_exports_from_repodata`) or,
+        where not published, by downloading them. For fast-running tasks
+        like linting, set to False.
     """
     metas = load_all_meta(recipe, config, finalize=finalize)
     if len(metas) > 0:
@@ -818,10 +882,19 @@ def threads_to_use():
 
 def parallel_iter(func, items, desc, *args, **kwargs):
     pfunc = partial(func, *args, **kwargs)
-    with Pool(threads_to_use()) as pool:
+    # Workers map the loaded repodata instead of each holding a copy
+    handle = RepoData.share_loaded()
+    initargs = (handle, recipe_cache.counters)
+    with Pool(threads_to_use(), _init_parallel_worker, initargs) as pool:
         yield from tqdm(pool.imap_unordered(pfunc, items), desc=desc, total=len(items))
 
 
+def _init_parallel_worker(handle, recipe_cache_counters):
+    """Initializes the worker processes of `parallel_iter`"""
+    RepoData.attach(handle)
+    recipe_cache.attach_stats(recipe_cache_counters)
+
+
 def format_link(uri, fmt: str, prefix: str = "", label: str = ""):
     if prefix:
         uri = f"{prefix}/{uri}"
@@ -955,14 +1028,20 @@ def check_recipe_skippable(recipe, check_channels):
     Return True if the same number of builds (per subdir) defined by the recipe
     are already in channel_packages.
     """
-    platform, metas = _load_platform_metas(recipe, finalize=False)
+    platform = RepoData.native_platform()
+    config = load_conda_build_config(platform=platform)
+    packages = fast_render.render(recipe, config)
+    if packages is None:
+        packages = [
+            PackageSummary.from_meta(meta)
+            for meta in load_all_meta(recipe, config=config, finalize=False)
+        ]
     # The recipe likely defined skip: True
-    if not metas:
+    if not packages:
         return True
     # If on CI, handle noarch.
     if os.environ.get("CI", None) == "true":
-        first_meta = metas[0]
-        if first_meta.get_value("build/noarch"):
+        if packages[0].noarch:
             if not platform.startswith("linux"):
                 logger.info(
                     "FILTER: only building %s on linux because it defines noarch.",
@@ -970,34 +1049,17 @@ def check_recipe_skippable(recipe, check_channels):
                 )
                 return True
 
-    packages = {
-        (meta.name(), meta.version(), int(meta.build_number() or 0)) for meta in metas
-    }
-    r = RepoData()
-    num_existing_pkg_builds = Counter(
-        (name, version, build_number, subdir)
-        for name, version, build_number in packages
-        for subdir in r.get_package_data(
-            "subdir",
-            name=name,
-            version=version,
-            build_number=build_number,
-            channels=check_channels,
-            native=True,
-        )
+    existing = RepoData().get_package_data_many(
+        {package[:3] for package in packages},
+        "subdir",
+        channels=check_channels,
+        native=True,
     )
+    num_existing_pkg_builds = Counter(existing.itertuples(index=False, name=None))
     if num_existing_pkg_builds == Counter():
         # No packages with same version + build num in channels: no need to skip
         return False
-    num_new_pkg_builds = Counter(
-        (
-            meta.name(),
-            meta.version(),
-            int(meta.build_number() or 0),
-            _meta_subdir(meta),
-        )
-        for meta in metas
-    )
+    num_new_pkg_builds = Counter(package[:4] for package in packages)
     if num_new_pkg_builds == num_existing_pkg_builds:
         logger.info(
             "FILTER: not building recipe %s because "
@@ -1019,18 +1081,21 @@ def _filter_existing_packages(metas, check_channels):
         pkg_build = (_meta_subdir(meta), meta.build_id())
         key_build_meta[pkg_key][pkg_build] = meta
 
-    r = RepoData()
-    for pkg_key, build_meta in key_build_meta.items():
-        existing_pkg_builds = set(
-            r.get_package_data(
-                ["subdir", "build"],
-                name=pkg_key[0],
-                version=pkg_key[1],
-                build_number=pkg_key[2],
-                channels=check_channels,
-                native=True,
-            )
+    existing = defaultdict(set)
+    for name, version, build_number, subdir, build in (
+        RepoData()
+        .get_package_data_many(
+            list(key_build_meta),
+            ["subdir", "build"],
+            channels=check_channels,
+            native=True,
         )
+        .itertuples(index=False, name=None)
+    ):
+        existing[name, version, build_number].add((subdir, build))
+
+    for pkg_key, build_meta in key_build_meta.items():
+        existing_pkg_builds = existing[pkg_key]
         for pkg_build, meta in build_meta.items():
             if pkg_build not in existing_pkg_builds:
                 new_metas.append(meta)
@@ -1043,7 +1108,7 @@ def _filter_existing_packages(metas, check_channels):
         # build on aarch64 machine, the `divergent_builds` will wrongly include the linux-64
         # one, we need to filter the non-native CPU architecture versions.
         native_pkg_builds = {
-            x for x in existing_pkg_builds if x.subdir in (conda_subdir, "noarch")
+            x for x in existing_pkg_builds if x[0] in (conda_subdir, "noarch")
         }
         for divergent_build in native_pkg_builds - set(build_meta.keys()):
             divergent_builds.add("-".join((pkg_key[0], pkg_key[1], divergent_build[1])))
@@ -1181,6 +1246,17 @@ class Progress:
         self.thread.join()
 
 
+#: Handle passed to worker processes to attach to the repodata of the parent
+#: (see `RepoData.share`)
+RepoDataHandle = namedtuple("RepoDataHandle", ("config", "path"))
+
+#: Package files added and removed since a snapshot (see `RepoData.diff`)
+RepoDataDelta = namedtuple("RepoDataDelta", ("added", "removed"))
+
+#: Response passed to `AsyncRequests.fetch` callbacks if request headers are given
+FetchResponse = namedtuple("FetchResponse", ("status", "headers", "content"))
+
+
 class AsyncRequests:
     """Download a bunch of files in parallel
 
@@ -1193,7 +1269,7 @@ class AsyncRequests:
     CONNECTIONS_PER_HOST = 4
 
     @classmethod
-    def fetch(cls, urls, descs, cb, datas):
+    def fetch(cls, urls, descs, cb, datas, headers=None, fds=None, retry=True):
         """Fetch data from URLs.
 
         This will use asyncio to manage a pool of connections at once, speeding
@@ -1206,6 +1282,18 @@ class AsyncRequests:
           descs: Matching list of descriptions (for progress display)
           cb: As each download is completed, data is passed through this function.
               Use to e.g. offload json parsing into download loop.
+          headers: Matching list of request header dicts. If given, **cb**
+              receives a `FetchResponse` instead of the content, and HTTP
+              error statuses are passed on instead of raising (once
+              retrying gave up on the non-permanent ones).
+          fds: Matching list of objects with ``write`` and ``reset``
+              methods (e.g. `RepodataParser`). Successfully downloaded data
+              is written to these (as it arrives) instead of passed to
+              **cb**. As a download may break off and be retried, ``reset``
+              is called before each attempt.
+          retry: Whether to retry on non-permanent HTTP error codes. If
+              not set and **headers** are given, these are passed on
+              right away.
         """
         try:
             loop = asyncio.get_event_loop()
@@ -1218,10 +1306,14 @@ class AsyncRequests:
             # Workaround the fact that asyncio's loop is marked as not-reentrant
             # (it is apparently easy to patch, but not desired by the devs,
             with ThreadPool(1) as pool:
-                res = pool.apply(cls.fetch, (urls, descs, cb, datas))
+                res = pool.apply(
+                    cls.fetch, (urls, descs, cb, datas, headers, fds, retry)
+                )
             return res
 
-        task = asyncio.ensure_future(cls.async_fetch(urls, descs, cb, datas))
+        task = asyncio.ensure_future(
+            cls.async_fetch(urls, descs, cb, datas, fds, headers, retry)
+        )
 
         try:
             loop.run_until_complete(task)
@@ -1233,13 +1325,17 @@ class AsyncRequests:
         return task.result()
 
     @classmethod
-    async def async_fetch(cls, urls, descs=None, cb=None, datas=None, fds=None):
+    async def async_fetch(
+        cls, urls, descs=None, cb=None, datas=None, fds=None, headers=None, retry=True
+    ):
         if descs is None:
             descs = []
         if datas is None:
             datas = []
         if fds is None:
             fds = []
+        if headers is None:
+            headers = []
         conn = aiohttp.TCPConnector(limit_per_host=cls.CONNECTIONS_PER_HOST)
         async with aiohttp.ClientSession(
             connector=conn,
@@ -1248,9 +1344,13 @@ class AsyncRequests:
         ) as session:
             coros = [
                 asyncio.ensure_future(
-                    cls._async_fetch_one(session, url, desc, cb, data, fd)
+                    cls._async_fetch_one(
+                        session, url, desc, cb, data, fd, header, retry
+                    )
+                )
+                for url, desc, data, fd, header in zip_longest(
+                    urls, descs, datas, fds, headers
                 )
-                for url, desc, data, fd in zip_longest(urls, descs, datas, fds)
             ]
             with tqdm(
                 asyncio.as_completed(coros),
@@ -1271,12 +1371,25 @@ class AsyncRequests:
             and ex.status not in [429, 502, 503, 504]
         ),
     )
-    async def _async_fetch_one(session, url, desc, cb=None, data=None, fd=None):
+    async def _async_fetch_one(
+        session, url, desc, cb=None, data=None, fd=None, headers=None, retry=True
+    ):
         result = []
+        status, resp_headers = 200, {}
+        if fd is not None:
+            # Discard what an attempt interrupted mid-body wrote
+            fd.reset()
         if url.startswith("file://"):
             if os.path.exists(url[7:]):
                 async with aiofiles.open(url[7:], mode="rb") as f:
-                    result.append(await f.read())
+                    while True:
+                        block = await f.read(1024 * 1024)
+                        if not block:
+                            break
+                        if fd is not None:
+                            fd.write(block)
+                        else:
+                            result.append(block)
             else:
                 subdir = url.split("/")[-2]
                 d = {
@@ -1286,10 +1399,18 @@ class AsyncRequests:
                     "removed": list(),
                     "repodata_version": 1,
                 }
-                result.append(json.dumps(d).encode("UTF-8"))
+                if fd is not None:
+                    fd.write(json.dumps(d).encode("UTF-8"))
+                else:
+                    result.append(json.dumps(d).encode("UTF-8"))
         else:
-            async with session.get(url, timeout=None) as resp:
-                resp.raise_for_status()
+            async with session.get(url, timeout=None, headers=headers) as resp:
+                status, resp_headers = resp.status, dict(resp.headers)
+                if headers is None or (retry and status in (429, 502, 503, 504)):
+                    resp.raise_for_status()
+                if status >= 300:
+                    # Don't pass error pages on as data
+                    fd = None
                 size = int(resp.headers.get("Content-Length", 0))
                 with tqdm(
                     total=size,
@@ -1305,21 +1426,35 @@ class AsyncRequests:
                         if not block:
                             break
                         progress.update(len(block))
-                        if fd:
+                        if fd is not None:
                             fd.write(block)
                         else:
                             result.append(block)
+        content = b"".join(result)
+        if headers is not None:
+            content = FetchResponse(status, resp_headers, content)
         if cb:
-            return cb(b"".join(result), data)
+            return cb(content, data)
         else:
-            return b"".join(result)
+            return content
 
 
 class RepoData:
     """Singleton providing access to package directory on anaconda cloud
 
     If the first call provides a filename as **cache** argument, the
-    file is used to cache the directory in CSV format.
+    file is used to cache the directory in the memory-mappable columnar
+    format implemented in `repodata_cache`.
+
+    The repodata of each **channel/subdir** is only loaded once a query
+    needs it (see `resident`). A query restricted to ``native=True``,
+    for example, never loads the repodata of the other platforms.
+    Queries passing ``latest=True`` are content with the packages listed
+    in the much smaller current_repodata.json (see `resident_current`).
+
+    `get_package_data` and `get_versions` are answered by one of the
+    `ENGINES` (see `set_engine`). The ``compact`` engine works on the
+    columns of the index directly and never builds a DataFrame.
 
     Data structure:
 
@@ -1343,8 +1478,11 @@ class RepoData:
       number. Used to distinguish different builds of the same
       package/version combination.
 
-    depends: Runtime requirements for package as list of strings. We
-      do not currently load this.
+    depends: Runtime requirements for package as list of strings. These
+      are held outside of the DataFrame, split into dependency name and
+      constraint (see `DependsLists`), and only expanded for the rows a
+      query returns. Query ``parsed_depends`` to get them as (name,
+      constraint) tuples, or use `get_dependents` for reverse lookups.
 
     arch: Architecture key (x86_64). Not used by conda and not loaded
       here.
@@ -1382,11 +1520,51 @@ class RepoData:
     config = None
 
     cache_file = None
-    _df = None
+    #: The loaded `repodata_cache.CachedFrame` (scalar columns)
+    _data: repodata_cache.CachedFrame | None = None
     _df_ts = None
+    #: List columns not kept in `_data` (rows aligned with those of
+    #: `_data`). Set per instance with `_data` by `_set_data`.
+    _lists: dict[str, FlatStringLists] | None = None
+    #: Tuple of `_data` and the `NameIndex` for it
+    _name_index: tuple[repodata_cache.CachedFrame, NameIndex] | None = None
+    #: The (channel, platform) shards loaded into `_data` and those of
+    #: them loaded from the current_repodata.json only (set with `_data`
+    #: by `_set_data`)
+    _resident: tuple[frozenset[tuple[str, str]], frozenset[tuple[str, str]]] = (
+        frozenset(),
+        frozenset(),
+    )
+    #: Held while loading, so that queries wait for a running `prefetch`
+    _lock = RLock()
+    #: Tuple of `_data` and the `RepoDataHandle` it was shared as
+    _shared: tuple[repodata_cache.CachedFrame, RepoDataHandle] | None = None
+    #: Path of the snapshot in use (see `load_snapshot`)
+    _snapshot: str | None = None
+    #: Tuple of `RunExportsIndex` and, for each (channel, platform) shard
+    #: loaded into it, whether the channel publishes run_exports there
+    _run_exports: tuple[RunExportsIndex, dict[tuple[str, str], bool]] | None = None
 
     #: default lifetime for repodata cache
     cache_timeout = 60 * 60 * 8
+    #: Directory for the per channel/subdir caches used to refresh
+    #: repodata incrementally (see `repodata_cache.ShardCache`).
+    #: Set to None to always download the full repodata.
+    shard_cache_dir = os.path.join(
+        platformdirs.user_cache_dir("bioconda-utils"), "repodata"
+    )
+    #: Seconds before checking again for a jlap feed where there was none
+    jlap_retry_timeout = 60 * 60 * 24 * 7
+    #: Seconds during which a shard refreshed (by any process) is used
+    #: without asking the server again
+    shard_reuse_timeout = 60 * 5
+    #: Load the much smaller current_repodata.json (holding only the
+    #: latest packages) for queries passing ``latest=True``
+    use_current_repodata = True
+    #: Engines available to answer `get_package_data` and `get_versions`
+    ENGINES = ("pandas", "compact")
+    #: The engine in use (see `set_engine`)
+    engine = "pandas"
 
     @classmethod
     def register_config(cls, config):
@@ -1404,11 +1582,28 @@ class RepoData:
         return RepoData.__instance
 
     def set_cache(self, cache):
-        if self._df is not None:
+        if self._data is not None:
             warnings.warn("RepoData cache set after first use", BiocondaUtilsWarning)
         else:
             self.cache_file = cache
 
+    def set_engine(self, engine):
+        """Select the engine answering `get_package_data` and `get_versions`
+
+        Both engines share the loaded index and return the same results.
+        ``pandas`` filters DataFrames of the rows a query looks at (and
+        of all rows for queries not giving a name). ``compact`` filters
+        the arrays of codes into the string tables of the index and only
+        decodes the values returned. It is faster for short commands
+        doing a few lookups and uses less memory for queries over all
+        packages.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(
+                f"Unknown RepoData engine {engine!r} (use one of {', '.join(self.ENGINES)})"
+            )
+        self.engine = engine
+
     @property
     def channels(self):
         """Return channels to load."""
@@ -1420,17 +1615,223 @@ class RepoData:
         """Internal Pandas DataFrame object
 
         Try not to use this ... the point of this class is to be able to
-        change the structure in which the data is held.
+        change the structure in which the data is held. In particular,
+        the ``depends`` column is not part of this DataFrame.
+
+        Accessing this loads the repodata for all channels and platforms
+        and decodes the strings of all rows.
         """
-        if self._df_ts is not None:
-            seconds = (datetime.datetime.now() - self._df_ts).seconds
-        else:
-            seconds = 0
+        return self._get_data(self._select_repos()).df
+
+    @property
+    def resident(self):
+        """Set of (channel, platform) shards currently loaded"""
+        if self._data is None:
+            return frozenset()
+        return self._resident[0]
+
+    @property
+    def resident_current(self):
+        """Set of (channel, platform) shards loaded with latest packages only
+
+        These were loaded from the current_repodata.json for queries
+        passing ``latest=True``. Other queries load the full repodata for
+        them.
+        """
+        if self._data is None:
+            return frozenset()
+        return self._resident[1]
+
+    def load(self, channels=None, platforms=None):
+        """Make sure the repodata for **channels** and **platforms** is loaded
+
+        Queries load what they need on demand. Use this to load data
+        before forking worker processes.
+        """
+        self._get_data(self._select_repos(channels, platforms))
+
+    def prefetch(self, channels=None, platforms=None):
+        """Start loading repodata for **channels** and **platforms** in the background
+
+        Queries block only if they need data while the load is still
+        running. Call `load` before forking worker processes, so that
+        the workers inherit the loaded data.
+
+        Returns:
+          `concurrent.futures.Future` of the load
+        """
+        repos = self._select_repos(channels, platforms)
+        executor = ThreadPoolExecutor(1, thread_name_prefix="repodata-prefetch")
+        future = executor.submit(self._get_data, repos)
+        executor.shutdown(wait=False)
+
+        def log_failure(done):
+            if done.exception() is not None:
+                logger.warning("Prefetching repodata failed: %s", done.exception())
+
+        future.add_done_callback(log_failure)
+        return future
+
+    def share(self):
+        """Publish the loaded repodata for use by worker processes
 
-        if self._df is None or seconds > self.cache_timeout:
-            self._df = self._load_channel_dataframe_cached()
-            self._df_ts = datetime.datetime.now()
-        return self._df
+        The data is written to a private memory-mappable file, which
+        this process switches to as well. Workers calling `attach` with
+        the returned handle map the same file, so that all processes
+        share one copy of the data in the page cache.
+
+        Does not wait for a running `prefetch` (or other load): the
+        workers then load what they need themselves.
+
+        Returns:
+          `RepoDataHandle`, or None if no data has been loaded or a load
+          is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.debug("Not sharing repodata while it is being loaded")
+            return None
+        try:
+            if self._data is None:
+                return None
+            if self._shared is not None and self._shared[0] is self._data:
+                return self._shared[1]
+            fdes, path = tempfile.mkstemp(prefix="bioconda-repodata-", suffix=".col")
+            os.close(fdes)
+            atexit.register(_remove_file, path)
+            data, index = self._get_name_index(self.resident)
+            meta = {
+                "repos": sorted(self.resident),
+                "current": sorted(self.resident_current),
+                "timestamp": self._df_ts.timestamp(),
+                "snapshot": self._snapshot,
+            }
+            repodata_cache.write_columns(
+                path,
+                len(data),
+                data.columns,
+                self._lists,
+                meta=meta,
+                arrays={"name_offsets": index.offsets},
+            )
+            self._set_data(repodata_cache.read_frame(path))
+            handle = RepoDataHandle(self.config, path)
+            self._shared = self._data, handle
+            return handle
+        finally:
+            self._lock.release()
+
+    @classmethod
+    def share_loaded(cls):
+        """Calls `share` if the singleton exists (and returns None otherwise)"""
+        if cls.__instance is None:
+            return None
+        return cls().share()
+
+    @classmethod
+    def attach(cls, handle):
+        """Use repodata published by `share` (e.g. as pool initializer)
+
+        Does nothing if **handle** is None or already attached.
+        """
+        if handle is None:
+            return
+        cls.register_config(handle.config)
+        repo = cls()
+        with repo._lock:
+            if (
+                repo._shared is not None
+                and repo._shared[0] is repo._data
+                and repo._shared[1] == handle
+            ):
+                return
+            cached = repodata_cache.read_frame(handle.path)
+            repo._set_data(cached)
+            repo._snapshot = cached.meta.get("snapshot")
+            repo._shared = repo._data, handle
+
+    @classmethod
+    def _after_fork(cls):
+        # A prefetch running in the parent (holding the lock) does not
+        # exist in the child
+        cls._lock = RLock()
+
+    def _select_repos(self, channels=None, platforms=None):
+        """Returns the (channel, platform) shards a query needs to look at
+
+        Args:
+          channels: Channel or list of channels (all configured if None)
+          platforms: Platform or list of platforms (all loaded if None)
+        """
+
+        def select(values, available):
+            if values is None:
+                return available
+            if isinstance(values, str):
+                values = [values]
+            return [value for value in available if value in values]
+
+        return list(
+            product(select(channels, self.channels), select(platforms, self.platforms))
+        )
+
+    def _get_data(self, repos, latest=False):
+        """Returns the `repodata_cache.CachedFrame`, making sure the shards
+        **repos** are loaded
+
+        If **latest** is set, shards not yet loaded are loaded from the
+        current_repodata.json if possible.
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                missing = set(repos).difference(self.resident)
+                if missing:
+                    logger.debug(
+                        "Shards %s are not in repodata snapshot %s",
+                        ", ".join(f"{c}/{p}" for c, p in sorted(missing)),
+                        self._snapshot,
+                    )
+                return self._data
+            if self._df_ts is not None:
+                seconds = (datetime.datetime.now() - self._df_ts).seconds
+                if seconds > self.cache_timeout:
+                    self._data = None
+
+            resident = self.resident
+            current = []
+            if latest and self.use_current_repodata:
+                current = [
+                    repo
+                    for repo in repos
+                    if repo not in resident and repo not in self.resident_current
+                ]
+                repos = []
+            if self._data is None or current or not resident.issuperset(repos):
+                self._set_data(self._load_channel_dataframe_cached(repos, current))
+            return self._data
+
+    def _set_data(self, cached):
+        """Use the `repodata_cache.CachedFrame` **cached**"""
+        self._data, self._lists = cached, cached.lists
+        if cached.name_index is not None:
+            self._name_index = cached, cached.name_index
+        self._resident = (
+            frozenset(tuple(repo) for repo in cached.meta["repos"]),
+            frozenset(tuple(repo) for repo in cached.meta.get("current", ())),
+        )
+        self._df_ts = datetime.datetime.fromtimestamp(cached.meta["timestamp"])
+
+    def _get_name_index(
+        self, repos=None, latest=False
+    ) -> tuple[repodata_cache.CachedFrame, NameIndex]:
+        """Returns the `repodata_cache.CachedFrame` and its `NameIndex`
+
+        Args:
+          repos: The (channel, platform) shards that need to be loaded
+                 (all if None)
+          latest: Whether the latest packages of the shards suffice
+        """
+        self._get_data(self._select_repos() if repos is None else repos, latest=latest)
+        return self._name_index
 
     def _make_repodata_url(self, channel, platform):
         if channel == "defaults":
@@ -1450,60 +1851,386 @@ class RepoData:
             )
         return url
 
-    def _load_channel_dataframe_cached(self):
-        if self.cache_file is not None and os.path.exists(self.cache_file):
-            ts = datetime.datetime.fromtimestamp(os.path.getmtime(self.cache_file))
-            seconds = (datetime.datetime.now() - ts).seconds
-            if seconds <= self.cache_timeout:
-                logger.info("Loading repodata from cache %s", self.cache_file)
-                return pd.read_pickle(self.cache_file)
-            else:
-                logger.info("Repodata cache file too old. Reloading")
+    def _load_channel_dataframe_cached(self, repos, current=()):
+        """Load shards **repos** in addition to those already resident
 
-        res = self._load_channel_dataframe()
+        The result is sorted by name and, if a cache file was set,
+        written to it together with the list of shards it contains.
+        Reading, loading and writing the cache file happen under a file
+        lock, so that concurrent processes load each shard only once.
+
+        Args:
+          repos: Shards to load completely
+          current: Shards for which the current_repodata.json suffices
 
+        Returns:
+          `repodata_cache.CachedFrame`
+        """
+        lock = contextlib.nullcontext()
         if self.cache_file is not None:
-            res.to_pickle(self.cache_file)
-        return res
-
-    def _load_channel_dataframe(self):
-        repos = list(product(self.channels, self.platforms))
-        urls = [self._make_repodata_url(c, p) for c, p in repos]
-        descs = [f"{c}/{p}" for c, p in repos]
-
-        def to_dataframe(json_data, meta_data):
-            channel, platform = meta_data
-            repo = json.loads(json_data)
-            subdir = repo["info"]["subdir"]
-            packages = repo["packages"]
-            packages.update(repo.get("packages.conda", {}))
-
-            df = pd.DataFrame.from_dict(packages, "index", columns=self._load_columns)
-            # Ensure that version is always a string.
-            df["version"] = df["version"].astype(str)
-            df["channel"] = channel
-            df["platform"] = platform
-            df["subdir"] = subdir
-            return df
+            # Other processes wait while the cache file is written, then
+            # find the shards they need in it
+            lock = repodata_cache.file_lock(self.cache_file + ".lock")
+        with lock:
+            base = self._data
+            if (
+                base is None
+                and self.cache_file is not None
+                and os.path.exists(self.cache_file)
+            ):
+                try:
+                    base = repodata_cache.read_frame(self.cache_file)
+                except repodata_cache.CacheFormatError:
+                    base = None
+                if base is None or base.name_index is None or "repos" not in base.meta:
+                    logger.info("Repodata cache file has old format. Reloading")
+                    base = None
+                else:
+                    ts = datetime.datetime.fromtimestamp(base.meta["timestamp"])
+                    if (datetime.datetime.now() - ts).seconds > self.cache_timeout:
+                        logger.info("Repodata cache file too old. Reloading")
+                        base = None
+                if base is not None:
+                    logger.info("Loading repodata from cache %s", self.cache_file)
+
+            resident, resident_current = set(), set()
+            if base is not None:
+                resident = {tuple(repo) for repo in base.meta["repos"]}
+                resident_current = {
+                    tuple(repo) for repo in base.meta.get("current", ())
+                }
+            missing = [repo for repo in repos if repo not in resident]
+            missing_current = [
+                repo
+                for repo in current
+                if repo not in resident and repo not in resident_current
+            ]
+            if base is not None and not missing and not missing_current:
+                return base
+
+            frames = []
+            if base is not None:
+                # Shards loaded from current_repodata.json are replaced
+                upgraded = [repo for repo in missing if repo in resident_current]
+                frames.append(self._drop_shards(base.df, base.lists, upgraded))
+                resident_current.difference_update(upgraded)
+            if missing_current:
+                logger.info(
+                    "Loading current repodata for %s",
+                    ", ".join(f"{c}/{p}" for c, p in missing_current),
+                )
+                frame, unavailable = self._load_current_dataframe(missing_current)
+                if frame is not None:
+                    frames.append(frame)
+                resident_current.update(
+                    repo for repo in missing_current if repo not in unavailable
+                )
+                missing.extend(unavailable)
+            if missing or not frames:
+                logger.info(
+                    "Loading repodata for %s", ", ".join(f"{c}/{p}" for c, p in missing)
+                )
+                frames.append(self._load_channel_dataframe(missing))
+            res, lists = repodata_cache.concat_frames(frames)
+            res, lists, index = repodata_cache.sort_by_name(res, lists)
+            lists["depends"] = DependsLists.from_flat(lists["depends"])
+            arrays = {"name_offsets": index.offsets}
+            meta = {
+                "repos": sorted(resident.union(missing)),
+                "current": sorted(resident_current),
+                "timestamp": base.meta["timestamp"]
+                if base is not None
+                else datetime.datetime.now().timestamp(),
+            }
+
+            if self.cache_file is not None:
+                repodata_cache.write_frame(
+                    self.cache_file, res, lists, meta=meta, arrays=arrays
+                )
+                # Continue with the memory-mapped copy, so that the heap copy
+                # is released and other processes can share our pages.
+                return repodata_cache.read_frame(self.cache_file)
+            return repodata_cache.CachedFrame(res, lists, arrays, meta)
+
+    @staticmethod
+    def _drop_shards(df, lists, repos):
+        """Returns **df** and **lists** without the rows of shards **repos**"""
+        if not repos:
+            return df, lists
+        keep = pd.Series(True, index=df.index)
+        for channel, plat in repos:
+            keep &= (df["channel"] != channel) | (df["platform"] != plat)
+        rows = keep.to_numpy().nonzero()[0]
+        return (
+            df.iloc[rows].reset_index(drop=True),
+            {key: values.reorder(rows) for key, values in lists.items()},
+        )
+
+    def _load_current_dataframe(self, repos):
+        """Load the current_repodata.json for (channel, platform) shards **repos**
 
+        Returns:
+          DataFrame and dict of list columns (None if nothing was
+          loaded), and the list of shards for which the channel provides
+          no current_repodata.json
+        """
+        unavailable, fetch, urls = [], [], []
+        for repo in repos:
+            url = self._make_repodata_url(*repo).rsplit("/", 1)[0]
+            url += "/current_repodata.json"
+            if url.startswith("file://") and not os.path.exists(url[7:]):
+                unavailable.append(repo)
+                continue
+            fetch.append(repo)
+            urls.append(url)
+
+        def to_frame(response, repo):
+            if response.status != 200:
+                return repo, None
+            parser = RepodataParser()
+            parser.write(response.content)
+            parser.finish()
+            return repo, self._parse_repodata(parser, *repo)
+
+        frames = {}
         if urls:
-            dfs = AsyncRequests.fetch(urls, descs, to_dataframe, repos)
-            res = pd.concat(dfs)
-        else:
-            res = pd.DataFrame(columns=self.columns)
-
-        for col in (
-            "channel",
-            "platform",
-            "subdir",
-            "name",
-            "version",
-            "build",
+            frames = dict(
+                AsyncRequests.fetch(
+                    urls,
+                    [f"{c}/{p} current" for c, p in fetch],
+                    to_frame,
+                    fetch,
+                    [{} for _ in urls],
+                )
+            )
+        unavailable.extend(repo for repo in fetch if frames[repo] is None)
+        loaded = [frame for frame in frames.values() if frame is not None]
+        if not loaded:
+            return None, unavailable
+        return repodata_cache.concat_frames(loaded), unavailable
+
+    @staticmethod
+    def _parse_repodata(parser, channel, platform):
+        """Make DataFrame and list columns from a finished `RepodataParser`"""
+        df, lists = parser.to_frame()
+        for col, value in (
+            ("channel", channel),
+            ("platform", platform),
+            ("subdir", parser.info["subdir"]),
         ):
-            res[col] = res[col].astype("category")
-        res = res.reset_index(drop=True)
+            df[col] = pd.Series(value, index=df.index, dtype="category")
+        return df, lists
+
+    def _update_shards_from_jlap(self, shards, cached):
+        """Bring cached shards up to date using the channels' jlap feeds
+
+        Args:
+          shards: Dict mapping (channel, platform) to `ShardCache`
+          cached: Dict mapping (channel, platform) to the `CachedFrame`
+                  loaded from the shard
+
+        Returns:
+          Dict mapping (channel, platform) to DataFrame and list columns
+          for each shard that is now current.
+        """
+        now = datetime.datetime.now().timestamp()
+        repos = [
+            repo
+            for repo in cached
+            if now - shards[repo].state.get("jlap_missing", 0) > self.jlap_retry_timeout
+        ]
+        urls = [
+            self._make_repodata_url(*repo).removesuffix(".json") + ".jlap"
+            for repo in repos
+        ]
+        descs = [f"{c}/{p} (jlap)" for c, p in repos]
+        headers = [
+            {"Range": f"bytes={shards[repo].state['jlap_pos']}-"}
+            if "jlap_iv" in shards[repo].state
+            else {}
+            for repo in repos
+        ]
 
-        return res
+        def apply_patches(response, repo):
+            shard = shards[repo]
+            state = shard.state
+            if response.status >= 400 and response.status != 416:
+                # No feed (for now): use a conditional full download
+                logger.debug("No jlap feed for %s/%s (%i)", *repo, response.status)
+                if response.status < 500:
+                    state["jlap_missing"] = now
+                    shard.save_state()
+                return repo, None
+            try:
+                if response.status == 206:
+                    feed = repodata_cache.JlapFeed.parse(
+                        response.content, state["jlap_pos"], state["jlap_iv"]
+                    )
+                elif response.status == 200:
+                    feed = repodata_cache.JlapFeed.parse(response.content)
+                else:
+                    feed = None
+            except repodata_cache.CacheFormatError as exc:
+                logger.info("Ignoring jlap feed for %s/%s: %s", *repo, exc)
+                feed = None
+            if feed is None:
+                state.pop("jlap_pos", None)
+                state.pop("jlap_iv", None)
+                shard.save_state()
+                return repo, None
+            state["jlap_pos"], state["jlap_iv"] = feed.pos, feed.iv
+            chain = feed.patch_chain(state["hash"])
+            if chain is None:
+                # Feed does not reach back far enough. Needs full download.
+                shard.save_state()
+                return repo, None
+            if not chain:
+                shard.save_state()
+                return repo, (cached[repo].df, cached[repo].lists)
+            try:
+                repodata = json.loads(shard.read_raw())
+                for patch in chain:
+                    repodata = repodata_cache.apply_json_patch(repodata, patch["patch"])
+            except ValueError as exc:
+                logger.info("Failed to patch %s/%s: %s", *repo, exc)
+                shard.save_state()
+                return repo, None
+            shard.store_raw(
+                json.dumps(repodata).encode("utf-8"), {}, repodata_hash=feed.latest
+            )
+            parser = RepodataParser()
+            parser.add_repodata(repodata)
+            frame = self._parse_repodata(parser, *repo)
+            shard.store_frame(*frame)
+            shard.save_state()
+            logger.info("Applied %i patches to %s/%s", len(chain), *repo)
+            return repo, frame
+
+        if not urls:
+            return {}
+        try:
+            results = AsyncRequests.fetch(
+                urls, descs, apply_patches, repos, headers, retry=False
+            )
+        except (aiohttp.ClientError, TimeoutError) as exc:
+            logger.info("Failed to fetch jlap feeds: %s", exc)
+            return {}
+        return {repo: frame for repo, frame in results if frame is not None}
+
+    def _load_channel_dataframe(self, repos=None):
+        """Load repodata for (channel, platform) shards **repos** (default all)
+
+        Where possible, cached repodata is refreshed using jlap patch
+        feeds or conditional requests, reusing the already parsed rows
+        of unchanged subdirs.
+
+        Returns:
+          DataFrame (with categorical columns) and dict of list columns
+        """
+        if repos is None:
+            repos = self._select_repos()
+        shards = {}
+        if self.shard_cache_dir is not None:
+            for channel, platform in repos:
+                if not channel.startswith("file://"):
+                    shards[channel, platform] = repodata_cache.ShardCache(
+                        self.shard_cache_dir, channel, self.platform2subdir(platform)
+                    )
+        # Only one process refreshes a shard, others wait for the result
+        with contextlib.ExitStack() as locks:
+            for shard in sorted(shards.values(), key=lambda shard: shard.path):
+                locks.enter_context(shard.lock())
+            return self._load_shards(repos, shards)
+
+    def _load_shards(self, repos, shards):
+        """Load repodata for **repos**, refreshing the locked **shards**"""
+        now = datetime.datetime.now().timestamp()
+        cached, fresh = {}, {}
+        for repo, shard in shards.items():
+            frame = shard.load_frame()
+            if frame is None:
+                continue
+            if now - shard.state.get("checked", 0) < self.shard_reuse_timeout:
+                fresh[repo] = frame.df, frame.lists
+            else:
+                cached[repo] = frame
+
+        frames = self._update_shards_from_jlap(shards, cached)
+        frames.update(fresh)
+
+        remaining = [repo for repo in repos if repo not in frames]
+        urls = [self._make_repodata_url(c, p) for c, p in remaining]
+        descs = [f"{c}/{p}" for c, p in remaining]
+        headers = [
+            shards[repo].request_headers() if repo in cached else {}
+            for repo in remaining
+        ]
+
+        # Downloads are parsed as they arrive (and copied to the shard cache)
+        parsers, tmp_paths = {}, {}
+        for repo in remaining:
+            raw = None
+            if repo in shards:
+                raw, tmp_paths[repo] = shards[repo].open_raw_tempfile()
+            parsers[repo] = RepodataParser(raw)
+
+        def to_frame(response, repo):
+            parser = parsers[repo]
+            if parser.raw is not None:
+                parser.raw.close()
+            if response.status == 304 and repo in cached:
+                return repo, (cached[repo].df, cached[repo].lists)
+            if response.status != 200:
+                raise ValueError(
+                    f"Unexpected HTTP status {response.status} "
+                    f"loading repodata for {repo[0]}/{repo[1]}"
+                )
+            parser.finish()
+            frame = self._parse_repodata(parser, *repo)
+            if repo in shards:
+                shard = shards[repo]
+                shard.replace_raw(tmp_paths.pop(repo), parser.hash, response.headers)
+                shard.store_frame(*frame)
+                shard.save_state()
+            return repo, frame
+
+        try:
+            if urls:
+                frames.update(
+                    AsyncRequests.fetch(
+                        urls,
+                        descs,
+                        to_frame,
+                        remaining,
+                        headers,
+                        [parsers[repo] for repo in remaining],
+                    )
+                )
+        finally:
+            for parser in parsers.values():
+                if parser.raw is not None:
+                    parser.raw.close()
+            for tmp_path in tmp_paths.values():
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        for repo in frames:
+            if repo in shards and repo not in fresh:
+                shards[repo].state["checked"] = now
+                shards[repo].save_state()
+        logger.info(
+            "Reusing parsed repodata for %i of %i subdirs",
+            sum(
+                repo in cached and frames[repo][0] is cached[repo].df for repo in frames
+            ),
+            len(frames),
+        )
+        if not frames:
+            df = pd.DataFrame(
+                {col: pd.Categorical([]) for col in self.columns if col != "depends"}
+            )
+            df["build_number"] = df["build_number"].astype("int64")
+            return df, {"depends": FlatStringLists.from_lists([])}
+        return repodata_cache.concat_frames([frames[repo] for repo in repos])
 
     @staticmethod
     def native_platform():
@@ -1546,11 +2273,16 @@ class RepoData:
           e.g. {'0.1': ['linux'], '0.2': ['linux', 'osx'], '0.3': ['noarch']}
         """
         # called from doc generator
-        packages = self.df[self.df.name == name][["version", "platform"]]
-        versions = packages.groupby("version", observed=True).agg(
-            lambda x: list(set(x))
-        )
-        return versions["platform"].to_dict()
+        data, index = self._get_name_index()
+        if self.engine == "compact":
+            rows = np.arange(*index.get(name).indices(len(data)))
+            packages = {col: data.values(rows, col) for col in ("version", "platform")}
+        else:
+            packages = data.take(index.get(name), ["version", "platform"])
+        versions = defaultdict(set)
+        for version, plat in zip(packages["version"], packages["platform"]):
+            versions[version].add(plat)
+        return {version: list(platforms) for version, platforms in versions.items()}
 
     def get_package_data(
         self,
@@ -1562,45 +2294,473 @@ class RepoData:
         platform=None,
         build=None,
         native=False,
+        latest=False,
     ):
         """Get **key** for each package in **channels**
 
         If **key** is not give, returns bool whether there are matches.
-        If **key** is a string, returns list of strings.
+        If **key** is a string, returns a numpy array of values.
         If **key** is a list of string, returns tuple iterator.
+
+        Packages are located by **name** through an index, so queries
+        specifying a name only look at the packages of that name.
+
+        Only the repodata for the **channels** and **platform** queried
+        is loaded (if it has not been loaded already).
+
+        Set **latest** if only the presence of packages or their latest
+        versions matter. Shards not loaded yet are then loaded from the
+        much smaller current_repodata.json (see `resident_current`).
+        Queries for a specific **version**, **build** or
+        **build_number** always use the full repodata.
         """
         if native:
             platform = ["noarch", self.native_platform()]
 
         if version is not None:
             version = str(version)
+        if version is not None or build is not None or build_number is not None:
+            latest = False
+
+        filters = [
+            (col, val)
+            for col, val in (
+                ("build", build),  # build string should vary a lot
+                ("version", version),  # still pretty good variety
+                ("channel", channels),  # 3 values
+                ("platform", platform),  # 3 values
+                ("build_number", build_number),  # most values 0
+            )
+            if val is not None
+        ]
+        keys = [] if key is None else [key] if isinstance(key, str) else key
+        columns = ["name", *(col for col, _ in filters), *keys]
 
-        df = self.df
+        data, index = self._get_name_index(
+            self._select_repos(channels, platform), latest=latest
+        )
+        if self.engine == "compact":
+            return self._get_package_data_compact(data, index, name, filters, key)
+        if name is None:
+            df = data.df
+        elif isinstance(name, (list, tuple)):
+            df = data.take(index.take(name), columns)
+        else:
+            df = data.take(index.get(name), columns)
         # We iteratively drill down here, starting with the (probably)
         # most specific columns. Filtering this way on a large data frame
         # is much faster than executing the comparisons for all values
-        # every time, in particular if we are looking at a specific package.
-        for col, val in (
-            ("name", name),  # thousands of different values
-            ("build", build),  # build string should vary a lot
-            ("version", version),  # still pretty good variety
-            ("channel", channels),  # 3 values
-            ("platform", platform),  # 3 values
-            ("build_number", build_number),  # most values 0
-        ):
-            if val is None:
-                continue
-            if isinstance(val, list) or isinstance(val, tuple):
+        # every time.
+        for col, val in filters:
+            if isinstance(val, (list, tuple)):
                 df = df[df[col].isin(val)]
             else:
                 df = df[df[col] == val]
 
         if key is None:
             return not df.empty
+        df = self._with_list_columns(df, keys)
         if isinstance(key, str):
-            return list(df[key])
+            return df[key].to_numpy()
         return df[key].itertuples(index=False)
 
+    def _get_package_data_compact(self, data, index, name, filters, key):
+        """`get_package_data` working on the columns of **data**
+
+        Args:
+          data: The `repodata_cache.CachedFrame` to look at
+          index: Its `NameIndex`
+          name: Package name or list of names (all packages if None)
+          filters: List of (column, value or list of values) to match
+          key: As for `get_package_data`
+        """
+        if name is None:
+            rows = np.arange(len(data), dtype=np.int64)
+        elif isinstance(name, (list, tuple)):
+            rows = index.take(name)
+        else:
+            rows = np.arange(*index.get(name).indices(len(data)), dtype=np.int64)
+        # Narrowed down in the same order as by the pandas engine
+        for col, val in filters:
+            rows = data.select(
+                rows, col, val if isinstance(val, (list, tuple)) else [val]
+            )
+
+        if key is None:
+            return len(rows) > 0
+        if isinstance(key, str):
+            return self._column_values(data, rows, key)
+        return zip(*(self._column_values(data, rows, col) for col in key))
+
+    def _column_values(self, data, rows, key):
+        """Returns the values of column **key** for **rows** of **data**
+
+        Like `_with_list_columns`, this covers the list columns and
+        ``parsed_depends``.
+        """
+        if key in self._lists:
+            values = self._lists[key].take(rows)
+        elif key == "parsed_depends":
+            depends = self._get_depends()
+            values = [depends.parsed(row) for row in rows]
+        else:
+            return data.values(rows, key)
+        result = np.empty(len(values), dtype=object)
+        result[:] = values
+        return result
+
+    def get_package_data_many(
+        self,
+        keys,
+        key=None,
+        on=("name", "version", "build_number"),
+        channels=None,
+        platform=None,
+        native=False,
+    ):
+        """Get **key** for the packages matching any of **keys**
+
+        This is the batch version of `get_package_data`. All keys are
+        matched in one join instead of one query per key.
+
+        Args:
+          keys: DataFrame with columns to match on (which must include
+                ``name``) or iterable of tuples with the fields in **on**
+          key: Column or list of columns to return (in addition to those
+               matched on)
+          on: Names of the fields in **keys** if it is not a DataFrame
+          channels: Channel or list of channels to look at
+          platform: Platform or list of platforms to look at
+          native: Only look at noarch and the native platform
+
+        Returns:
+          DataFrame with one row per matching package, holding the columns
+          matched on followed by the **key** columns.
+        """
+        if not isinstance(keys, pd.DataFrame):
+            keys = pd.DataFrame(list(keys), columns=list(on))
+        on = list(keys.columns)
+        if "name" not in on:
+            raise ValueError("Keys for get_package_data_many must include the name")
+        columns = [] if key is None else [key] if isinstance(key, str) else list(key)
+        columns = [col for col in columns if col not in on]
+
+        if native:
+            platform = ["noarch", self.native_platform()]
+
+        keys = keys.drop_duplicates()
+        if "version" in on:
+            keys["version"] = keys["version"].astype(str)
+        if "build_number" in on:
+            keys["build_number"] = keys["build_number"].astype("int64")
+
+        data, index = self._get_name_index(self._select_repos(channels, platform))
+        df = data.take(
+            index.take(keys["name"].unique()), [*on, *columns, "channel", "platform"]
+        )
+        for col, val in (("channel", channels), ("platform", platform)):
+            if val is None:
+                continue
+            if isinstance(val, (list, tuple)):
+                df = df[df[col].isin(val)]
+            else:
+                df = df[df[col] == val]
+        df = self._with_list_columns(df, columns)[on + columns]
+        if keys.empty:
+            return df.iloc[:0].reset_index(drop=True)
+        # Match on plain values (the categories of keys and df differ)
+        df = df.astype(
+            {
+                col: object
+                for col in on
+                if isinstance(df[col].dtype, pd.CategoricalDtype)
+            }
+        )
+        return df.merge(keys.astype({"name": object}), on=on, how="inner")
+
+    def get_dependents(
+        self, name, key=("name", "version", "build"), channels=None, platform=None
+    ):
+        """Get the packages depending on package **name**
+
+        Args:
+          name: Name of the dependency
+          key: Columns to return for each dependent package
+          channels: Channel or list of channels to look at
+          platform: Platform or list of platforms to look at
+
+        Returns:
+          DataFrame with the **key** columns and the ``constraint`` put on
+          **name** (one row per matching dependency entry).
+        """
+        data, _ = self._get_name_index(self._select_repos(channels, platform))
+        rows, constraints = self._get_depends().depending_on(name)
+        df = data.take(rows, [*key, "channel", "platform"])
+        df = df.assign(constraint=constraints)
+        for col, val in (("channel", channels), ("platform", platform)):
+            if val is None:
+                continue
+            if isinstance(val, (list, tuple)):
+                df = df[df[col].isin(val)]
+            else:
+                df = df[df[col] == val]
+        return df[[*key, "constraint"]].reset_index(drop=True)
+
+    def fingerprint(self, channels=None, platforms=None, names=None):
+        """Get a fingerprint of the package files currently available
+
+        Args:
+          channels: Channel or list of channels to look at
+          platforms: Platform or list of platforms to look at
+          names: Package names to look at (all if None)
+
+        Returns:
+          String that changes whenever a package file is added or removed
+        """
+        repos = self._select_repos(channels, platforms)
+        _, hashes = self._snapshot_rows(repos, names)
+        return repodata_cache.fingerprint(hashes)
+
+    def save_snapshot(self, path, channels=None, platforms=None):
+        """Write the repodata currently available to snapshot file **path**
+
+        The snapshot holds the complete data of the selected shards in
+        the columnar cache format, together with its `fingerprint`. It
+        can be used instead of downloading the repodata (see
+        `load_snapshot`) and to find what changed since (see `diff`).
+
+        Args:
+          path: File to write the snapshot to
+          channels: Channel or list of channels to record
+          platforms: Platform or list of platforms to record
+
+        Returns:
+          The `fingerprint` of the snapshot
+        """
+        repos = self._select_repos(channels, platforms)
+        with self._lock:
+            df, hashes = self._snapshot_rows(repos)
+            self._get_depends()
+            lists = {
+                key: values.reorder(df.index.to_numpy())
+                for key, values in self._lists.items()
+            }
+        df = df.reset_index(drop=True)
+        index = NameIndex.from_sorted_codes(
+            df["name"].cat.categories, df["name"].array.codes
+        )
+        meta = {
+            "repos": sorted(repos),
+            "timestamp": self._df_ts.timestamp(),
+            "fingerprint": repodata_cache.fingerprint(hashes),
+        }
+        repodata_cache.write_frame(
+            path,
+            df,
+            lists,
+            meta=meta,
+            arrays={"name_offsets": index.offsets, "row_hashes": hashes},
+        )
+        return meta["fingerprint"]
+
+    def load_snapshot(self, path):
+        """Use the repodata recorded in snapshot file **path**
+
+        From now on, queries are answered from the snapshot only. Nothing
+        is downloaded, the data does not expire, and shards not recorded
+        in the snapshot appear empty.
+
+        Args:
+          path: Snapshot written by `save_snapshot`
+
+        Returns:
+          The `fingerprint` of the snapshot
+        """
+        cached = repodata_cache.read_frame(path)
+        if "fingerprint" not in cached.meta or cached.name_index is None:
+            raise repodata_cache.CacheFormatError(f"{path} is not a repodata snapshot")
+        with self._lock:
+            self._set_data(cached)
+            self._snapshot = path
+        logger.info("Using repodata snapshot %s (%s)", path, cached.meta["fingerprint"])
+        return cached.meta["fingerprint"]
+
+    def diff(self, path):
+        """List package files added or removed since a snapshot
+
+        The current state of the channels and platforms recorded in the
+        snapshot is compared against it.
+
+        Args:
+          path: Snapshot written by `save_snapshot`
+
+        Returns:
+          `RepoDataDelta` of two DataFrames with the
+          ``repodata_cache.SNAPSHOT_COLUMNS``
+        """
+        old = repodata_cache.read_frame(path)
+        df, hashes = self._snapshot_rows([tuple(repo) for repo in old.meta["repos"]])
+        if repodata_cache.fingerprint(hashes) == old.meta["fingerprint"]:
+            added, removed = df.iloc[:0], old.df.iloc[:0]
+        else:
+            added_mask, removed_mask = repodata_cache.diff_rows(
+                old.arrays["row_hashes"], hashes
+            )
+            added, removed = df[added_mask], old.df[removed_mask]
+        columns = repodata_cache.SNAPSHOT_COLUMNS
+        return RepoDataDelta(
+            added[columns].astype(object).reset_index(drop=True),
+            removed[columns].astype(object).reset_index(drop=True),
+        )
+
+    def _snapshot_rows(self, repos, names=None):
+        """Returns the rows of shards **repos** (for packages **names**)
+        and their `repodata_cache.row_hashes`"""
+        data, index = self._get_name_index(repos)
+        if names is None:
+            df = data.df
+        else:
+            df = data.take(
+                index.take(sorted(set(names))),
+                [*repodata_cache.SNAPSHOT_COLUMNS, "platform"],
+            )
+        selected = pd.Series(False, index=df.index)
+        for channel, plat in repos:
+            selected |= (df["channel"] == channel) & (df["platform"] == plat)
+        df = df[selected]
+        return df, repodata_cache.row_hashes(df)
+
+    def get_run_exports(self, name, version, build=None, channels=None, platform=None):
+        """Get the run_exports of a package without downloading it
+
+        The run_exports are taken from the ``run_exports.json`` channels
+        publish for each subdir.
+
+        Args:
+          name: Package name
+          version: Package version
+          build: Build string (any build if None)
+          channels: Channel or list of channels to look at
+          platform: Platform or list of platforms to look at
+
+        Returns:
+          Dictionary mapping the kind of export (``weak``, ``strong``,
+          ...) to a list of specs or None if the package was not found
+        """
+        repos = self._select_repos(channels, platform)
+        index, _ = self._get_run_exports(repos)
+        return index.get(repos, name, version, build)
+
+    def get_channeldata(self, channel, platforms=None):
+        """Get the run_exports of **channel** in ``channeldata.json`` format
+
+        This is what conda-build reads the run_exports of dependencies
+        from if ``config.use_channeldata`` is set (see
+        `run_exports_from_repodata`).
+
+        Args:
+          channel: The channel
+          platforms: Platform or list of platforms to include, in order
+                     of precedence
+
+        Returns:
+          Dictionary with a ``packages`` key or None if the channel does
+          not publish run_exports for all of **platforms**
+        """
+        if isinstance(platforms, str):
+            platforms = [platforms]
+        repos = [
+            (channel, platform)
+            for platform in (platforms or self.platforms)
+            if platform in self.platforms
+        ]
+        if channel not in self.channels or not repos:
+            return None
+        index, available = self._get_run_exports(repos)
+        if not all(available[repo] for repo in repos):
+            return None
+        return index.channeldata(repos)
+
+    def _get_run_exports(self, repos):
+        """Returns the `RunExportsIndex`, making sure **repos** are loaded
+
+        Returns:
+          The index and a dict telling for each loaded (channel,
+          platform) whether the channel publishes run_exports there
+        """
+        with self._lock:
+            if self._run_exports is None:
+                self._run_exports = RunExportsIndex(), {}
+            index, available = self._run_exports
+            fetch, urls = [], []
+            for repo in repos:
+                if repo in available:
+                    continue
+                url = self._make_repodata_url(*repo).rsplit("/", 1)[0]
+                url += "/run_exports.json"
+                if url.startswith("file://") and not os.path.exists(url[7:]):
+                    available[repo] = False
+                    continue
+                fetch.append(repo)
+                urls.append(url)
+
+            def add(response, repo):
+                if response.status != 200:
+                    return repo, False
+                index.add(repo, json.loads(response.content))
+                return repo, True
+
+            if urls:
+                available.update(
+                    AsyncRequests.fetch(
+                        urls,
+                        [f"{c}/{p} run_exports" for c, p in fetch],
+                        add,
+                        fetch,
+                        [{} for _ in urls],
+                    )
+                )
+            return index, available
+
+    def _get_depends(self):
+        """Returns the ``depends`` lists of the loaded rows as `DependsLists`"""
+        depends = self._lists["depends"]
+        if not isinstance(depends, DependsLists):
+            depends = DependsLists.from_flat(depends)
+            self._lists = {**self._lists, "depends": depends}
+        return depends
+
+    def _with_list_columns(self, df, keys):
+        """Adds list columns requested in **keys** to **df**
+
+        The values are only expanded for the rows in **df**. Besides the
+        ``depends`` lists, ``parsed_depends`` provides them as lists of
+        (name, constraint) tuples.
+        """
+        missing = {}
+        for key in keys:
+            if key in df.columns:
+                continue
+            if key in self._lists:
+                values = self._lists[key].take(df.index)
+            elif key == "parsed_depends":
+                depends = self._get_depends()
+                values = [depends.parsed(row) for row in df.index]
+            else:
+                continue
+            missing[key] = pd.Series(values, index=df.index, dtype=object)
+        if missing:
+            df = df.assign(**missing)
+        return df
+
+
+os.register_at_fork(after_in_child=RepoData._after_fork)
+
+
+def _remove_file(path):
+    with contextlib.suppress(OSError):
+        os.unlink(path)
+
 
 def get_github_client() -> Github:
     """Get a Github client with a robust retry policy."""
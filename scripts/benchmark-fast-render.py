@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Measure the throughput of fast_render against conda-build.
+
+Summarizes the packages of all recipes below a recipes folder, once
+with fast_render.render and once with conda-build (utils.load_all_meta
+with finalize=False), measuring:
+
+- fast: fast_render.render, handing recipes it cannot render to
+  conda-build as check_recipe_skippable does
+- conda-build: conda-build for all recipes
+
+Also reports how many recipes the fast path handled and whether its
+results agree with those of conda-build.
+
+Usage:
+    python scripts/benchmark-fast-render.py ../bioconda-recipes/recipes
+    python scripts/benchmark-fast-render.py recipes --platform osx
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+
+from bioconda_utils import fast_render, utils
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(recipe, config):
+    try:
+        metas = utils.load_all_meta(recipe, config, finalize=False)
+    except Exception:  # broken recipes take part in the timing
+        logger.exception("conda-build failed on %s", recipe)
+        return None
+    return [fast_render.PackageSummary.from_meta(meta) for meta in metas]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recipe_folder")
+    parser.add_argument("--platform", default="linux")
+    args = parser.parse_args()
+
+    recipes = sorted(
+        os.path.dirname(path)
+        for path in glob.glob(
+            os.path.join(args.recipe_folder, "**", "meta.yaml"), recursive=True
+        )
+    )
+    if not recipes:
+        parser.error(f"no meta.yaml found below {args.recipe_folder}")
+    print(f"{len(recipes)} recipes")
+    config = utils.load_conda_build_config(platform=args.platform)
+
+    start = time.perf_counter()
+    fast = {}
+    for recipe in recipes:
+        fast[recipe] = fast_render.render(recipe, config)
+        if fast[recipe] is None:
+            summarize(recipe, config)
+    fast_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    slow = {recipe: summarize(recipe, config) for recipe in recipes}
+    slow_time = time.perf_counter() - start
+
+    handled = [recipe for recipe in recipes if fast[recipe] is not None]
+    failed = [recipe for recipe in recipes if slow[recipe] is None]
+    differ = [recipe for recipe in handled if fast[recipe] != slow[recipe]]
+    print(f"{'pass':12} {'total':>8} {'mean':>10}")
+    for name, total in (("fast", fast_time), ("conda-build", slow_time)):
+        print(f"{name:12} {total:7.2f}s {total / len(recipes) * 1e3:8.2f}ms")
+    print(
+        f"fast path handled {len(handled)} recipes "
+        f"({100 * len(handled) / len(recipes):.0f}%), {len(differ)} differ"
+    )
+    print(f"conda-build failed on {len(failed)} recipes")
+    for recipe in differ:
+        print(f"  {recipe}: {fast[recipe]} != {slow[recipe]}")
+
+
+if __name__ == "__main__":
+    main()
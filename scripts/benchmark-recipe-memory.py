@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Measure the memory needed to keep the whole recipes tree loaded.
+
+Loads all recipes below a recipes folder with Recipe.from_file and
+keeps them in a list, as graph.build_from_recipes does, measuring the
+peak RSS of the process:
+
+- full: all recipes keep their parsed meta.yaml, texts and build scripts
+- compact: each recipe is compacted (see Recipe.compact) once loaded
+
+Each mode runs in its own process so that the peaks do not interfere.
+
+Usage:
+    python scripts/benchmark-recipe-memory.py ../bioconda-recipes/recipes
+"""
+
+import argparse
+import glob
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+def load(folder, compact):
+    """Load all recipes, prints the peak RSS in MiB and the time taken"""
+    from bioconda_utils.recipe import Recipe
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    recipes = []
+    for path in glob.glob(os.path.join(folder, "**", "meta.yaml"), recursive=True):
+        recipe = Recipe.from_file(folder, path, return_exceptions=True)
+        if isinstance(recipe, Recipe):
+            # what graph.build_from_recipes needs
+            recipe.package_names, recipe.get_deps()
+            if compact:
+                recipe.compact()
+            recipes.append(recipe)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(len(recipes), (peak - baseline) / 1024, peak / 1024, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recipe_folder")
+    parser.add_argument("--mode", choices=("full", "compact"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    folder = os.path.abspath(args.recipe_folder)
+
+    if args.mode:
+        load(folder, args.mode == "compact")
+        return
+
+    print(f"{'mode':8} {'recipes':>8} {'added':>10} {'peak RSS':>10} {'time':>8}")
+    for mode in ("full", "compact"):
+        out = subprocess.run(
+            [sys.executable, __file__, folder, "--mode", mode],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        count, added, peak, elapsed = int(out[0]), *map(float, out[1:])
+        print(f"{mode:8} {count:8} {added:7.1f}MiB {peak:7.1f}MiB {elapsed:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
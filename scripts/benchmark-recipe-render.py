@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure Recipe.render latency with a cold and a warm template cache.
+
+Reads all meta.yaml files below a recipes folder and renders each of
+them, measuring:
+
+- uncached: rendering with the template cache disabled
+- cold: first rendering, compiling the template into the cache
+- warm: rendering again, taking the template from the cache
+- read-only: like warm, but parsing with the read-only FastLoader
+
+The timings are totals over the tree and means per recipe. Recipes
+failing to render take part in the timing and are counted.
+
+Usage:
+    python scripts/benchmark-recipe-render.py ../bioconda-recipes/recipes
+    python scripts/benchmark-recipe-render.py recipes --repeat 5
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import jinja2
+from ruamel.yaml.error import YAMLError
+
+from bioconda_utils import recipe as _recipe
+from bioconda_utils.recipe import Recipe, RecipeError, TemplateCache
+
+
+def load_texts(folder):
+    texts = {}
+    for path in sorted(
+        glob.glob(os.path.join(folder, "**", "meta.yaml"), recursive=True)
+    ):
+        with open(path, encoding="utf-8") as fdes:
+            texts[os.path.dirname(path)] = fdes.read()
+    return texts
+
+
+def render_all(folder, texts, read_only=False):
+    """Returns the time taken to render all recipes once and the failures"""
+    failed = 0
+    start = time.perf_counter()
+    for recipe_dir, text in texts.items():
+        try:
+            Recipe(recipe_dir, folder, read_only).load_from_string(text)
+        except (RecipeError, jinja2.TemplateError, YAMLError):
+            failed += 1
+    return time.perf_counter() - start, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recipe_folder")
+    parser.add_argument("--repeat", type=int, default=3, help="warm passes")
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.recipe_folder)
+    texts = load_texts(folder)
+    if not texts:
+        parser.error(f"no meta.yaml found below {folder}")
+    print(f"{len(texts)} recipes")
+
+    _recipe.template_cache = TemplateCache(_recipe.template_cache.env, maxsize=0)
+    uncached = render_all(folder, texts)
+    _recipe.template_cache = cache = TemplateCache(
+        _recipe.template_cache.env, maxsize=len(texts)
+    )
+    cold = render_all(folder, texts)
+    warm = min(render_all(folder, texts) for _ in range(args.repeat))
+    read_only = min(render_all(folder, texts, True) for _ in range(args.repeat))
+
+    print(f"{'pass':10} {'total':>8} {'mean':>10} {'failed':>7}")
+    for name, (total, failed) in (
+        ("uncached", uncached),
+        ("cold", cold),
+        ("warm", warm),
+        ("read-only", read_only),
+    ):
+        print(f"{name:10} {total:7.2f}s {total / len(texts) * 1e3:8.2f}ms {failed:7}")
+    print(f"cache: {cache.hits} hits, {cache.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Compare the RepoData engines on a synthetic channel.
+
+Writes a local channel with the given number of packages per subdir
+and runs RepoData with each engine (see RepoData.set_engine) in fresh
+processes, measuring:
+
+- import: time to import bioconda_utils.utils
+- load: time of the first query, parsing the repodata.json files
+- cached: time of the first query in a new process reading the cache
+- query: mean latency of a lookup by name (with a version filter)
+- names: time to list the package names of the channel (as done by
+  autobump's ExcludeOtherChannel)
+- peak_rss: peak resident memory of the process loading from the cache
+
+Usage:
+    python scripts/benchmark-repodata.py
+    python scripts/benchmark-repodata.py --packages 500000 --queries 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SUBDIRS = {"linux": "linux-64", "osx": "osx-64", "noarch": "noarch"}
+ENGINES = ("pandas", "compact")
+
+
+def write_channel(path, packages):
+    rng = random.Random(42)
+    names = [f"pkg-{num}" for num in range(max(packages // 20, 1))]
+    for subdir in SUBDIRS.values():
+        records = {}
+        for num in range(packages):
+            name = rng.choice(names)
+            version = f"{rng.randint(0, 9)}.{rng.randint(0, 20)}"
+            build = f"h{rng.getrandbits(32):08x}_{num % 3}"
+            records[f"{name}-{version}-{build}-{num}.tar.bz2"] = {
+                "name": name,
+                "version": version,
+                "build": build,
+                "build_number": num % 3,
+                "depends": [f"{rng.choice(names)} >={version}", "python"],
+            }
+        os.makedirs(os.path.join(path, subdir), exist_ok=True)
+        with open(os.path.join(path, subdir, "repodata.json"), "w") as fdes:
+            json.dump({"info": {"subdir": subdir}, "packages": records}, fdes)
+    return names
+
+
+def run_child(engine, channel, cache, queries):
+    """Runs in the child process, prints the measurements as JSON"""
+    start = time.perf_counter()
+    from bioconda_utils.utils import RepoData
+
+    result = {"import": time.perf_counter() - start}
+
+    RepoData.register_config({"channels": [f"file://{channel}"]})
+    RepoData.platforms = list(SUBDIRS)
+    repo = RepoData()
+    repo.set_cache(cache)
+    repo.set_engine(engine)
+    start = time.perf_counter()
+    repo.get_package_data("version", name="pkg-0")
+    result["first_query"] = time.perf_counter() - start
+
+    rng = random.Random(1)
+    names = [f"pkg-{rng.randint(0, queries)}" for _ in range(queries)]
+    start = time.perf_counter()
+    for name in names:
+        repo.get_package_data("build", name=name, version="1.0")
+    result["query"] = (time.perf_counter() - start) / len(names)
+
+    start = time.perf_counter()
+    repo.get_package_data("name", channels=repo.channels)
+    result["names"] = time.perf_counter() - start
+    result["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps(result))
+
+
+def measure(engine, channel, cache, queries):
+    cmd = [sys.executable, __file__, "--child", engine, channel, cache]
+    out = subprocess.run(
+        cmd + ["--queries", str(queries)], check=True, capture_output=True, text=True
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=200000, help="per subdir")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, args.queries)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        channel = os.path.join(tmp, "channel")
+        write_channel(channel, args.packages)
+        print(f"{args.packages} packages in each of {len(SUBDIRS)} subdirs")
+        print(
+            f"{'engine':10} {'import':>8} {'load':>8} {'cached':>8} "
+            f"{'query':>10} {'names':>8} {'peak_rss':>10}"
+        )
+        for engine in ENGINES:
+            cache = os.path.join(tmp, f"{engine}.cache")
+            cold = measure(engine, channel, cache, args.queries)
+            warm = measure(engine, channel, cache, args.queries)
+            print(
+                f"{engine:10} {warm['import']:7.2f}s {cold['first_query']:7.2f}s "
+                f"{warm['first_query']:7.3f}s {warm['query'] * 1e6:8.1f}us "
+                f"{warm['names']:7.3f}s {warm['peak_rss'] / 2**20:7.0f}MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
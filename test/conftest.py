@@ -1,6 +1,4 @@
 import datetime
-import os
-import shutil
 from copy import deepcopy
 from pathlib import Path
 
@@ -9,7 +7,10 @@ import pandas as pd
 import pytest
 import py
 
-from bioconda_utils import utils
+from bioconda_utils import repodata_cache, utils
+from bioconda_utils.repodata_cache import FlatStringLists
+
+from helpers import write_case_recipes
 
 yaml = YAML(typ="rt")  # pylint: disable=invalid-name
 
@@ -33,9 +34,12 @@ def pytest_runtest_setup(item):
 
 
 @pytest.fixture
-def mock_repodata(case):
+def mock_repodata(case, tmp_path, monkeypatch):
     """Pepares RepoData singleton to contain mock data
 
+    The data is written to a repodata snapshot file, which RepoData
+    then answers all queries from (see `RepoData.load_snapshot`).
+
     Expects function to be parametrized with ``case``, where ``case`` may
     contain a ``repodata`` key. If none exists, empty repodata is generated.
 
@@ -52,34 +56,55 @@ def mock_repodata(case):
              - version: 0.1
                build_number: 0
     """
+    records = []
     if "repodata" in case:
-        dataframe = pd.DataFrame(
-            (
-                {
-                    "channel": channel,
-                    "name": name,
-                    "build": "",
-                    "build_number": 0,
-                    "version": 0,
-                    "depends": [],
-                    "subdir": "",
-                    "platform": "noarch",
-                    **item,
-                }
-                for channel, packages in case["repodata"].items()
-                for name, versions in packages.items()
-                for item in versions
-            ),
-            columns=utils.RepoData.columns,
-        )
-    else:
-        dataframe = pd.DataFrame(dict(), columns=utils.RepoData.columns)
-
-    backup = utils.RepoData()._df, utils.RepoData()._df_ts
-    utils.RepoData()._df = dataframe
-    utils.RepoData()._df_ts = datetime.datetime.now()
+        records = [
+            {
+                "channel": channel,
+                "name": name,
+                "build": "",
+                "build_number": 0,
+                "version": 0,
+                "depends": [],
+                "subdir": "",
+                "platform": "noarch",
+                **item,
+            }
+            for channel, packages in case["repodata"].items()
+            for name, versions in packages.items()
+            for item in versions
+        ]
+    dataframe = pd.DataFrame(records, columns=utils.RepoData.columns)
+    lists = {"depends": FlatStringLists.from_lists(dataframe.pop("depends"))}
+    for column in dataframe.columns:
+        if column == "build_number":
+            dataframe[column] = dataframe[column].astype(int)
+        else:
+            dataframe[column] = dataframe[column].astype(str).astype("category")
+    dataframe, lists, index = repodata_cache.sort_by_name(dataframe, lists)
+    snapshot = str(tmp_path / "repodata.snapshot")
+    meta = {
+        "repos": sorted({(rec["channel"], rec["platform"]) for rec in records}),
+        "timestamp": datetime.datetime.now().timestamp(),
+        "fingerprint": "mock",
+    }
+    repodata_cache.write_frame(
+        snapshot, dataframe, lists, meta=meta, arrays={"name_offsets": index.offsets}
+    )
+
+    repo = utils.RepoData()
+    for attr in (
+        "_data",
+        "_df_ts",
+        "_lists",
+        "_name_index",
+        "_resident",
+        "_shared",
+        "_snapshot",
+    ):
+        monkeypatch.setattr(repo, attr, getattr(utils.RepoData, attr))
+    repo.load_snapshot(snapshot)
     yield
-    utils.RepoData()._df, utils.RepoData()._df_ts = backup
 
 
 @pytest.fixture
@@ -123,42 +148,4 @@ def config_file(tmpdir: py.path.local, case):
 @pytest.fixture
 def recipe_dirs(recipes_folder: py.path.local, tmpdir: py.path.local, case):
     """Prepares a recipe from recipe_data in recipes_folder"""
-    recipe_dirs = []
-    recipes = case.get("recipes")
-    if not recipes:
-        raise LookupError(
-            "No `recipes:` entry found in this test case's YAML file, and testing nothing is not expected. Check folder lint_cases for the YAML file and include a `recipes:` entry."
-        )
-    for recipe_name in case.get("recipes", []):
-        recipe = deepcopy(case.get("recipes").get(recipe_name))
-        recipe_dir = recipes_folder.mkdir(recipe_name)
-
-        with recipe_dir.join("meta.yaml").open("w") as fdes:
-            yaml.dump(
-                recipe,
-                fdes,
-                transform=lambda string: string.replace("#{%", "{%").replace(
-                    "#{{", "{{"
-                ),
-            )
-
-        if "add_files" in case:
-            for fname, data in case["add_files"].items():
-                with recipe_dir.join(fname).open("w") as fdes:
-                    fdes.write(data)
-
-        if "move_files" in case:
-            for src, dest in case["move_files"].items():
-                src_path = recipe_dir.join(src)
-                if not dest:
-                    if os.path.isdir(src_path):
-                        shutil.rmtree(src_path)
-                    else:
-                        os.remove(src_path)
-                else:
-                    dest_path = recipe_dir.join(dest)
-                    shutil.move(src_path, dest_path)
-
-        recipe_dirs.append(recipe_dir)
-
-    yield recipe_dirs
+    yield write_case_recipes(recipes_folder, case)
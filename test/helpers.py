@@ -1,8 +1,12 @@
+from copy import deepcopy
 from textwrap import dedent
 import tempfile
+import shutil
 import yaml
 import os
 
+from ruamel.yaml import YAML
+
 from conda_index.index import update_index
 
 
@@ -113,3 +117,54 @@ class Recipes:
     @property
     def recipe_dirnames(self):
         return list(self.recipe_dirs.values())
+
+
+def write_case_recipes(recipes_folder, case):
+    """Writes the ``recipes`` of a lint test case to **recipes_folder**
+
+    Args:
+      recipes_folder: ``py.path.local`` of the folder to write to
+      case: Test case as loaded from a YAML file in ``lint_cases``
+
+    Returns:
+      List of the recipe folders written
+    """
+    recipe_dirs = []
+    recipes = case.get("recipes")
+    if not recipes:
+        raise LookupError(
+            "No `recipes:` entry found in this test case's YAML file, and testing nothing is not expected. Check folder lint_cases for the YAML file and include a `recipes:` entry."
+        )
+    for recipe_name in case.get("recipes", []):
+        recipe = deepcopy(case.get("recipes").get(recipe_name))
+        recipe_dir = recipes_folder.mkdir(recipe_name)
+
+        with recipe_dir.join("meta.yaml").open("w") as fdes:
+            YAML(typ="rt").dump(
+                recipe,
+                fdes,
+                transform=lambda string: string.replace("#{%", "{%").replace(
+                    "#{{", "{{"
+                ),
+            )
+
+        if "add_files" in case:
+            for fname, data in case["add_files"].items():
+                with recipe_dir.join(fname).open("w") as fdes:
+                    fdes.write(data)
+
+        if "move_files" in case:
+            for src, dest in case["move_files"].items():
+                src_path = recipe_dir.join(src)
+                if not dest:
+                    if os.path.isdir(src_path):
+                        shutil.rmtree(src_path)
+                    else:
+                        os.remove(src_path)
+                else:
+                    dest_path = recipe_dir.join(dest)
+                    shutil.move(src_path, dest_path)
+
+        recipe_dirs.append(recipe_dir)
+
+    return recipe_dirs
@@ -5,6 +5,7 @@ import glob
 import pytest
 
 from bioconda_utils import lint, utils
+from bioconda_utils.recipe import Recipe, RecipeError
 from bioconda_utils.utils import ensure_list
 
 yaml = YAML(typ="rt")  # pylint: disable=invalid-name
@@ -68,3 +69,15 @@ def test_lint(linter, recipe_dirs, mock_repodata, case):
             assert str(msg.check) not in found_postfix
         for msgstr in found_postfix:
             assert msgstr in found
+
+
+@pytest.mark.parametrize("case", TEST_CASES, ids=TEST_CASE_IDS)
+def test_read_only_parity(recipe_dirs, recipes_folder, case):
+    """Read-only recipes parse like round-trip ones"""
+    for recipe_dir in recipe_dirs:
+        try:
+            recipe = Recipe.from_file(str(recipes_folder), str(recipe_dir))
+        except RecipeError:
+            continue
+        fast = Recipe.from_file(str(recipes_folder), str(recipe_dir), read_only=True)
+        assert fast.meta == recipe.meta
@@ -1,19 +1,27 @@
 import os.path as op
 import os
+import pickle
+from textwrap import dedent
 
 import pytest
 
 from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap
 
 from bioconda_utils.recipe import (
     Recipe,
+    TemplateCache,
     EmptyRecipe,
     MissingMetaYaml,
     RenderFailure,
     DuplicateKey,
+    HasSelector,
     MissingKey,
 )
 
+from bioconda_utils.recipe_cache import RecipeCache
+from bioconda_utils.utils import jinja_silent_undef
+
 yaml = YAML(typ="rt")  # pylint: disable=invalid-name
 
 RECIPE_DATA = """
@@ -117,10 +125,29 @@ def test_save(recipes):
 def test_recipe_set_original(recipes):
     for recipe in recipes:
         assert recipe.meta == recipe.orig.meta
-        recipe.meta["package"]["name"] = "test"
+        recipe.set("package/name", "test")
         assert recipe.meta != recipe.orig.meta
+        assert recipe.is_modified()
         recipe.set_original()
         assert recipe.meta == recipe.orig.meta
+        assert not recipe.is_modified()
+
+
+@with_recipes
+def test_recipe_orig_is_lazy(recipes):
+    for recipe in recipes:
+        recipe.set("build/number", "1")
+        # The original is only rendered when accessed
+        assert recipe._orig is None
+        assert recipe.is_modified()
+        assert recipe._orig is None
+        orig = recipe.orig
+        assert orig.build_number == 0 and recipe.build_number == 1
+        assert orig.meta_yaml != recipe.meta_yaml
+        assert orig.conda_build_config == recipe.conda_build_config
+        # Changes to the original persist until set_original
+        orig.version_data = {"x": 1}
+        assert recipe.orig.version_data == {"x": 1}
 
 
 @with_recipes
@@ -132,6 +159,103 @@ def test_recipe_get_template(recipes):
             recipe.get_template()
 
 
+@with_recipes
+def test_recipe_template_cache(recipes, monkeypatch):
+    cache = TemplateCache(jinja_silent_undef, maxsize=2)
+    monkeypatch.setattr("bioconda_utils.recipe.template_cache", cache)
+    recipe = recipes[0]
+    template = recipe.get_template()
+    assert (cache.hits, cache.misses) == (0, 1)
+    recipe.render()
+    assert recipe.get_template() is template
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Other text, other template
+    recipe.meta_yaml = recipe.meta_yaml + ["# comment"]
+    assert recipe.get_template() is not template
+    assert cache.misses == 2
+    recipe.meta_yaml = recipe.meta_yaml[:-1]
+    assert recipe.get_template() is template
+
+    # Least recently used templates are dropped
+    recipes[1].get_template()
+    cache.get("something else")
+    assert len(cache) == 2
+    assert recipe.get_template() is not template
+
+
+@with_recipes
+def test_recipe_cache(recipes, tmp_path, monkeypatch):
+    cache = RecipeCache(str(tmp_path / "cache"))
+    monkeypatch.setattr("bioconda_utils.recipe.recipe_cache", cache)
+    cache.start_stats()
+    loaded = [Recipe.from_file(recipe.basedir, recipe.dir) for recipe in recipes]
+    assert cache.stats() == (0, len(recipes))
+
+    cached = [Recipe.from_file(recipe.basedir, recipe.dir) for recipe in recipes]
+    assert cache.stats() == (len(recipes), len(recipes))
+    for recipe, other in zip(loaded, cached):
+        assert other.meta == recipe.meta
+        assert other.meta_yaml == recipe.meta_yaml
+        assert other.get_raw_range("build/number") == recipe.get_raw_range(
+            "build/number"
+        )
+        assert not other.is_modified()
+
+    # Changed text misses the cache
+    recipe = cached[0]
+    recipe.set("build/number", "1")
+    recipe.save()
+    assert Recipe.from_file(recipe.basedir, recipe.dir).build_number == 1
+    assert cache.stats() == (len(recipes), len(recipes) + 1)
+
+
+def test_recipe_cache_stats(tmp_path):
+    cache = RecipeCache(str(tmp_path / "cache"))
+    cache.get("recipe", "a/meta.yaml", "text", None)
+    assert cache.stats() == (0, 0)
+    cache.start_stats()
+    cache.set("recipe", "a/meta.yaml", "text", None, {"package": {}})
+    assert cache.get("recipe", "a/meta.yaml", "text", None) == {"package": {}}
+    # Workers given the counters add to them, other users of the cache do not
+    worker, other = RecipeCache(cache.directory), RecipeCache(cache.directory)
+    worker.attach_stats(cache.counters)
+    worker.get("recipe", "a/meta.yaml", "text", None)
+    worker.get("recipe", "b/meta.yaml", "text", None)
+    other.get("recipe", "a/meta.yaml", "text", None)
+    assert cache.stats() == (2, 1)
+    assert other.stats() == (0, 0)
+
+
+@with_recipes
+def test_recipe_compact(recipes, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "bioconda_utils.recipe.recipe_cache", RecipeCache(str(tmp_path / "cache"))
+    )
+    for loaded in recipes:
+        recipe = Recipe.from_file(loaded.basedir, loaded.dir)
+        meta, lines = recipe.meta, recipe.meta_yaml
+        assert recipe.compact()
+        assert recipe._meta is None and recipe._meta_yaml is None
+        assert recipe._build_scripts is None
+        assert len(pickle.dumps(recipe)) < len(pickle.dumps(loaded))
+        # Dropped fields are loaded again when accessed
+        assert recipe.meta == meta
+        assert recipe.meta_yaml == lines
+        assert not recipe.is_modified()
+        assert recipe.orig.meta == meta
+
+        # Modified recipes keep their state
+        recipe = Recipe.from_file(loaded.basedir, loaded.dir)
+        recipe.set("build/number", "1")
+        assert not recipe.compact()
+        assert recipe.build_number == 1
+
+    # No per-instance __dict__
+    with pytest.raises(AttributeError):
+        recipe.undeclared = True
+
+
 @with_recipes
 def test_recipe_get_simple_modules(recipes):
     for recipe in recipes:
@@ -232,6 +356,23 @@ def test_recipe_get_raw_range(recipes):
         )
 
 
+@with_recipes
+def test_recipe_get_raw_range_index(recipes):
+    for recipe in recipes:
+        positions = recipe._index_positions()
+        assert "source/0/url" in positions or "source/url" in positions
+        for path, position in positions.items():
+            nodes, keys = recipe._walk(path)
+            assert recipe._find_raw_range(nodes, keys) == position
+        # Non-canonical paths and edits
+        if "source/url" in positions:
+            assert recipe.get_raw_range("source/0/url") == positions["source/url"]
+        with pytest.raises(KeyError):
+            recipe.get_raw_range("package/nothing")
+        recipe.set("build/number", "100")
+        assert recipe.get_raw("build/number") == "100"
+
+
 @with_recipes
 def test_recipe_get_raw(recipes):
     for recipe in recipes:
@@ -269,6 +410,90 @@ def test_recipe_set(recipes):
         assert recipe.get("package/bla/1/0") == "test4"
 
 
+@with_recipes
+def test_recipe_edit(recipes, monkeypatch):
+    renders = []
+    render = Recipe.render
+    monkeypatch.setattr(Recipe, "render", lambda self: renders.append(render(self)))
+    for recipe in recipes:
+        expected = Recipe.from_file(recipe.basedir, recipe.dir)
+        expected.replace("0.1", "0.2")
+        expected.reset_buildnumber(3)
+        expected.set("about/summary", "changed")
+        expected.render()
+
+        renders.clear()
+        with recipe.edit():
+            recipe.replace("0.1", "0.2")
+            recipe.reset_buildnumber(3)
+            recipe.set("about/summary", "changed")
+            # Not rendered yet
+            assert recipe.version == "0.1"
+        assert len(renders) == 1
+        assert recipe.meta_yaml == expected.meta_yaml
+        assert recipe.meta == expected.meta
+        assert recipe.version == "0.2" and recipe.build_number == 3
+
+
+@with_recipes
+def test_recipe_edit_rollback(recipes):
+    recipe = recipes[1]  # has selectors in source
+    lines, meta = list(recipe.meta_yaml), recipe.meta
+    with pytest.raises(HasSelector), recipe.edit():
+        recipe.reset_buildnumber(5)
+        recipe.replace("https://somewhere", "https://elsewhere")
+    assert recipe.meta_yaml == lines
+    assert recipe.meta is meta
+    # Not batching any more
+    recipe.reset_buildnumber(5)
+    assert recipe.build_number == 5
+
+
+@with_recipes
+def test_recipe_read_only(recipes):
+    for recipe in recipes:
+        fast = Recipe(recipe.dir, recipe.basedir, read_only=True)
+        fast.load_from_string(recipe.dump())
+        assert type(fast.meta) is dict
+        assert fast.meta == recipe.meta
+        # Looking up positions parses again with the round-trip loader
+        assert fast.get_raw_range("build/number") == recipe.get_raw_range(
+            "build/number"
+        )
+        assert isinstance(fast.meta, CommentedMap)
+
+        fast = Recipe(recipe.dir, recipe.basedir, read_only=True)
+        fast.load_from_string(recipe.dump())
+        fast.reset_buildnumber(3)
+        assert fast.build_number == 3
+        assert isinstance(fast.meta, CommentedMap)
+
+
+def test_recipe_read_only_scalars():
+    text = dedent("""
+        package:
+          name: one
+          version: 1.10
+        build:
+          number: 0
+          noarch: false
+          skip: yes
+        about:
+          summary: .5
+        """)
+    recipe = Recipe("recipes/one", "recipes").load_from_string(text)
+    fast = Recipe("recipes/one", "recipes", read_only=True).load_from_string(text)
+    assert fast.meta == recipe.meta
+    assert fast.meta["package"]["version"] == "1.10"
+    assert fast.meta["build"]["skip"] == "yes"
+    assert fast.meta["build"]["noarch"] is False
+
+    # Duplicate keys are left to the round-trip loader
+    text += "build:\n  number: 1\n"
+    with pytest.raises(DuplicateKey):
+        Recipe("recipes/one", "recipes", read_only=True).load_from_string(text)
+
+
 @with_recipes
 def test_recipe_package_names(recipes):
     for recipe in recipes:
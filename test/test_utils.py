@@ -1,28 +1,49 @@
+import asyncio
 import contextlib
+import hashlib
 import importlib
+import json
 import logging
 import os
+import pickle
+import random
 import re
 import shutil
 import subprocess as sp
 import sys
 import tempfile
+import threading
+import types
 import uuid
+from itertools import product
 from pathlib import Path
 from textwrap import dedent
 
+import aiohttp
+import jinja2
+import numpy as np
+import pandas as pd
 import pytest
+import yaml
 from conda_build import exceptions, metadata
-from helpers import Recipes, ensure_missing
+from helpers import Recipes, ensure_missing, write_case_recipes
+from ruamel.yaml import YAML
 
 from bioconda_utils import (
     __version__,
     build,
     docker_utils,
+    fast_render,
+    graph,
     pkg_test,
+    recipe_cache,
+    repodata_cache,
+    repodata_parser,
+    update_pinnings,
     upload,
     utils,
 )
+from bioconda_utils.recipe import Recipe
 from bioconda_utils.utils import validate_config
 
 logger = logging.getLogger(__name__)
@@ -1481,3 +1502,1199 @@ def test_validate_config_smoke():
     }
     # Should not raise
     validate_config(cfg)
+
+
+LOCAL_REPODATA = {
+    "noarch": {
+        "one-0.1-0.tar.bz2": {
+            "name": "one",
+            "version": "0.1",
+            "build": "0",
+            "build_number": 0,
+            "depends": ["python >=3.8", "zlib"],
+        },
+        "two-1.0-pyh_1.tar.bz2": {
+            "name": "two",
+            "version": "1.0",
+            "build": "pyh_1",
+            "build_number": 1,
+            "depends": [],
+        },
+    },
+    "linux-64": {
+        "one-0.1-h123_0.tar.bz2": {
+            "name": "one",
+            "version": "0.1",
+            "build": "h123_0",
+            "build_number": 0,
+            "depends": ["zlib >=1.2.13,<2"],
+        },
+    },
+}
+
+
+@pytest.fixture
+def local_repodata(tmp_path, monkeypatch):
+    """Points RepoData at a local ``file://`` channel with some packages"""
+    channel_dir = tmp_path / "channel"
+    for subdir, packages in LOCAL_REPODATA.items():
+        (channel_dir / subdir).mkdir(parents=True)
+        repodata = {"info": {"subdir": subdir}, "packages": packages}
+        (channel_dir / subdir / "repodata.json").write_text(json.dumps(repodata))
+    monkeypatch.setattr(
+        utils.RepoData, "config", {"channels": [f"file://{channel_dir}"]}
+    )
+    repo = utils.RepoData()
+    for attr in (
+        "_data",
+        "_df_ts",
+        "cache_file",
+        "_lists",
+        "_name_index",
+        "_resident",
+        "_shared",
+        "_run_exports",
+        "_snapshot",
+        "engine",
+    ):
+        monkeypatch.setattr(repo, attr, getattr(utils.RepoData, attr))
+    yield repo
+
+
+def test_repodata_columnar_cache(local_repodata, tmp_path):
+    cache = tmp_path / "repodata.cache"
+    local_repodata.set_cache(str(cache))
+    assert sorted(local_repodata.get_package_data("subdir", name="one")) == [
+        "linux-64",
+        "noarch",
+    ]
+    assert cache.exists()
+
+    # A fresh load comes from the memory-mapped cache
+    local_repodata._data = None
+    cached = repodata_cache.read_frame(str(cache))
+    assert len(cached.df) == 3
+    assert "depends" not in cached.df.columns
+    assert local_repodata.get_package_data(name="one")
+    # Opening the cache file and querying decodes only what was asked for
+    names = local_repodata._data.columns["name"].categories
+    assert isinstance(names, repodata_cache.StringTable)
+    assert names._strings is None
+    assert list(local_repodata.get_package_data("depends", name="one", build="0")) == [
+        ["python >=3.8", "zlib"]
+    ]
+    builds = local_repodata.get_package_data(
+        ["build", "depends"], name="one", platform="linux"
+    )
+    assert [tuple(b) for b in builds] == [("h123_0", ["zlib >=1.2.13,<2"])]
+    assert local_repodata.get_package_data(name="two", version="1.0")
+    assert not local_repodata.get_package_data(name="three")
+
+
+def test_repodata_cache_rejects_other_format(tmp_path):
+    path = tmp_path / "repodata.pickle"
+    path.write_bytes(b"not a columnar cache")
+    with pytest.raises(repodata_cache.CacheFormatError):
+        repodata_cache.read_frame(str(path))
+
+
+def test_repodata_name_index(local_repodata):
+    data, index = local_repodata._get_name_index()
+    assert list(data.df["name"]) == ["one", "one", "two"]
+    assert list(data.take(index.get("two"))["build"]) == ["pyh_1"]
+    assert index.get("one") == slice(0, 2)
+    assert index.get("two") == slice(2, 3)
+    assert index.get("three") == slice(0, 0)
+    assert list(index.take(["two", "three", "one"])) == [2, 0, 1]
+    build_numbers = local_repodata.get_package_data("build_number", name="two")
+    assert build_numbers.dtype.kind == "i"
+    assert list(build_numbers) == [1]
+    assert sorted(
+        local_repodata.get_package_data("build", name=["one", "two"], platform="noarch")
+    ) == ["0", "pyh_1"]
+    versions = local_repodata.get_versions("one")
+    assert {ver: set(platforms) for ver, platforms in versions.items()} == {
+        "0.1": {"linux", "noarch"}
+    }
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["memory", "cache_file"])
+def test_repodata_engines(local_repodata, tmp_path, cached):
+    if cached:
+        local_repodata.set_cache(str(tmp_path / "repodata.cache"))
+        local_repodata.load()
+        local_repodata._data = None
+    queries = [
+        ({"key": "build", "name": "one"}, sorted),
+        ({"key": "build_number", "name": "two"}, list),
+        ({"key": "name", "channels": local_repodata.channels}, sorted),
+        ({"key": ["build", "depends"], "name": "one", "platform": "linux"}, list),
+        ({"key": "parsed_depends", "name": "one", "build": "0"}, list),
+        ({"key": "version", "name": ["two", "one"], "platform": ["noarch"]}, sorted),
+        ({"key": "build", "name": "one", "build_number": 0, "version": 0.1}, sorted),
+        ({"name": "one", "platform": "osx"}, bool),
+        ({"name": "one", "channels": "conda-forge"}, bool),
+        ({"name": "two"}, bool),
+        ({"name": "three"}, bool),
+    ]
+    results = {}
+    for engine in ("compact", "pandas"):
+        local_repodata.set_engine(engine)
+        results[engine] = [
+            convert(local_repodata.get_package_data(**query))
+            for query, convert in queries
+        ]
+        versions = local_repodata.get_versions("one")
+        results[engine].append({ver: sorted(plat) for ver, plat in versions.items()})
+        if cached and engine == "compact":
+            # Nothing beyond the values queried was decoded
+            assert local_repodata._data._df is None
+            assert local_repodata._data.columns["build"].categories._strings is None
+    assert results["compact"] == results["pandas"]
+    assert results["compact"][:3] == [["0", "h123_0"], [1], ["one", "one", "two"]]
+    assert [tuple(row) for row in results["compact"][3]] == [
+        ("h123_0", ["zlib >=1.2.13,<2"])
+    ]
+    assert results["compact"][-5:] == [
+        False,
+        False,
+        True,
+        False,
+        {"0.1": ["linux", "noarch"]},
+    ]
+    with pytest.raises(ValueError):
+        local_repodata.set_engine("polars")
+
+
+def test_apply_json_patch():
+    doc = {"packages": {"a": {"depends": ["x"]}}, "removed": ["b"]}
+    doc = repodata_cache.apply_json_patch(
+        doc,
+        [
+            {"op": "add", "path": "/packages/a~1b", "value": {"depends": []}},
+            {"op": "add", "path": "/packages/a/depends/-", "value": "y"},
+            {"op": "remove", "path": "/removed/0"},
+            {"op": "copy", "from": "/packages/a", "path": "/packages/c"},
+            {"op": "replace", "path": "/packages/c/depends/0", "value": "z"},
+            {"op": "move", "from": "/packages/a~1b", "path": "/packages/d"},
+            {"op": "test", "path": "/packages/a/depends/0", "value": "x"},
+        ],
+    )
+    assert doc == {
+        "packages": {
+            "a": {"depends": ["x", "y"]},
+            "c": {"depends": ["z", "y"]},
+            "d": {"depends": []},
+        },
+        "removed": [],
+    }
+    with pytest.raises(ValueError):
+        repodata_cache.apply_json_patch(doc, [{"op": "remove", "path": "/missing"}])
+
+
+def make_jlap(patches, latest):
+    """Creates jlap feed content with valid checksums"""
+    iv = bytes(32)
+    lines = [iv.hex().encode()]
+    key = iv
+    for obj in [*patches, {"url": "repodata.json", "latest": latest}]:
+        line = json.dumps(obj).encode()
+        key = hashlib.blake2b(line, key=key, digest_size=32).digest()
+        lines.append(line)
+    lines.append(key.hex().encode())
+    return b"\n".join(lines) + b"\n"
+
+
+def test_jlap_feed():
+    patches = [
+        {"from": "a", "to": "b", "patch": []},
+        {"from": "b", "to": "c", "patch": []},
+    ]
+    data = make_jlap(patches, "c")
+    feed = repodata_cache.JlapFeed.parse(data)
+    assert feed.latest == "c"
+    assert [p["to"] for p in feed.patch_chain("a")] == ["b", "c"]
+    assert [p["to"] for p in feed.patch_chain("b")] == ["c"]
+    assert feed.patch_chain("c") == []
+    assert feed.patch_chain("x") is None
+
+    # Range request continuing from the footer of the first feed
+    more = make_jlap([*patches, {"from": "c", "to": "d", "patch": []}], "d")
+    tail = repodata_cache.JlapFeed.parse(more[feed.pos :], feed.pos, feed.iv)
+    assert [p["to"] for p in tail.patch_chain("c")] == ["d"]
+
+    with pytest.raises(repodata_cache.CacheFormatError):
+        repodata_cache.JlapFeed.parse(data.replace(b'"b"', b'"x"'))
+
+
+class FakeChannel:
+    """Serves repodata (and optionally jlap feeds) to `AsyncRequests.fetch`"""
+
+    def __init__(self):
+        self.files = {}
+        self.errors = {}
+        self.requests = []
+
+    def fetch(self, urls, descs, cb, datas, headers=None, fds=None, retry=True):
+        results = []
+        fds = fds or [None] * len(urls)
+        for url, data, header, fd in zip(urls, datas, headers, fds):
+            self.requests.append((url.rsplit("/", 2)[-2:], dict(header)))
+            if url in self.errors:
+                response = utils.FetchResponse(self.errors[url], {}, b"error page")
+            elif url not in self.files:
+                response = utils.FetchResponse(404, {}, b"")
+            else:
+                content = self.files[url]
+                etag = hashlib.md5(content).hexdigest()
+                if header.get("If-None-Match") == etag:
+                    response = utils.FetchResponse(304, {}, b"")
+                elif "Range" in header:
+                    start = int(header["Range"][6:-1])
+                    response = utils.FetchResponse(206, {}, content[start:])
+                else:
+                    response = utils.FetchResponse(200, {"ETag": etag}, content)
+            if fd is not None and response.status == 200:
+                fd.write(response.content)
+                response = response._replace(content=b"")
+            results.append(cb(response, data))
+        return results
+
+
+@pytest.fixture
+def remote_repodata(tmp_path, monkeypatch):
+    """Points RepoData at a fake remote channel with a shard cache"""
+    channel = FakeChannel()
+    for platform in ("linux", "noarch"):
+        subdir = utils.RepoData.platform2subdir(platform)
+        repodata = {"info": {"subdir": subdir}, "packages": LOCAL_REPODATA[subdir]}
+        url = utils.RepoData.REPODATA_URL.format(channel="chan", subdir=subdir)
+        channel.files[url] = json.dumps(repodata).encode()
+    monkeypatch.setattr(utils.AsyncRequests, "fetch", channel.fetch)
+    monkeypatch.setattr(utils.RepoData, "config", {"channels": ["chan"]})
+    monkeypatch.setattr(utils.RepoData, "platforms", ["linux", "noarch"])
+    monkeypatch.setattr(utils.RepoData, "shard_cache_dir", str(tmp_path / "shards"))
+    monkeypatch.setattr(utils.RepoData, "shard_reuse_timeout", 0)
+    repo = utils.RepoData()
+    for attr in (
+        "_data",
+        "_df_ts",
+        "cache_file",
+        "_lists",
+        "_name_index",
+        "_resident",
+        "_shared",
+        "_run_exports",
+        "_snapshot",
+    ):
+        monkeypatch.setattr(repo, attr, getattr(utils.RepoData, attr))
+    yield repo, channel
+
+
+def test_repodata_conditional_refresh(remote_repodata):
+    repo, channel = remote_repodata
+    df, lists = repo._load_channel_dataframe()
+    assert sorted(df["build"]) == ["0", "h123_0", "pyh_1"]
+    # No cache yet: no jlap, no validators
+    assert [header for _, header in channel.requests] == [{}, {}]
+
+    channel.requests.clear()
+    df, lists = repo._load_channel_dataframe()
+    assert sorted(df["build"]) == ["0", "h123_0", "pyh_1"]
+    assert sorted(lists["depends"].take(range(3)))[-1] == ["zlib >=1.2.13,<2"]
+    # jlap was looked for and not found, then conditional requests
+    jlap_requests = [req for req in channel.requests if req[0][1].endswith(".jlap")]
+    assert len(jlap_requests) == 2
+    assert all("If-None-Match" in header for _, header in channel.requests[2:])
+
+    # Missing jlap feeds are not requested again for a while
+    channel.requests.clear()
+    repo._load_channel_dataframe()
+    assert len(channel.requests) == 2
+
+
+def test_repodata_jlap_refresh(remote_repodata):
+    repo, channel = remote_repodata
+    repo._load_channel_dataframe()
+    url = utils.RepoData.REPODATA_URL.format(channel="chan", subdir="noarch")
+    old_hash = repodata_cache.hash_bytes(channel.files[url])
+    patch = {
+        "from": old_hash,
+        "to": "new",
+        "patch": [
+            {
+                "op": "add",
+                "path": "/packages/three-2.0-0.tar.bz2",
+                "value": {
+                    "name": "three",
+                    "version": "2.0",
+                    "build": "0",
+                    "build_number": 0,
+                    "depends": ["one"],
+                },
+            }
+        ],
+    }
+    jlap_url = url.removesuffix(".json") + ".jlap"
+    channel.files[jlap_url] = make_jlap([patch], "new")
+
+    channel.requests.clear()
+    df, lists = repo._load_channel_dataframe()
+    assert sorted(df["name"]) == ["one", "one", "three", "two"]
+    row = list(df["name"]).index("three")
+    assert lists["depends"][row] == ["one"]
+    # The patched subdir was not downloaded again
+    assert ["noarch", "repodata.json"] not in [req[0] for req in channel.requests]
+
+    # The next refresh only asks for new lines of the feed
+    channel.requests.clear()
+    df, _ = repo._load_channel_dataframe()
+    assert len(df) == 4
+    ranges = [header["Range"] for _, header in channel.requests if "Range" in header]
+    assert ranges == [f"bytes={channel.files[jlap_url].rindex(b'{')}-"]
+
+
+def test_repodata_jlap_errors(remote_repodata):
+    repo, channel = remote_repodata
+    repo._load_channel_dataframe()
+    for subdir, status in (("noarch", 403), ("linux-64", 503)):
+        url = utils.RepoData.REPODATA_URL.format(channel="chan", subdir=subdir)
+        channel.errors[url.removesuffix(".json") + ".jlap"] = status
+
+    # Failing feeds fall back to conditional requests
+    channel.requests.clear()
+    df, _ = repo._load_channel_dataframe()
+    assert sorted(df["build"]) == ["0", "h123_0", "pyh_1"]
+    assert sum("If-None-Match" in header for _, header in channel.requests) == 2
+
+    # Only the feed failing with a server error is tried again right away
+    channel.requests.clear()
+    repo._load_channel_dataframe()
+    jlap_requests = [req[0] for req in channel.requests if req[0][1].endswith(".jlap")]
+    assert jlap_requests == [["linux-64", "repodata.jlap"]]
+
+
+def test_repodata_shard_reuse(remote_repodata, monkeypatch):
+    repo, channel = remote_repodata
+    repo._load_channel_dataframe()
+    monkeypatch.setattr(utils.RepoData, "shard_reuse_timeout", 60)
+
+    # Another process just refreshed the shards: they are used as they are
+    channel.requests.clear()
+    df, _ = repo._load_channel_dataframe()
+    assert sorted(df["build"]) == ["0", "h123_0", "pyh_1"]
+    assert channel.requests == []
+
+
+def test_file_lock(tmp_path):
+    path = str(tmp_path / "lock")
+    events = []
+
+    def wait_for_lock():
+        with repodata_cache.file_lock(path):
+            events.append("acquired")
+
+    with repodata_cache.file_lock(path):
+        thread = threading.Thread(target=wait_for_lock)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        events.append("released")
+    thread.join()
+    assert events == ["released", "acquired"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_repodata_parser_chunks(chunk_size):
+    repodata = {
+        "info": {"subdir": "noarch"},
+        "signatures": {"x": [1, {"y": "}"}]},
+        "packages": {
+            "a-1-0.tar.bz2": {
+                "name": "a",
+                "version": 1,
+                "build": "0",
+                "build_number": 12345,
+                "depends": ["b ≥2"],
+            },
+        },
+        "removed": ["q"],
+        "packages.conda": {
+            "b-2-1.conda": {"name": "b", "version": "2", "build": "1", "depends": []},
+        },
+        "repodata_version": 1,
+    }
+    data = json.dumps(repodata, indent=1, ensure_ascii=False).encode()
+    parser = repodata_parser.RepodataParser()
+    for pos in range(0, len(data), chunk_size):
+        parser.write(data[pos : pos + chunk_size])
+    parser.finish()
+    assert parser.info == {"subdir": "noarch"}
+    assert parser.hash == repodata_cache.hash_bytes(data)
+    df, lists = parser.to_frame()
+    assert list(df["name"]) == ["a", "b"]
+    assert list(df["version"]) == ["1", "2"]
+    assert list(df["build_number"]) == [12345, 0]
+    assert lists["depends"].take(range(2)) == [["b ≥2"], []]
+
+    parser = repodata_parser.RepodataParser()
+    parser.write(data[:-5])
+    with pytest.raises(ValueError):
+        parser.finish()
+
+
+def test_fetch_retry_restarts_parser(tmp_path, monkeypatch):
+    repodata = {"info": {"subdir": "noarch"}, "packages": LOCAL_REPODATA["noarch"]}
+    data = json.dumps(repodata).encode()
+    attempts = []
+
+    class Content:
+        def __init__(self, broken):
+            self.blocks = [data[:40], data[40:]]
+            self.broken = broken
+
+        async def read(self, size):
+            if self.broken and len(self.blocks) == 1:
+                raise aiohttp.ClientPayloadError("Response payload is not completed")
+            return self.blocks.pop(0) if self.blocks else b""
+
+    class Response:
+        status = 200
+
+        def __init__(self, broken):
+            self.headers = {"Content-Length": str(len(data))}
+            self.content = Content(broken)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    class Session:
+        def get(self, url, timeout=None, headers=None):
+            attempts.append(url)
+            # The first download breaks off after the first block
+            return Response(broken=len(attempts) == 1)
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    raw_path = tmp_path / "repodata.json"
+    with open(raw_path, "wb") as raw:
+        parser = repodata_parser.RepodataParser(raw)
+        response = asyncio.run(
+            utils.AsyncRequests._async_fetch_one(
+                Session(), "https://x/noarch/repodata.json", "x", fd=parser, headers={}
+            )
+        )
+    assert len(attempts) == 2
+    assert response.status == 200
+    # The retry started over instead of appending to the partial data
+    parser.finish()
+    assert len(parser) == len(LOCAL_REPODATA["noarch"])
+    assert parser.hash == repodata_cache.hash_bytes(data)
+    assert raw_path.read_bytes() == data
+
+
+def test_repodata_lazy_shards(local_repodata, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        utils.RepoData, "native_platform", staticmethod(lambda: "linux")
+    )
+    channel = local_repodata.channels[0]
+    cache = tmp_path / "repodata.cache"
+    local_repodata.set_cache(str(cache))
+    assert local_repodata.resident == frozenset()
+
+    builds = local_repodata.get_package_data("build", name="one", native=True)
+    assert sorted(builds) == ["0", "h123_0"]
+    assert local_repodata.resident == {(channel, "linux"), (channel, "noarch")}
+
+    # Queries for resident shards do not load anything else
+    assert list(local_repodata.get_package_data("build", platform="noarch", name="two"))
+    assert local_repodata.resident == {(channel, "linux"), (channel, "noarch")}
+    assert not local_repodata.get_package_data(channels="other", name="one")
+
+    # The cache file records its shards and is extended as needed
+    local_repodata._data = None
+    assert list(local_repodata.get_package_data("build", platform="linux")) == [
+        "h123_0"
+    ]
+    assert local_repodata.resident == {(channel, "linux"), (channel, "noarch")}
+    local_repodata.get_versions("one")
+    assert local_repodata.resident == set(product([channel], utils.RepoData.platforms))
+    cached = repodata_cache.read_frame(str(cache))
+    assert len(cached.meta["repos"]) == len(utils.RepoData.platforms)
+    assert len(cached.df) == 3
+
+
+def test_repodata_get_package_data_many(local_repodata):
+    found = local_repodata.get_package_data_many(
+        [("one", "0.1", 0), ("two", "1.0", 0), ("two", "1.0", 1), ("three", "1", 0)],
+        ["subdir", "depends"],
+    )
+    assert list(found.columns) == [
+        "name",
+        "version",
+        "build_number",
+        "subdir",
+        "depends",
+    ]
+    assert sorted(found.itertuples(index=False, name=None)) == [
+        ("one", "0.1", 0, "linux-64", ["zlib >=1.2.13,<2"]),
+        ("one", "0.1", 0, "noarch", ["python >=3.8", "zlib"]),
+        ("two", "1.0", 1, "noarch", []),
+    ]
+    found = local_repodata.get_package_data_many(
+        [("one",), ("two",)], "build", on=("name",), platform="noarch"
+    )
+    assert sorted(found["build"]) == ["0", "pyh_1"]
+    assert local_repodata.get_package_data_many([], "build").empty
+    with pytest.raises(ValueError):
+        local_repodata.get_package_data_many([("0.1",)], on=("version",))
+
+
+def test_repodata_parsed_depends(local_repodata):
+    deps = local_repodata.get_package_data(
+        "parsed_depends", name="one", platform="noarch"
+    )
+    assert list(deps) == [[("python", ">=3.8"), ("zlib", "")]]
+    assert isinstance(local_repodata._lists["depends"], repodata_cache.DependsLists)
+    # The spec strings are reassembled unchanged
+    assert list(local_repodata.get_package_data("depends", name="one", build="0")) == [
+        ["python >=3.8", "zlib"]
+    ]
+
+    dependents = local_repodata.get_dependents("zlib", ["build", "platform"])
+    assert sorted(dependents.itertuples(index=False, name=None)) == [
+        ("0", "noarch", ""),
+        ("h123_0", "linux", ">=1.2.13,<2"),
+    ]
+    assert local_repodata.get_dependents("zlib", platform="linux")[
+        "constraint"
+    ].tolist() == [">=1.2.13,<2"]
+    assert local_repodata.get_dependents("perl").empty
+
+
+@pytest.mark.parametrize("strings", [["a", "bb", "cé", "d"], ["z", "", "a", "y"]])
+def test_string_table(strings, tmp_path):
+    table = repodata_cache.StringTable.from_strings(strings)
+    assert table.is_sorted == (strings == sorted(strings))
+    assert list(table) == strings
+    for code, string in enumerate(strings):
+        assert table.find(string) == code
+    assert table.find("x") is None
+
+    columns = {"s": repodata_cache.CategoryColumn(np.arange(4, dtype=np.int32), table)}
+    repodata_cache.write_columns(str(tmp_path / "f"), 4, columns)
+    loaded = repodata_cache.read_columns(str(tmp_path / "f")).columns["s"].categories
+    assert isinstance(loaded, repodata_cache.StringTable)
+    assert [loaded[code] for code in range(4)] == strings
+    assert loaded._strings is None
+    assert loaded.find(strings[2]) == 2
+    cached = repodata_cache.read_frame(str(tmp_path / "f"))
+    assert list(cached.take(np.array([3, 1]))["s"]) == [strings[3], strings[1]]
+    assert list(cached.df["s"]) == strings
+
+
+def test_depends_lists_roundtrip(tmp_path):
+    flat = repodata_cache.FlatStringLists.from_lists(
+        [["a >=1", "b"], [], ["a <2 *_x", "b"]]
+    )
+    depends = repodata_cache.DependsLists.from_flat(flat)
+    assert depends.names == ["a", "b"]
+    assert depends.take(range(3)) == flat.take(range(3))
+    assert depends.reorder(np.array([2, 1, 0])).take(range(3)) == [
+        ["a <2 *_x", "b"],
+        [],
+        ["a >=1", "b"],
+    ]
+    rows, constraints = depends.depending_on("a")
+    assert list(rows) == [0, 2]
+    assert constraints == [">=1", "<2 *_x"]
+
+    df = pd.DataFrame({"x": [1, 2, 3]})
+    repodata_cache.write_frame(str(tmp_path / "f"), df, {"depends": depends})
+    loaded = repodata_cache.read_frame(str(tmp_path / "f")).lists["depends"]
+    assert isinstance(loaded, repodata_cache.DependsLists)
+    assert loaded.parsed(2) == [("a", "<2 *_x"), ("b", "")]
+
+
+def test_repodata_prefetch(local_repodata):
+    channel = local_repodata.channels[0]
+    future = local_repodata.prefetch(platforms=["noarch"])
+    # Queries wait for the running load
+    assert list(local_repodata.get_package_data("build", name="two")) == ["pyh_1"]
+    future.result()
+    assert (channel, "noarch") in local_repodata.resident
+
+
+def test_repodata_share_attach(local_repodata, monkeypatch):
+    assert local_repodata.share() is None
+    local_repodata.load()
+    handle = local_repodata.share()
+    assert os.path.exists(handle.path)
+    # The parent switches to the shared file, sharing again is free
+    assert local_repodata.share() is handle
+    resident = local_repodata.resident
+
+    # A worker attaching to the handle does not load anything itself
+    monkeypatch.setattr(local_repodata, "_data", None)
+    monkeypatch.setattr(
+        local_repodata, "_load_channel_dataframe", pytest.fail, raising=False
+    )
+    utils.RepoData.attach(handle)
+    assert local_repodata.resident == resident
+    assert sorted(local_repodata.get_package_data("build", name="one")) == [
+        "0",
+        "h123_0",
+    ]
+    assert local_repodata.get_package_data("depends", name="two")[0] == []
+
+
+def test_repodata_share_while_loading(local_repodata):
+    local_repodata.load()
+    locked, release = threading.Event(), threading.Event()
+
+    def load():
+        with local_repodata._lock:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=load)
+    thread.start()
+    locked.wait()
+    try:
+        # Workers load for themselves instead of waiting for the load
+        assert local_repodata.share() is None
+    finally:
+        release.set()
+        thread.join()
+    assert local_repodata.share() is not None
+
+
+def test_repodata_run_exports(local_repodata, monkeypatch):
+    channel = local_repodata.channels[0]
+    channel_dir = channel[len("file://") :]
+    run_exports = {
+        "info": {"subdir": "linux-64"},
+        "packages": {
+            "one-0.1-h123_0.tar.bz2": {"run_exports": {"weak": ["one >=0.1,<0.2.0a0"]}},
+        },
+    }
+    with open(os.path.join(channel_dir, "linux-64", "run_exports.json"), "w") as fd:
+        json.dump(run_exports, fd)
+
+    assert local_repodata.get_run_exports("one", "0.1", platform="linux") == {
+        "weak": ["one >=0.1,<0.2.0a0"]
+    }
+    assert local_repodata.get_run_exports("one", "0.1", build="0") is None
+    assert local_repodata.get_channeldata(channel, ["linux"]) == {
+        "packages": {"one": {"run_exports": {"0.1": {"weak": ["one >=0.1,<0.2.0a0"]}}}}
+    }
+    # noarch publishes no run_exports.json, so conda-build has to download
+    assert local_repodata.get_channeldata(channel, ["linux", "noarch"]) is None
+
+    class Config:
+        host_subdir = build_subdir = "linux-64"
+        use_channeldata = False
+
+    config = Config()
+    orig = utils.conda_build_utils.download_channeldata
+    monkeypatch.setattr(utils.RepoData, "platforms", ["linux"])
+    with utils.run_exports_from_repodata(config):
+        assert config.use_channeldata
+        channeldata = utils.conda_build_utils.download_channeldata(channel)
+        assert channeldata["packages"]["one"]["run_exports"]["0.1"]
+        assert utils.conda_build_utils.download_channeldata("other") == {}
+    assert not config.use_channeldata
+    assert utils.conda_build_utils.download_channeldata is orig
+
+
+def test_run_exports_channeldata():
+    index = repodata_parser.RunExportsIndex()
+    weak = {"weak": ["one >=0.1,<0.2.0a0"]}
+    index.add(
+        ("chan", "linux"),
+        {
+            "packages": {
+                "one-0.1-h1_0.tar.bz2": {"run_exports": weak},
+                "one-0.2-h1_0.tar.bz2": {"run_exports": weak},
+                "one-0.2-h2_0.tar.bz2": {"run_exports": {}},
+            },
+            "packages.conda": {"two-1.0-0.conda": {}},
+        },
+    )
+    packages = index.channeldata([("chan", "linux")])["packages"]
+    assert packages.get("one", {})["run_exports"].get("0.1", {}) == weak
+    assert packages.get("two", {})["run_exports"].get("1.0", {}) == {}
+    # conda-build downloads builds differing in their run_exports ...
+    assert packages.get("one", {})["run_exports"].get("0.2", {}) is None
+    # ... and packages or versions not in the index
+    assert packages.get("one", {})["run_exports"].get("0.3", {}) is None
+    assert packages.get("three", {})["run_exports"].get("1.0", {}) is None
+
+
+def test_repodata_snapshot_diff(local_repodata, tmp_path):
+    channel = local_repodata.channels[0]
+    channel_dir = channel[len("file://") :]
+    snapshot = str(tmp_path / "snapshot")
+    fingerprint = local_repodata.save_snapshot(snapshot, platforms=["linux", "noarch"])
+    assert fingerprint == local_repodata.fingerprint(platforms=["linux", "noarch"])
+    delta = local_repodata.diff(snapshot)
+    assert delta.added.empty and delta.removed.empty
+    linux_fingerprint = local_repodata.fingerprint(platforms="linux")
+
+    # Replace a noarch package with a new build
+    packages = dict(LOCAL_REPODATA["noarch"])
+    del packages["two-1.0-pyh_1.tar.bz2"]
+    packages["two-1.0-pyh_2.tar.bz2"] = {
+        "name": "two",
+        "version": "1.0",
+        "build": "pyh_2",
+        "build_number": 2,
+    }
+    repodata = {"info": {"subdir": "noarch"}, "packages": packages}
+    with open(os.path.join(channel_dir, "noarch", "repodata.json"), "w") as fd:
+        json.dump(repodata, fd)
+    local_repodata._data = None
+
+    assert local_repodata.fingerprint(platforms=["linux", "noarch"]) != fingerprint
+    # Other platforms keep their fingerprint
+    assert local_repodata.fingerprint(platforms="linux") == linux_fingerprint
+    delta = local_repodata.diff(snapshot)
+    key = ["subdir", "name", "version", "build"]
+    assert delta.added[key].values.tolist() == [["noarch", "two", "1.0", "pyh_2"]]
+    assert delta.removed[key].values.tolist() == [["noarch", "two", "1.0", "pyh_1"]]
+    assert list(delta.added["channel"]) == [channel]
+
+
+def test_repodata_load_snapshot(local_repodata, tmp_path, monkeypatch):
+    snapshot = str(tmp_path / "snapshot")
+    fingerprint = local_repodata.save_snapshot(snapshot, platforms=["linux", "noarch"])
+
+    monkeypatch.setattr(local_repodata, "_data", None)
+    monkeypatch.setattr(
+        local_repodata, "_load_channel_dataframe", pytest.fail, raising=False
+    )
+    assert local_repodata.load_snapshot(snapshot) == fingerprint
+    assert sorted(local_repodata.get_package_data("build", name="one")) == [
+        "0",
+        "h123_0",
+    ]
+    assert local_repodata.get_package_data("depends", name="one", build="0")[0] == [
+        "python >=3.8",
+        "zlib",
+    ]
+    # Shards not in the snapshot are empty, even once the data is old
+    assert not local_repodata.get_package_data(name="one", platform="osx")
+    monkeypatch.setattr(local_repodata, "cache_timeout", -1)
+    assert local_repodata.get_package_data(name="two")
+    assert local_repodata.fingerprint(platforms=["linux", "noarch"]) == fingerprint
+
+    # Workers attaching to the shared data stay on the snapshot
+    handle = local_repodata.share()
+    monkeypatch.setattr(local_repodata, "_snapshot", None)
+    monkeypatch.setattr(local_repodata, "_data", None)
+    utils.RepoData.attach(handle)
+    assert local_repodata._snapshot == snapshot
+
+
+def test_repodata_current_repodata(local_repodata):
+    channel = local_repodata.channels[0]
+    channel_dir = channel[len("file://") :]
+    current = {
+        "info": {"subdir": "noarch"},
+        "packages": {
+            name: record
+            for name, record in LOCAL_REPODATA["noarch"].items()
+            if record["name"] == "two"
+        },
+    }
+    with open(os.path.join(channel_dir, "noarch", "current_repodata.json"), "w") as fd:
+        json.dump(current, fd)
+
+    # Presence queries are served from the current repodata
+    assert list(
+        local_repodata.get_package_data("name", platform="noarch", latest=True)
+    ) == ["two"]
+    assert local_repodata.resident_current == {(channel, "noarch")}
+    assert local_repodata.resident == frozenset()
+
+    # Without current_repodata.json, the full repodata is loaded
+    assert local_repodata.get_package_data(name="one", platform="linux", latest=True)
+    assert local_repodata.resident == {(channel, "linux")}
+
+    # Queries needing history upgrade the shard
+    assert local_repodata.get_package_data(
+        name="one", platform="noarch", build_number=0, latest=True
+    )
+    assert local_repodata.resident == {(channel, "linux"), (channel, "noarch")}
+    assert local_repodata.resident_current == frozenset()
+    assert sorted(local_repodata.get_package_data("build", name=["one", "two"])) == [
+        "0",
+        "h123_0",
+        "pyh_1",
+    ]
+
+
+def test_repodata_current_repodata_cache(local_repodata, tmp_path, monkeypatch):
+    channel = local_repodata.channels[0]
+    channel_dir = channel[len("file://") :]
+    current = {
+        "info": {"subdir": "noarch"},
+        "packages": {
+            name: record
+            for name, record in LOCAL_REPODATA["noarch"].items()
+            if record["name"] == "two"
+        },
+    }
+    with open(os.path.join(channel_dir, "noarch", "current_repodata.json"), "w") as fd:
+        json.dump(current, fd)
+    local_repodata.set_cache(str(tmp_path / "repodata.cache"))
+    assert list(
+        local_repodata.get_package_data("name", platform="noarch", latest=True)
+    ) == ["two"]
+
+    # Another process reading the cache file replaces the shard loaded from
+    # current_repodata.json with the full repodata
+    monkeypatch.setattr(local_repodata, "_data", None)
+    assert local_repodata.resident_current == frozenset()
+    assert list(local_repodata.get_package_data("build", name="two")) == ["pyh_1"]
+    assert sorted(local_repodata.get_package_data("build", name=["one", "two"])) == [
+        "0",
+        "h123_0",
+        "pyh_1",
+    ]
+    assert local_repodata.resident_current == frozenset()
+
+
+class FakeMeta:
+    """Stands in for a rendered conda-build MetaData"""
+
+    def __init__(self, recipe, python):
+        self.recipe = recipe
+        self.config = types.SimpleNamespace(variant={"python": python, "zlib": "1.3"})
+
+    def name(self):
+        return self.recipe.name
+
+    def version(self):
+        return self.recipe.version
+
+    def build_number(self):
+        return self.recipe.build_number
+
+    def build_id(self):
+        return f"py{self.config.variant['python'].replace('.', '')}h1_0"
+
+    def skip(self):
+        return False
+
+    def get_value(self, key):
+        return None
+
+    def get_used_vars(self):
+        return {"python"}
+
+
+def test_render_variants_cache(local_repodata, tmp_path, monkeypatch):
+    cache = recipe_cache.RecipeCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(update_pinnings, "recipe_cache", cache)
+    monkeypatch.setattr(
+        update_pinnings, "_get_build_variants", lambda meta: meta.get_used_vars()
+    )
+    renders = []
+
+    def conda_render(recipe, config):
+        renders.append(recipe.dump())
+        return [(FakeMeta(recipe, python), None, None) for python in ("3.10", "3.11")]
+
+    monkeypatch.setattr(Recipe, "conda_render", conda_render)
+    folder = tmp_path / "recipes"
+    (folder / "three").mkdir(parents=True)
+    (folder / "three" / "meta.yaml").write_text(
+        "package:\n  name: three\n  version: 1.0\nbuild:\n  number: 0\n"
+        "requirements:\n  run:\n    - one\n"
+    )
+    pinning = tmp_path / "conda_build_config.yaml"
+    pinning.write_text("python:\n  - 3.10\n")
+    config = types.SimpleNamespace(
+        exclusive_config_files=[str(pinning)],
+        variant_config_files=[],
+        subdir="linux-64",
+    )
+    recipe = Recipe.from_file(str(folder), str(folder / "three"))
+
+    variants = update_pinnings.render_variants(recipe, config)
+    assert [variant.build_id for variant in variants] == ["py310h1_0", "py311h1_0"]
+    # Only the repodata of the subdir rendered for is looked at
+    channel = local_repodata.channels[0]
+    assert local_repodata.resident == {(channel, "linux"), (channel, "noarch")}
+    assert variants[0].variant == {"python": "3.10"}
+    assert update_pinnings.render_variants(recipe, config) == variants
+    assert len(renders) == 1
+
+    # Changed pinnings, recipe or repodata of dependencies render again
+    pinning.write_text("python:\n  - 3.12\n")
+    update_pinnings.render_variants(recipe, config)
+    assert len(renders) == 2
+    recipe.reset_buildnumber(1)
+    assert update_pinnings.render_variants(recipe, config)[0].build_number == 1
+    assert len(renders) == 3
+    channel_dir = channel[len("file://") :]
+    repodata = {"info": {"subdir": "linux-64"}, "packages": {}}
+    with open(os.path.join(channel_dir, "linux-64", "repodata.json"), "w") as fd:
+        json.dump(repodata, fd)
+    local_repodata._data = None
+    update_pinnings.render_variants(recipe, config)
+    assert len(renders) == 4
+    monkeypatch.setattr(update_pinnings.conda_build, "__version__", "0.0.1")
+    update_pinnings.render_variants(recipe, config)
+    assert len(renders) == 5
+
+
+def test_fast_render():
+    r = Recipes(
+        """
+        plain:
+          meta.yaml: |
+            {% set version = "1.10" %}
+            package:
+              name: plain
+              version: {{ version }}
+            build:
+              number: 2
+              skip: true  # [osx]
+        skipped:
+          meta.yaml: |
+            package:
+              name: skipped
+              version: "0.1"
+            build:
+              skip: true  # [linux]
+        selected:
+          meta.yaml: |
+            {% set number = 3 %}
+            package:
+              name: selected
+              version: "0.1"
+            build:
+              number: {{ number }}  # [linux]
+              number: {{ number + 1 }}  # [osx]
+        set_selector:
+          meta.yaml: |
+            {% set version = "0.2" %}  # [osx]
+            {% set version = "0.1" %}  # [not osx]
+            package:
+              name: set_selector
+              version: {{ version }}
+        pure:
+          meta.yaml: |
+            package:
+              name: pure
+              version: "0.1"
+            build:
+              noarch: python
+              script: {{ PYTHON }} -m pip install .
+            requirements:
+              host:
+                - python
+        python:
+          meta.yaml: |
+            package:
+              name: python-using
+              version: "0.1"
+            requirements:
+              host:
+                - python
+        compiler:
+          meta.yaml: |
+            package:
+              name: compiler
+              version: "0.1"
+            requirements:
+              build:
+                - {{ compiler('c') }}
+        outputs:
+          meta.yaml: |
+            package:
+              name: outputs
+              version: "0.1"
+            outputs:
+              - name: outputs-lib
+        """,
+        from_string=True,
+    )
+    r.write_recipes()
+    config = utils.load_conda_build_config(platform="linux")
+    summaries = {
+        name: fast_render.render(recipe, config)
+        for name, recipe in r.recipe_dirs.items()
+    }
+    assert summaries["plain"] == [
+        fast_render.PackageSummary("plain", "1.10", 2, config.host_subdir)
+    ]
+    assert summaries["skipped"] == []
+    assert summaries["selected"] == [
+        fast_render.PackageSummary("selected", "0.1", 3, config.host_subdir)
+    ]
+    assert summaries["pure"] == [
+        fast_render.PackageSummary("pure", "0.1", 0, "noarch", "python")
+    ]
+    # conda-build is needed for the others
+    assert summaries["python"] is None
+    assert summaries["compiler"] is None
+    assert summaries["outputs"] is None
+    assert summaries["set_selector"] is None
+
+    for name in ("plain", "skipped", "selected", "pure"):
+        metas = utils.load_all_meta(r.recipe_dirs[name], config, finalize=False)
+        assert summaries[name] == [
+            fast_render.PackageSummary.from_meta(meta) for meta in metas
+        ]
+
+
+def _load_lint_cases():
+    yaml = YAML(typ="rt")
+    cases = {}
+    for path in sorted(Path(__file__).parent.glob("lint_cases/*.yaml")):
+        with open(path) as data:
+            cases[path.stem] = yaml.load(data)
+    return cases
+
+
+LINT_CASES = _load_lint_cases()
+
+#: Errors conda-build raises rendering a broken recipe
+CONDA_RENDER_ERRORS = (
+    exceptions.CondaBuildException,
+    jinja2.TemplateError,
+    yaml.YAMLError,
+    RuntimeError,
+    SystemExit,
+)
+
+
+def test_fast_render_parity(tmpdir):
+    """The fast path agrees with conda-build on the recipes it accepts"""
+    config = utils.load_conda_build_config(platform="linux")
+    compared = 0
+    for name, case in LINT_CASES.items():
+        for recipe in write_case_recipes(tmpdir.mkdir(name), case):
+            summaries = fast_render.render(str(recipe), config)
+            try:
+                metas = utils.load_all_meta(str(recipe), config, finalize=False)
+            except CONDA_RENDER_ERRORS:
+                # broken recipes are for the linter to find, the fast path
+                # must hand them to conda-build
+                assert summaries is None, recipe
+                continue
+            if summaries is None:
+                continue
+            assert summaries == [
+                fast_render.PackageSummary.from_meta(meta) for meta in metas
+            ], recipe
+            compared += 1
+    assert compared
+
+
+def _write_recipe(folder, name, deps=(), package=None):
+    recipe = folder / name
+    recipe.mkdir(parents=True, exist_ok=True)
+    reqs = "".join(f"    - {dep} >=1\n" for dep in deps)
+    (recipe / "meta.yaml").write_text(
+        f"package:\n  name: {package or name}\n  version: 0.1\n"
+        + (f"requirements:\n  host:\n{reqs}" if deps else "")
+    )
+    return str(recipe)
+
+
+def _dag_state(dag, name2recipe):
+    return set(dag.nodes), set(dag.edges), {k: v for k, v in name2recipe.items()}
+
+
+@pytest.mark.parametrize("restrict", [True, False])
+def test_dag_cache(tmp_path, monkeypatch, restrict):
+    folder = tmp_path / "recipes"
+    cache_file = str(tmp_path / "dag.pkl")
+    loaded = []
+    load_meta_fast = utils.load_meta_fast
+
+    def counting_load(recipe, env=None):
+        loaded.append(recipe)
+        return load_meta_fast(recipe, env)
+
+    monkeypatch.setattr(utils, "load_meta_fast", counting_load)
+    _write_recipe(folder, "one", ["zlib"])
+    _write_recipe(folder, "two", ["one"])
+    _write_recipe(folder, "three", ["one", "two"])
+    _write_recipe(folder, "four", ["three", "zlib"])
+
+    def check():
+        recipes = list(utils.get_recipes(str(folder)))
+        cached = graph.build(recipes, {}, restrict=restrict, cache_file=cache_file)
+        full = graph.build(recipes, {}, restrict=restrict, cache_file=None)
+        assert _dag_state(*cached) == _dag_state(*full)
+        return len(recipes)
+
+    check()
+    loaded.clear()
+    num = check()
+    assert len(loaded) == num  # only the uncached build loaded the recipes
+
+    # Changed, added, removed and renamed recipes are loaded again
+    for edit, changed in (
+        (lambda: _write_recipe(folder, "two", ["zlib"]), 1),
+        (lambda: _write_recipe(folder, "zlib", []), 1),
+        (lambda: _write_recipe(folder, "three", ["two"], package="tres"), 1),
+        (lambda: shutil.rmtree(folder / "one"), 0),
+        (lambda: _write_recipe(folder, "four", ["tres", "one"]), 1),
+        (lambda: shutil.rmtree(folder / "zlib"), 0),
+    ):
+        edit()
+        loaded.clear()
+        num = check()
+        assert len(loaded) == num + changed
+
+    # A cache written with another configuration is not used
+    loaded.clear()
+    recipes = list(utils.get_recipes(str(folder)))
+    graph.build(recipes, {"channels": ["other"]}, cache_file=cache_file)
+    assert len(loaded) == len(recipes)
+
+    # An unreadable cache file is ignored
+    for content in (b"garbage", pickle.dumps((1, 2))):
+        with open(cache_file, "wb") as fdes:
+            fdes.write(content)
+        loaded.clear()
+        graph.build(recipes, {}, cache_file=cache_file)
+        assert len(loaded) == len(recipes)
+
+
+@pytest.mark.parametrize("restrict", [True, False])
+def test_patch_dag(restrict):
+    rng = random.Random(42)
+    names = [f"pkg{i}" for i in range(12)]
+
+    def summary():
+        deps = rng.sample(names + ["external"], rng.randint(0, 3))
+        return graph.RecipeSummary(str(rng.random()), rng.choice(names), tuple(deps))
+
+    skipped = frozenset({"recipe1", "recipe2"})
+    old = {f"recipe{i}": summary() for i in range(15)}
+    dag, name2recipe = graph.build_dag(old, skipped, restrict)
+    for _ in range(100):
+        new = dict(old)
+        for _ in range(rng.randint(1, 3)):
+            recipe = f"recipe{rng.randrange(20)}"
+            if recipe in new and rng.random() < 0.3:
+                del new[recipe]
+            else:
+                new[recipe] = summary()
+        graph.patch_dag(dag, name2recipe, old, new, skipped, restrict)
+        assert _dag_state(dag, name2recipe) == _dag_state(
+            *graph.build_dag(new, skipped, restrict)
+        )
+        old = new